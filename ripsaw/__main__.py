@@ -0,0 +1,21 @@
+""" The command line interface, i.e. python -m ripsaw bench --help"""
+
+import sys
+
+from ripsaw import bench
+
+COMMANDS = {'bench': bench.main}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print("usage: ripsaw {" + ",".join(COMMANDS) + "} ...")
+        return 2
+
+    COMMANDS[argv[0]](argv[1:])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
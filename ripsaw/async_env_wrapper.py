@@ -0,0 +1,114 @@
+"""
+The asyncio environment wrapper.
+
+Evaluations are driven from a single event loop rather than a worker process each. Target programs are launched with
+asyncio.create_subprocess_exec and awaited together, while the blocking file preparation and scoring steps are handed
+to a small thread pool. Many hundreds of concurrent evaluations then cost little more than their child processes.
+"""
+
+import asyncio
+import functools
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from ripsaw.local_env_wrapper import LocalEnvWrapper
+from ripsaw.util.usage import ProcessUsage
+
+
+class AsyncEnvWrapper(LocalEnvWrapper):
+    async def execute_async(self, execution_dict):
+        """
+        Open up a series of programs via their executable URL, awaiting each in turn without blocking the loop.
+        The event loop reaps the children itself, so only their wall time and exit code are kept in usages. Stages
+        are restored from and stored in their caches as execute does, in the loop's default executor, and children
+        are started with what the launcher reserves for them, i.e. pinned to a CorePlacement's slot.
+        :param execution_dict:  a dictionary of 'files'(see unit tests)
+        :return: a list of the programs' exit codes.
+        """
+        loop = asyncio.get_running_loop()
+        exit_codes = list()
+        for file in execution_dict['files']:
+            key, restored = await loop.run_in_executor(None, self.restore_stage, file)
+            if restored:
+                exit_codes.append(0)
+                continue
+
+            cwd = os.path.join(os.getcwd(), self.folder, file['cwd'])
+            url = os.path.join(os.getcwd(), self.folder, file['URL'])
+            argv = self.launcher.argv(url, as_admin=file['as_admin'] is True)
+            token, env, preexec_fn = self.launcher.reserve()
+            start = time.perf_counter()
+            try:
+                if file['suppress_output']:
+                    process = await asyncio.create_subprocess_exec(*argv, cwd=cwd, env=env, preexec_fn=preexec_fn,
+                                                                   stdin=subprocess.DEVNULL,
+                                                                   stdout=subprocess.DEVNULL)
+                else:
+                    process = await asyncio.create_subprocess_exec(*argv, cwd=cwd, env=env, preexec_fn=preexec_fn)
+                self.launcher.started(process.pid)
+                try:
+                    exit_codes.append(await process.wait())
+                finally:
+                    self.launcher.finished(process.pid)
+            finally:
+                self.launcher.unreserve(token)
+            self.usages.append(ProcessUsage(wall_time=time.perf_counter() - start, exit_code=exit_codes[-1]))
+            await loop.run_in_executor(None, self.store_stage, file, key, exit_codes[-1])
+
+        return exit_codes
+
+
+class AsyncEvaluator:
+    def __init__(self, max_concurrency=256, file_workers=None, cleaner=None):
+        """
+        An evaluator running many chromosomes' target programs concurrently from one event loop. Supply it to the
+        optimiser as its evaluator.
+        :param max_concurrency: the most evaluations to have in progress at once.
+        :param file_workers: the number of threads for preparing, scoring and removing workspaces, or None for the
+        ThreadPoolExecutor default.
+        :param cleaner: a WorkspaceCleaner to hand finished workspaces to, or None to remove them in the thread pool.
+        """
+        self.max_concurrency = max_concurrency
+        self.file_workers = file_workers
+        self.cleaner = cleaner
+
+    async def evaluate_chromosome(self, chromosome, semaphore, executor):
+        """ Evaluate one set up chromosome, as Chromosome.evaluate would, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+
+        async with semaphore:
+            wrapper = await loop.run_in_executor(executor, functools.partial(
+                AsyncEnvWrapper, chromosome.target_dir, launcher=chromosome.evaluation_setup.launcher))
+            failed = True
+            try:
+                await loop.run_in_executor(executor, wrapper.set_input_files, chromosome.genotype_dict)
+                exit_codes = await wrapper.execute_async(execution_dict=chromosome.execute_dict)
+
+                chromosome.usage = wrapper.usage()
+                objectives = await loop.run_in_executor(executor, wrapper.get_output_objectives,
+                                                        chromosome.output_dict)
+                user_output_log = await loop.run_in_executor(executor, wrapper.get_log_row, chromosome.log_dict)
+                chromosome.set_result(fitness=sum(objectives), user_output_log=user_output_log, objectives=objectives)
+                failed = any(exit_codes)
+            finally:
+                if self.cleaner is not None:
+                    wrapper.delete_files = False
+                    self.cleaner.submit(wrapper.folder, failed=failed)
+                else:
+                    await loop.run_in_executor(executor, wrapper.close)
+
+    async def evaluate_population_async(self, chromosomes):
+        """ Evaluate every chromosome which doesn't have a fitness, for callers already inside an event loop."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.file_workers) as executor:
+            await asyncio.gather(*[self.evaluate_chromosome(chromosome, semaphore, executor)
+                                   for chromosome in chromosomes if chromosome.fitness is None])
+
+        return chromosomes
+
+    def evaluate_population(self, chromosomes):
+        """ Evaluate every chromosome which doesn't have a fitness."""
+        return asyncio.run(self.evaluate_population_async(chromosomes))
@@ -0,0 +1,173 @@
+"""
+Throughput calibration of a target program.
+
+Random chromosomes are evaluated against the target at increasing concurrency levels, with each workspace strategy,
+to find the evaluations per second and latencies the machine achieves, where adding workers stops helping and so
+which configuration to run the optimiser with. Run it from the command line with:
+    python -m ripsaw bench --help
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+import numpy as np
+
+from ripsaw.genetics.genotype import Chromosome, EvaluationSetup
+from ripsaw.util.cleanup import WorkspaceCleaner, release_workspace
+from ripsaw.util.scheduler import ResourceScheduler
+
+WORKSPACE_STRATEGIES = ('sync', 'deferred')
+
+
+def import_function(path):
+    """ Import a function from a 'module:function' path, i.e. 'my_model.scoring:get_score'."""
+    module_name, _, function_name = path.partition(':')
+    function = importlib.import_module(module_name)
+    for name in function_name.split('.'):
+        function = getattr(function, name)
+
+    return function
+
+
+def default_levels(max_level=None):
+    """ Powers of two up to the number of cores, and the number of cores itself."""
+    max_level = max_level or os.cpu_count() or 1
+    levels = [2 ** i for i in range(max_level.bit_length()) if 2 ** i <= max_level]
+    if levels[-1] != max_level:
+        levels.append(max_level)
+
+    return levels
+
+
+class TimedTask:
+    def __init__(self, chromosome, cleaner):
+        """ A chromosome evaluation which records its own latency."""
+        self.chromosome = chromosome
+        self.cleaner = cleaner
+        self.latency = None
+
+    def evaluate(self):
+        start = time.perf_counter()
+        try:
+            self.chromosome.evaluate()
+        finally:
+            release_workspace(self.chromosome, self.cleaner)
+            self.latency = time.perf_counter() - start
+
+
+def measure(evaluation_setup, chromosome_function, concurrency, num_evaluations, strategy):
+    """
+    Evaluate random chromosomes at a fixed concurrency with one workspace strategy.
+    :return: a dictionary of the concurrency, strategy, evaluations per second and latency percentiles in seconds.
+    """
+    cleaner = WorkspaceCleaner() if strategy == 'deferred' else None
+    evaluation_setup.defer_cleanup = cleaner is not None
+    scheduler = ResourceScheduler(total_cores=concurrency, min_concurrency=concurrency, max_concurrency=concurrency)
+
+    tasks = list()
+    for _ in range(num_evaluations):
+        chromosome = Chromosome(chromosome_function=chromosome_function)
+        chromosome.use_setup(evaluation_setup, {"epoch_num": 0})
+        tasks.append(TimedTask(chromosome, cleaner))
+
+    start = time.perf_counter()
+    scheduler.run(tasks)
+    elapsed = time.perf_counter() - start
+    if cleaner is not None:
+        cleaner.close()
+
+    latencies = np.asarray([task.latency for task in tasks])
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+
+    return {'concurrency': concurrency, 'strategy': strategy, 'throughput': num_evaluations / elapsed,
+            'p50': p50, 'p90': p90, 'p99': p99}
+
+
+def find_knee(results, min_gain=0.1):
+    """
+    Find the concurrency after which adding workers stops helping.
+    :param results: the results of one strategy, in increasing order of concurrency.
+    :param min_gain: the fractional increase in throughput a higher level must give to be worth it.
+    :return: the result at the knee.
+    """
+    knee = results[0]
+    for result in results[1:]:
+        if result['throughput'] < knee['throughput'] * (1 + min_gain):
+            break
+        knee = result
+
+    return knee
+
+
+def recommend(results, min_gain=0.1):
+    """ Recommend the workspace strategy and concurrency, as the knee with the highest throughput of any strategy."""
+    knees = [find_knee([result for result in results if result['strategy'] == strategy], min_gain)
+             for strategy in WORKSPACE_STRATEGIES if any(result['strategy'] == strategy for result in results)]
+
+    return max(knees, key=lambda knee: knee['throughput'])
+
+
+def sweep(evaluation_setup, chromosome_function, levels, num_evaluations, strategies=WORKSPACE_STRATEGIES,
+          report=print):
+    """ Measure every combination of concurrency level and workspace strategy, reporting each as it finishes."""
+    results = list()
+    for strategy in strategies:
+        for concurrency in levels:
+            result = measure(evaluation_setup, chromosome_function, concurrency, num_evaluations, strategy)
+            report(format_result(result))
+            results.append(result)
+
+    return results
+
+
+def format_result(result):
+    return "{strategy:>9} {concurrency:>11} {throughput:>10.2f} {p50:>9.3f} {p90:>9.3f} {p99:>9.3f}".format(**result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ripsaw bench", description="Calibrate evaluation throughput of a target.")
+    parser.add_argument('--target-dir', required=True, help="the template directory which is cloned per evaluation")
+    parser.add_argument('--exe', required=True, help="the executable's path within the template directory")
+    parser.add_argument('--cwd', required=True, help="the executable's working directory within the template")
+    parser.add_argument('--input-file', required=True, help="the input file's path within the template directory")
+    parser.add_argument('--region', required=True, help="the region identifier line in the input file")
+    parser.add_argument('--output-file', required=True, help="the output file's path within the template directory")
+    parser.add_argument('--score-func', required=True, help="the scoring function, as module:function")
+    parser.add_argument('--chromosome-func', required=True, help="the chromosome function, as module:function")
+    parser.add_argument('--log-func', default=None, help="the logging function, as module:function")
+    parser.add_argument('--levels', type=int, nargs='+', default=None, help="the concurrency levels to try")
+    parser.add_argument('--evaluations', type=int, default=20, help="the evaluations to run at each level")
+    parser.add_argument('--strategies', nargs='+', default=list(WORKSPACE_STRATEGIES), choices=WORKSPACE_STRATEGIES,
+                        help="the workspace strategies to try")
+    parser.add_argument('--min-gain', type=float, default=0.1,
+                        help="the fractional throughput gain which makes another level of concurrency worthwhile")
+    args = parser.parse_args(argv)
+
+    # The ripsaw console script, unlike python -m, doesn't put the working directory on the path for the functions.
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    region = args.region if args.region.endswith("\n") else args.region + "\n"
+    log_func = import_function(args.log_func) if args.log_func else (lambda url: list())
+    evaluation_setup = EvaluationSetup(args.cwd, args.exe, os.path.abspath(args.target_dir),
+                                       args.input_file, region,
+                                       import_function(args.score_func), args.output_file,
+                                       log_func, args.output_file,
+                                       {"epoch_num": 0})
+
+    print("{:>9} {:>11} {:>10} {:>9} {:>9} {:>9}".format("strategy", "concurrency", "evals/s", "p50 s", "p90 s",
+                                                         "p99 s"))
+    results = sweep(evaluation_setup, import_function(args.chromosome_func), args.levels or default_levels(),
+                    args.evaluations, args.strategies)
+
+    best = recommend(results, args.min_gain)
+    print("\nRecommended configuration:")
+    print("\tWorkspace strategy:", best['strategy'], "(supply a WorkspaceCleaner)" if best['strategy'] == 'deferred'
+          else "(the default)")
+    print("\tConcurrency:", best['concurrency'],
+          "(the optimiser's pool_size, or the total_cores of a ResourceScheduler supplied as its scheduler)")
+    print("\tExpected throughput: {:.2f} evaluations/s".format(best['throughput']))
+
+    return results
@@ -0,0 +1,170 @@
+"""
+A binary, columnar archive of a run's evaluations, for analysis after the run.
+
+The csv log is text with a column per gene's string, integer and float value, so a large one is slow to load and has
+to be parsed back into numbers. A RunArchive supplied as the optimiser's archive records the same rows - one per
+chromosome per epoch - as typed columns: the epoch and creation epoch, the uuid, the fitness, the objectives, the genes'
+float values and the resource usage of the evaluation. Rows are buffered and written in segments, a directory per
+segment holding a .npy file per column, and the index, index.json, is replaced after each segment is written so a
+reader never sees one half written.
+
+An ArchiveReader memory maps every segment, so opening an archive of any size is immediate and only the pages a
+column's analysis touches are read. It can also warm start a FitnessCache from the results of earlier runs.
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+from ripsaw.util.usage import ProcessUsage
+
+INDEX_FILE = 'index.json'
+UUID_DTYPE = 'S64'
+
+
+def gene_values(chromosome):
+    """ Get the float values of a chromosome's genes, or NaN for every gene if any has no float value."""
+    try:
+        return [float(gene) for gene in chromosome.full_genotype]
+    except (TypeError, ValueError):
+        return [math.nan] * len(chromosome.full_genotype)
+
+
+def usage_values(usage):
+    """ Get the fields of a ProcessUsage as floats, NaN where unknown."""
+    return [math.nan if usage is None or getattr(usage, field) is None else float(getattr(usage, field))
+            for field in ProcessUsage.FIELDS]
+
+
+def read_index(directory):
+    with open(os.path.join(directory, INDEX_FILE), 'r') as in_fs:
+        return json.load(in_fs)
+
+
+class RunArchive:
+    def __init__(self, directory, segment_size=65536):
+        """
+        A writer of evaluation records to an archive directory, which is created if needed. An existing archive is
+        appended to, so a resumed run keeps one archive.
+        :param segment_size: the number of rows buffered in memory and written together as a segment.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(os.path.join(directory, INDEX_FILE)):
+            self.index = read_index(directory)
+        else:
+            self.index = {'version': 1, 'columns': None, 'segments': []}
+        self.rows = list()
+
+    def __len__(self):
+        return sum(segment['rows'] for segment in self.index['segments']) + len(self.rows)
+
+    def append(self, epoch_num, chromosome):
+        """ Buffer the record of an evaluated chromosome, writing a segment once the buffer is full."""
+        self.rows.append((epoch_num, chromosome.creation_epoch_number or 0, chromosome.uuid, chromosome.fitness,
+                          list(chromosome.objectives), gene_values(chromosome), usage_values(chromosome.usage)))
+        if len(self.rows) >= self.segment_size:
+            self.flush()
+
+    def append_population(self, epoch_num, chromosomes):
+        for chromosome in chromosomes:
+            self.append(epoch_num, chromosome)
+
+    def columns(self):
+        """ Build the buffered rows into a dictionary of column arrays."""
+        epochs, creation_epochs, uuids, fitnesses, objectives, genes, usages = zip(*self.rows)
+        columns = {'epoch': np.asarray(epochs, dtype=np.int32),
+                   'creation_epoch': np.asarray(creation_epochs, dtype=np.int32),
+                   'uuid': np.asarray(uuids, dtype=UUID_DTYPE),
+                   'fitness': np.asarray(fitnesses, dtype=float)}
+        for name, values in (('objectives', objectives), ('genes', genes)):
+            if len(set(len(row) for row in values)) != 1:
+                raise ValueError("Every record of an archive must have the same number of " + name + ".")
+            columns[name] = np.asarray(values, dtype=float).reshape(len(values), -1)
+        columns.update(zip(ProcessUsage.FIELDS, np.asarray(usages, dtype=float).T))
+
+        return columns
+
+    def flush(self):
+        """ Write the buffered rows as a segment, then the index which makes it visible to readers."""
+        if not self.rows:
+            return
+
+        columns = self.columns()
+        layout = {name: {'dtype': array.dtype.str, 'shape': list(array.shape[1:])} for name, array in columns.items()}
+        if self.index['columns'] is None:
+            self.index['columns'] = layout
+        elif self.index['columns'] != layout:
+            raise ValueError("These records' columns don't match the archive's: " + str(layout))
+
+        name = 'segment_' + str(len(self.index['segments'])).zfill(6)
+        os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+        for column, array in columns.items():
+            np.save(os.path.join(self.directory, name, column + '.npy'), array)
+
+        self.index['segments'].append({'name': name, 'rows': len(self.rows)})
+        temporary = os.path.join(self.directory, INDEX_FILE + '.tmp')
+        with open(temporary, 'w') as out_fs:
+            json.dump(self.index, out_fs)
+        os.replace(temporary, os.path.join(self.directory, INDEX_FILE))
+        self.rows = list()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ArchiveReader:
+    def __init__(self, directory, mmap=True):
+        """
+        A reader of a run archive, as far as its index had been written when opened.
+        :param mmap: whether to memory map the segments rather than read them into memory.
+        """
+        self.directory = directory
+        self.index = read_index(directory)
+        self.columns = list(self.index['columns'] or ())
+        self.segments = [{column: np.load(os.path.join(directory, segment['name'], column + '.npy'),
+                                          mmap_mode='r' if mmap else None)
+                          for column in self.columns}
+                         for segment in self.index['segments']]
+
+    def __len__(self):
+        return sum(segment['rows'] for segment in self.index['segments'])
+
+    def column(self, name):
+        """ Get a whole column: the memory mapped array itself if there is one segment, else a concatenated copy."""
+        if name not in self.columns:
+            raise KeyError(name)
+        if len(self.segments) == 1:
+            return self.segments[0][name]
+        layout = self.index['columns'][name]
+        if not self.segments:
+            return np.empty([0] + layout['shape'], dtype=layout['dtype'])
+
+        return np.concatenate([segment[name] for segment in self.segments])
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def results(self):
+        """ Iterate over the (uuid, (fitness, objectives, user_output_log)) of every record, as a FitnessCache keeps."""
+        for segment in self.segments:
+            for uuid, fitness, objectives in zip(segment['uuid'], segment['fitness'], segment['objectives']):
+                yield uuid.decode(), (float(fitness), objectives.tolist(), list())
+
+    def warm_start(self, cache):
+        """
+        Store the results of every record in a FitnessCache, so genotypes evaluated by earlier runs aren't evaluated
+        again. Their user logs aren't archived, so are empty.
+        :return: the number of records stored.
+        """
+        return cache.preload(self.results())
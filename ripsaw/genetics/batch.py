@@ -0,0 +1,91 @@
+"""
+Batched evaluation of chromosomes.
+
+For target programs which can read many parameter sets from one input and write one result per set, a batch renders
+several chromosomes into a single workspace so the program's start up cost is paid once for all of them.
+"""
+
+from ripsaw.local_env_wrapper import LocalEnvWrapper
+
+
+def concatenate_region_func(chromosomes):
+    """ The default batch renderer, writing each chromosome's string value one after another into the region."""
+    return "".join(str(chromosome) for chromosome in chromosomes)
+
+
+def empty_log_func(url, batch_size):
+    """ The default batch log function, for when no per-chromosome log is wanted."""
+    return [list() for _ in range(batch_size)]
+
+
+def make_batches(chromosomes, batch_size, region_func, score_func, log_func):
+    """ Split a list of set up chromosomes into batches of (at most) batch_size."""
+    return [ChromosomeBatch(chromosomes=chromosomes[i:i + batch_size], region_func=region_func,
+                            score_func=score_func, log_func=log_func)
+            for i in range(0, len(chromosomes), batch_size)]
+
+
+class ChromosomeBatch:
+    def __init__(self, chromosomes, score_func, region_func=concatenate_region_func, log_func=empty_log_func):
+        """
+        A group of chromosomes which are evaluated by a single execution of the target program.
+        Every chromosome must have been set up (see Chromosome.setup) against the same target.
+        :param chromosomes:
+        A list of chromosomes to evaluate together.
+        :param score_func:
+        A function taking (url, batch_size) of an output file and returning a list of scores, in chromosome order.
+        :param region_func:
+        A function taking the list of chromosomes and returning the string to write into the region.
+        :param log_func:
+        A function taking (url, batch_size) of a log file and returning a list of log rows, in chromosome order.
+        """
+        self.chromosomes = chromosomes
+        self.score_func = score_func
+        self.region_func = region_func
+        self.log_func = log_func
+        self.workspace = None
+
+    def genotype_dict(self):
+        """ The genotype dictionary of the batch's setup, with every region value set to the rendered batch."""
+        return self.chromosomes[0].evaluation_setup.genotype_dict_for(self.region_func(self.chromosomes))
+
+    @staticmethod
+    def with_function(file_dict, function):
+        """ Copy an output or log dictionary, swapping in a batch function for every file."""
+        return {'files': [dict(file, function=function) for file in file_dict['files']]}
+
+    def evaluate(self):
+        """
+        Run the target program once, then split the fitness and logs back out to each chromosome. Each is given the
+        resource usage of the whole batch.
+        """
+        first = self.chromosomes[0]
+        batch_size = len(self.chromosomes)
+
+        defer_cleanup = first.evaluation_setup.defer_cleanup
+        wrapper = LocalEnvWrapper(folder=first.target_dir, delete_files=not defer_cleanup,
+                                  launcher=first.evaluation_setup.launcher)
+        failed = True
+        try:
+            wrapper.set_input_files(genotype_setup=self.genotype_dict())
+            exit_codes = wrapper.execute(execution_dict=first.execute_dict)
+            usage = wrapper.usage()
+
+            scores = wrapper.get_batch_output_scores(
+                get_output_dict=ChromosomeBatch.with_function(first.output_dict, self.score_func),
+                batch_size=batch_size)
+            log_rows = wrapper.get_batch_log_rows(
+                log_dict=ChromosomeBatch.with_function(first.log_dict, self.log_func), batch_size=batch_size)
+
+            for chromosome, score, log_row in zip(self.chromosomes, scores, log_rows):
+                chromosome.usage = usage
+                chromosome.set_result(fitness=score, user_output_log=log_row)
+            failed = any(exit_codes)
+        finally:
+            if defer_cleanup:
+                self.workspace = (wrapper.folder, failed)
+            else:
+                wrapper.close()
+
+    def __len__(self):
+        return len(self.chromosomes)
@@ -0,0 +1,146 @@
+"""
+A genotype to fitness cache, shared between optimisers evaluating the same target.
+
+Chromosomes are keyed by their uuid, a hash of their genotype, so an identical genotype met again, in a later epoch or
+in another optimiser, takes its result from the cache rather than being evaluated again. The cache is thread safe,
+and a genotype being evaluated by one optimiser is waited for by others rather than evaluated twice at once.
+"""
+
+import logging
+import threading
+
+
+class FitnessCache:
+    def __init__(self, max_entries=None):
+        """
+        A thread safe store of evaluation results by genotype. Supply the same cache to every optimiser which should
+        share results; they must evaluate the same target in the same way.
+        :param max_entries: the most results to keep, dropping the oldest first, or None for no limit.
+        """
+        self.max_entries = max_entries
+        self.results = dict()
+        self.in_flight = dict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.results)
+
+    def __contains__(self, uuid):
+        return uuid in self.results
+
+    def get(self, uuid):
+        """ Get the (fitness, objectives, user_output_log) of a genotype, or None if it hasn't been evaluated."""
+        with self.lock:
+            return self.results.get(uuid)
+
+    def put(self, chromosome):
+        """ Store the result of an evaluated chromosome, waking anything waiting for it."""
+        with self.lock:
+            self.store(chromosome.uuid, (chromosome.fitness, chromosome.objectives, chromosome.user_output_log))
+
+    def preload(self, results):
+        """
+        Store results found elsewhere, i.e. by an earlier run, for genotypes not already cached.
+        :param results: an iterable of (uuid, (fitness, objectives, user_output_log)).
+        :return: the number of results stored.
+        """
+        stored = 0
+        with self.lock:
+            for uuid, result in results:
+                if uuid not in self.results:
+                    self.store(uuid, result)
+                    stored += 1
+
+        return stored
+
+    def store(self, uuid, result):
+        """ Store a result, with the lock held."""
+        self.results[uuid] = result
+        if self.max_entries is not None and len(self.results) > self.max_entries:
+            del self.results[next(iter(self.results))]
+        event = self.in_flight.pop(uuid, None)
+        if event is not None:
+            event.set()
+
+    def abandon(self, uuid):
+        """ Give up a claim on a genotype which couldn't be evaluated, so a waiter evaluates it instead."""
+        with self.lock:
+            event = self.in_flight.pop(uuid, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    def apply(chromosome, result):
+        fitness, objectives, user_output_log = result
+        chromosome.set_result(fitness=fitness, user_output_log=user_output_log, objectives=objectives)
+
+    def partition(self, chromosomes):
+        """
+        Sort unevaluated chromosomes into those whose result is cached, which are set from it, those now claimed for
+        evaluation by the caller, and those already claimed by someone else.
+        :return: lists of the (claimed, waiting) chromosomes.
+        """
+        claimed = list()
+        waiting = list()
+        with self.lock:
+            for chromosome in chromosomes:
+                if chromosome.fitness is not None:
+                    continue
+                result = self.results.get(chromosome.uuid)
+                if result is not None:
+                    self.hits += 1
+                    FitnessCache.apply(chromosome, result)
+                elif chromosome.uuid in self.in_flight:
+                    self.hits += 1
+                    waiting.append(chromosome)
+                else:
+                    self.misses += 1
+                    self.in_flight[chromosome.uuid] = threading.Event()
+                    claimed.append(chromosome)
+
+        return claimed, waiting
+
+    def evaluate_population(self, chromosomes, evaluate):
+        """
+        Evaluate a population through the cache.
+        :param chromosomes: a list of chromosomes, some of which may already have a fitness.
+        :param evaluate: the function evaluating a list of chromosomes, returning them evaluated. They may be copies.
+        :return: the list of evaluated chromosomes.
+        """
+        claimed, waiting = self.partition(chromosomes)
+        claimed_ids = set(id(chromosome) for chromosome in claimed)
+        waiting_ids = set(id(chromosome) for chromosome in waiting)
+        others = [chromosome for chromosome in chromosomes
+                  if id(chromosome) not in claimed_ids and id(chromosome) not in waiting_ids]
+
+        evaluated = list()
+        try:
+            if claimed:
+                evaluated = evaluate(claimed)
+        finally:
+            for chromosome in evaluated:
+                if chromosome.fitness is not None:
+                    self.put(chromosome)
+            for chromosome in claimed:
+                self.abandon(chromosome.uuid)  # Only those which weren't put are still in flight.
+
+        # Only wait once our own claims are dispatched and finished, so optimisers never wait on each other in a cycle.
+        missed = list()
+        for chromosome in waiting:
+            with self.lock:
+                event = self.in_flight.get(chromosome.uuid)
+            if event is not None:
+                event.wait()
+            result = self.get(chromosome.uuid)
+            if result is None:
+                missed.append(chromosome)
+            else:
+                FitnessCache.apply(chromosome, result)
+
+        if missed:
+            logging.debug("Evaluating " + str(len(missed)) + " chromosomes whose other evaluation failed.")
+            evaluated.extend(self.evaluate_population(missed, evaluate))
+
+        return others + evaluated + [chromosome for chromosome in waiting if chromosome not in missed]
@@ -0,0 +1,210 @@
+"""
+Population diversity metrics and diversity preserving operators.
+
+A population is encoded as an (N, L) array of its N chromosomes' L genes. Every gene can be compared as a category,
+by its string value, so categorical codes are always available. Where every gene can be converted with float(), a
+float array is also available for Euclidean distances. Distances are normalised to [0, 1]: Hamming by the number of
+genes, Euclidean by the number of genes after scaling each gene to the population's range.
+"""
+
+import numpy as np
+import numpy.random as npr
+
+# The most elements of the (rows, N, L) comparison arrays built at once when finding pairwise distances.
+CHUNK_ELEMENTS = 2 ** 22
+# The most pairs of chromosomes averaged over before sampling pairs instead.
+MAX_PAIRS = 2 ** 16
+METRICS = ('unique', 'hamming', 'euclidean', 'entropy')
+
+
+def gene_strings(chromosomes):
+    """ Get the string value of every gene, padding shorter genotypes with empty strings."""
+    rows = [[str(gene) for gene in chromosome.full_genotype] for chromosome in chromosomes]
+    length = max((len(row) for row in rows), default=0)
+
+    return [row + [''] * (length - len(row)) for row in rows]
+
+
+def categorical_matrix(chromosomes):
+    """ Encode a population as an (N, L) integer array, where equal codes in a column are equal genes."""
+    strings = np.asarray(gene_strings(chromosomes), dtype=object).reshape(len(chromosomes), -1)
+    codes = np.empty(strings.shape, dtype=np.int64)
+    for column in range(strings.shape[1]):
+        codes[:, column] = np.unique(strings[:, column].astype(str), return_inverse=True)[1]
+
+    return codes
+
+
+def numeric_matrix(chromosomes):
+    """ Encode a population as an (N, L) float array of its genes' float() values, or None if any gene has none."""
+    try:
+        return np.asarray([[float(gene) for gene in chromosome.full_genotype] for chromosome in chromosomes],
+                          dtype=float).reshape(len(chromosomes), -1)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalise_columns(values):
+    """ Scale every column of a float array to [0, 1] by its range, leaving constant columns at 0."""
+    low = values.min(axis=0)
+    span = values.max(axis=0) - low
+    span[span == 0] = 1
+
+    return (values - low) / span
+
+
+def pairwise_hamming(codes, others=None):
+    """
+    Find the normalised Hamming distance between every pair of rows, built in chunks of rows to bound its memory.
+    :param codes: an (N, L) array of categorical codes.
+    :param others: an (M, L) array to measure against, or None for codes itself.
+    :return: an (N, M) array of the proportions of genes which differ.
+    """
+    others = codes if others is None else others
+    length = max(codes.shape[1], 1)
+    chunk = max(CHUNK_ELEMENTS // max(others.size, 1), 1)
+
+    distances = np.empty((codes.shape[0], others.shape[0]))
+    for start in range(0, codes.shape[0], chunk):
+        distances[start:start + chunk] = (codes[start:start + chunk, None, :] != others[None, :, :]).sum(axis=2)
+
+    return distances / length
+
+
+def pairwise_euclidean(values):
+    """
+    Find the normalised Euclidean distance between every pair of rows.
+    :param values: an (N, L) float array, with every column already scaled to [0, 1].
+    :return: an (N, N) array of distances in [0, 1].
+    """
+    squared_norms = (values ** 2).sum(axis=1)
+    squared = squared_norms[:, None] + squared_norms[None, :] - 2 * values @ values.T
+    np.maximum(squared, 0, out=squared)
+    np.fill_diagonal(squared, 0)
+
+    return np.sqrt(squared / max(values.shape[1], 1))
+
+
+def mean_pairwise_distance(matrix, metric='hamming', max_pairs=MAX_PAIRS):
+    """
+    Find the mean distance between distinct pairs of chromosomes. Large populations are estimated from a random
+    sample of pairs rather than every pair.
+    :param matrix: categorical codes for 'hamming', or scaled floats for 'euclidean'.
+    :param metric: 'hamming' or 'euclidean'.
+    :param max_pairs: the most pairs to average over before sampling instead.
+    :return: the mean distance in [0, 1], or 0 for fewer than two chromosomes.
+    """
+    num_rows = matrix.shape[0]
+    if num_rows < 2:
+        return 0.0
+
+    if num_rows * (num_rows - 1) // 2 <= max_pairs:
+        first, second = np.triu_indices(num_rows, k=1)
+    else:
+        first = npr.randint(num_rows, size=max_pairs)
+        second = (first + npr.randint(1, num_rows, size=max_pairs)) % num_rows  # Never the same row.
+
+    if metric == 'hamming':
+        distances = (matrix[first] != matrix[second]).mean(axis=1)
+    else:
+        distances = np.sqrt(((matrix[first] - matrix[second]) ** 2).mean(axis=1))
+
+    return float(distances.mean())
+
+
+def gene_entropy(codes):
+    """
+    Find the Shannon entropy of every gene across the population, normalised by its maximum for the population size.
+    :param codes: an (N, L) array of categorical codes.
+    :return: an array of L entropies in [0, 1].
+    """
+    num_rows = codes.shape[0]
+    if num_rows < 2:
+        return np.zeros(codes.shape[1])
+
+    # Count each code per column at once by offsetting each column's codes into its own range.
+    offsets = codes + np.arange(codes.shape[1]) * num_rows
+    counts = np.bincount(offsets.ravel(), minlength=codes.shape[1] * num_rows).reshape(codes.shape[1], num_rows)
+    p = counts / num_rows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(p > 0, p * np.log(p), 0).sum(axis=1)
+
+    return entropy / np.log(num_rows)
+
+
+def population_diversity(chromosomes, metric='hamming', max_pairs=MAX_PAIRS):
+    """
+    Measure the diversity of a population in [0, 1], where 0 is a population of clones.
+    :param chromosomes: a list of chromosomes.
+    :param metric: 'unique' for the proportion of distinct genotypes, 'hamming' or 'euclidean' for the mean pairwise
+    distance or 'entropy' for the mean gene entropy. 'euclidean' falls back to 'hamming' for non-numeric genes.
+    :param max_pairs: the most pairs to average distances over before sampling instead.
+    """
+    if metric not in METRICS:
+        raise ValueError("Unknown diversity metric " + repr(metric) + ", expected one of " + str(METRICS))
+    if metric == 'unique':
+        return len(set(chromosome.uuid for chromosome in chromosomes)) / len(chromosomes)
+
+    if metric == 'euclidean':
+        values = numeric_matrix(chromosomes)
+        if values is not None:
+            return mean_pairwise_distance(normalise_columns(values), 'euclidean', max_pairs)
+
+    codes = categorical_matrix(chromosomes)
+    if metric == 'entropy':
+        return float(gene_entropy(codes).mean()) if codes.size else 0.0
+
+    return mean_pairwise_distance(codes, 'hamming', max_pairs)
+
+
+def pairwise_distances(chromosomes, metric='hamming'):
+    """ Find the (N, N) normalised distances between a population's chromosomes, Euclidean where genes allow it."""
+    if metric == 'euclidean':
+        values = numeric_matrix(chromosomes)
+        if values is not None:
+            return pairwise_euclidean(normalise_columns(values))
+
+    return pairwise_hamming(categorical_matrix(chromosomes))
+
+
+def shared_fitness(fitnesses, distances, radius, alpha=1.0):
+    """
+    Derate fitness by niche count (Goldberg and Richardson's fitness sharing), so selection favours chromosomes in
+    sparsely populated regions. Fitnesses are shifted to be positive first, as for roulette selection.
+    :param fitnesses: an array of N fitnesses.
+    :param distances: the (N, N) normalised distances between chromosomes.
+    :param radius: the sharing radius, as a normalised distance, within which chromosomes share fitness.
+    :param alpha: the shape of the sharing function.
+    :return: an array of N shared fitnesses.
+    """
+    fitnesses = np.asarray(fitnesses, dtype=float)
+    fitnesses = fitnesses - min(fitnesses.min(), 0) + np.finfo(float).eps
+    sharing = np.where(distances < radius, 1 - (distances / radius) ** alpha, 0)
+
+    return fitnesses / sharing.sum(axis=1)  # Each includes itself, at distance 0, so the count is at least 1.
+
+
+def crowding_replace(population, offspring, crowding_factor, protected=()):
+    """
+    Insert offspring by De Jong's crowding: each replaces the most similar of a random sample of the population,
+    so a niche is only crowded out by its own kind.
+    :param population: a list of chromosomes.
+    :param offspring: a list of new chromosomes, no more than the unprotected population.
+    :param crowding_factor: the number of chromosomes sampled for each offspring to replace.
+    :param protected: the indices of chromosomes which must not be replaced, i.e. the best.
+    :return: the new population.
+    """
+    codes = categorical_matrix(population + offspring)
+    population_codes, offspring_codes = codes[:len(population)], codes[len(population):]
+    replaceable = np.setdiff1d(np.arange(len(population)), np.asarray(list(protected), dtype=int))
+    if len(offspring) > replaceable.size:
+        raise ValueError("More offspring than chromosomes which can be replaced.")
+
+    population = list(population)
+    for child, child_codes in zip(offspring, offspring_codes):
+        candidates = npr.choice(replaceable, size=min(crowding_factor, replaceable.size), replace=False)
+        nearest = candidates[np.argmin(pairwise_hamming(child_codes[None, :], population_codes[candidates])[0])]
+        population[nearest] = child
+        replaceable = replaceable[replaceable != nearest]
+
+    return population
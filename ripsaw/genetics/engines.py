@@ -0,0 +1,246 @@
+"""
+Search engines for real-valued genes, as alternatives to crossover and mutation.
+
+An engine is supplied to the optimiser as its engine. Each epoch it is asked for the chromosomes to evaluate, and once
+they are evaluated, logged and scored it is told their results and returns the population the epoch's statistics and
+stopping criteria are taken from. Engines work on the float values of the genes as an (N, L) array, sampling and
+updating it with NumPy, and write new values back with each gene's set_float, so genes must implement it. Every
+chromosome must have the same genes in the same order. As the optimiser does, engines maximise fitness.
+
+The first epoch evaluates a random population from the chromosome function, which also sets the scale of the search.
+An engine's check is called as the optimiser is created, raising ValueError if the optimiser's parameters don't suit it.
+"""
+
+import math
+
+import numpy as np
+import numpy.random as npr
+
+from ripsaw.genetics.genotype import Chromosome
+from ripsaw.genetics.diversity import numeric_matrix
+
+
+def gene_matrix(chromosomes):
+    """ Get the float values of a population's genes as an (N, L) array."""
+    values = numeric_matrix(chromosomes)
+    if values is None:
+        raise ValueError("Every chromosome must have the same number of genes, each with a float value, for an "
+                         "engine to search.")
+
+    return values
+
+
+def chromosomes_from(chromosome_function, values):
+    """ Make a chromosome from the chromosome function for each row of an (N, L) array of gene values."""
+    chromosomes = list()
+    for row in values.tolist():
+        chromosome = Chromosome(chromosome_function=chromosome_function)
+        for gene, value in zip(chromosome.full_genotype, row):
+            gene.set_float(value)
+        chromosome.reset_fitness()
+        chromosomes.append(chromosome)
+
+    return chromosomes
+
+
+def results_of(chromosomes, evaluated):
+    """
+    Get the evaluated version of each chromosome, matched by genotype, as an evaluator such as a worker pool may
+    return copies in any order.
+    """
+    by_uuid = {chromosome.uuid: chromosome for chromosome in evaluated}
+    return [by_uuid.get(chromosome.uuid, chromosome) for chromosome in chromosomes]
+
+
+def fitness_array(chromosomes):
+    return np.asarray([chromosome.fitness for chromosome in chromosomes], dtype=float)
+
+
+class DifferentialEvolution:
+    def __init__(self, differential_weight=0.8, crossover_rate=0.9):
+        """
+        DE/rand/1/bin differential evolution. Each epoch a trial is made for every member of the population, from
+        the difference of two random others added to a third, binomially crossed with the member. A trial replaces
+        its member if it scores at least as well.
+        :param differential_weight: F, the scale of the difference vector, normally between 0.4 and 1.
+        :param crossover_rate: CR, the probability of each gene being taken from the mutant rather than the member.
+        """
+        self.differential_weight = differential_weight
+        self.crossover_rate = crossover_rate
+        self.population = list()
+        self.trials = list()
+        self.started = False
+
+    def check(self, optimiser):
+        """ Check the population is large enough for a member and the three others each mutant is made from."""
+        if optimiser.population_size < 4:
+            raise ValueError("Differential evolution needs a population_size of at least 4.")
+
+    def mutants(self, values):
+        """ Make a DE/rand/1 mutant for every row of the population's values, from three other distinct rows."""
+        size = len(values)
+        order = npr.random((size, size))
+        np.fill_diagonal(order, np.inf)
+        r1, r2, r3 = np.argsort(order, axis=1)[:, :3].T
+
+        return values[r1] + self.differential_weight * (values[r2] - values[r3])
+
+    def crossover(self, values, mutants):
+        """ Binomially cross each row with its mutant, taking at least one gene from the mutant."""
+        size, length = values.shape
+        from_mutant = npr.random((size, length)) < self.crossover_rate
+        from_mutant[np.arange(size), npr.randint(length, size=size)] = True
+
+        return np.where(from_mutant, mutants, values)
+
+    def ask(self, optimiser, chromosomes):
+        """ Get the chromosomes to evaluate this epoch: a random population to begin with, then a trial per member."""
+        if not self.started:
+            self.trials = [Chromosome(chromosome_function=optimiser.chromosome_function)
+                           for _ in range(optimiser.population_size)]
+            return list(self.trials)
+
+        values = gene_matrix(self.population)
+        self.trials = chromosomes_from(optimiser.chromosome_function, self.crossover(values, self.mutants(values)))
+
+        return list(self.trials)
+
+    def tell(self, optimiser, evaluated):
+        """ Keep each trial which scored at least as well as the member it was made for."""
+        trials = results_of(self.trials, evaluated)
+        if not self.started:
+            self.population = trials
+            self.started = True
+            return list(self.population)
+
+        improved = fitness_array(trials) >= fitness_array(self.population)
+        self.population = [trial if better else member
+                           for trial, member, better in zip(trials, self.population, improved)]
+
+        return list(self.population)
+
+
+class CMAES:
+    def __init__(self, sigma=1.0, num_parents=None):
+        """
+        The covariance matrix adaptation evolution strategy. Each epoch the population is sampled from a multivariate
+        normal distribution, whose mean, step size and covariance are then moved towards the best samples.
+        :param sigma: the initial step size, in standard deviations of each gene over the random first population.
+        :param num_parents: mu, the number of best samples the distribution is updated from, or None for half.
+        """
+        self.initial_sigma = sigma
+        self.num_parents = num_parents
+
+        self.samples = list()
+        self.mean = None
+        self.sigma = None
+        self.covariance = None
+        self.eigenvectors = None
+        self.scales = None
+        self.inverse_root = None
+        self.path_sigma = None
+        self.path_covariance = None
+        self.generation = 0
+
+        # The recombination weights and learning rates, set once the number of genes is known.
+        self.weights = None
+        self.mu = None
+        self.mu_eff = None
+        self.c_sigma = None
+        self.d_sigma = None
+        self.c_c = None
+        self.c_1 = None
+        self.c_mu = None
+        self.chi_n = None
+
+    def check(self, optimiser):
+        """ Check there are no more parents than samples."""
+        if self.num_parents is not None and not 1 <= self.num_parents <= optimiser.population_size:
+            raise ValueError("CMA-ES needs between 1 and population_size parents.")
+
+    def set_weights(self, population_size, length):
+        """ Set the recombination weights and learning rates for a population size and number of genes."""
+        mu = self.num_parents or max(population_size // 2, 1)
+        weights = math.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mu = mu
+        self.mu_eff = 1 / np.sum(self.weights ** 2)
+
+        n = length
+        self.c_sigma = (self.mu_eff + 2) / (n + self.mu_eff + 5)
+        self.d_sigma = 1 + 2 * max(0.0, math.sqrt((self.mu_eff - 1) / (n + 1)) - 1) + self.c_sigma
+        self.c_c = (4 + self.mu_eff / n) / (n + 4 + 2 * self.mu_eff / n)
+        self.c_1 = 2 / ((n + 1.3) ** 2 + self.mu_eff)
+        self.c_mu = min(1 - self.c_1, 2 * (self.mu_eff - 2 + 1 / self.mu_eff) / ((n + 2) ** 2 + self.mu_eff))
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    def decompose(self):
+        """ Update the eigen decomposition of the covariance, which sampling and the step size path need."""
+        self.covariance = np.triu(self.covariance) + np.triu(self.covariance, 1).T
+        eigenvalues, self.eigenvectors = np.linalg.eigh(self.covariance)
+        self.scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        self.inverse_root = (self.eigenvectors / self.scales) @ self.eigenvectors.T
+
+    def ask(self, optimiser, chromosomes):
+        """ Get the chromosomes to evaluate this epoch: a random population to begin with, then samples."""
+        if self.mean is None:
+            self.samples = [Chromosome(chromosome_function=optimiser.chromosome_function)
+                            for _ in range(optimiser.population_size)]
+            return list(self.samples)
+
+        normals = npr.standard_normal((optimiser.population_size, len(self.mean)))
+        values = self.mean + self.sigma * (normals * self.scales) @ self.eigenvectors.T
+        self.samples = chromosomes_from(optimiser.chromosome_function, values)
+
+        return list(self.samples)
+
+    def start(self, values, fitnesses):
+        """ Set the distribution from the random first population: centred on its best, scaled by its spread."""
+        self.set_weights(len(values), values.shape[1])
+        spread = values.std(axis=0)
+        spread[spread == 0] = 1
+        best = values[np.argsort(-fitnesses, kind='stable')[:self.mu]]
+
+        self.mean = self.weights @ best
+        self.sigma = self.initial_sigma
+        self.covariance = np.diag(spread ** 2)
+        self.path_sigma = np.zeros(values.shape[1])
+        self.path_covariance = np.zeros(values.shape[1])
+        self.decompose()
+
+    def update(self, values, fitnesses):
+        """ Move the distribution towards the best samples, values being the genes as set (i.e. once clipped)."""
+        self.generation += 1
+        best = values[np.argsort(-fitnesses, kind='stable')[:self.mu]]
+        previous_mean = self.mean
+        self.mean = self.weights @ best
+        step = (self.mean - previous_mean) / self.sigma
+
+        self.path_sigma = (1 - self.c_sigma) * self.path_sigma + \
+            math.sqrt(self.c_sigma * (2 - self.c_sigma) * self.mu_eff) * (self.inverse_root @ step)
+        norm = np.linalg.norm(self.path_sigma)
+        h_sigma = norm / math.sqrt(1 - (1 - self.c_sigma) ** (2 * self.generation)) / self.chi_n < \
+            1.4 + 2 / (len(self.mean) + 1)
+        self.path_covariance = (1 - self.c_c) * self.path_covariance + \
+            h_sigma * math.sqrt(self.c_c * (2 - self.c_c) * self.mu_eff) * step
+
+        steps = (best - previous_mean) / self.sigma
+        self.covariance = (1 - self.c_1 - self.c_mu) * self.covariance + \
+            self.c_1 * (np.outer(self.path_covariance, self.path_covariance) +
+                        (1 - h_sigma) * self.c_c * (2 - self.c_c) * self.covariance) + \
+            self.c_mu * (steps.T * self.weights) @ steps
+        self.sigma *= math.exp((self.c_sigma / self.d_sigma) * (norm / self.chi_n - 1))
+        self.decompose()
+
+    def tell(self, optimiser, evaluated):
+        """ Update the distribution from this epoch's samples, which become the population."""
+        samples = results_of(self.samples, evaluated)
+        values, fitnesses = gene_matrix(samples), fitness_array(samples)
+
+        if self.mean is None:
+            self.start(values, fitnesses)
+        else:
+            self.update(values, fitnesses)
+        self.samples = samples
+
+        return list(samples)
@@ -0,0 +1,178 @@
+"""
+Events of an optimiser run, for following its progress as it happens.
+
+The optimiser emits an event when the run starts, as each chromosome's evaluation finishes, as each epoch finishes and
+when the run ends. Callbacks subscribed to the optimiser are called with every event, and an EventStream iterates over
+them (with for or async for) while the run goes on in a background thread. The progress printed to the console is
+just one subscriber, a ConsoleReporter.
+
+Callbacks are called one at a time, but not always from the thread which started the run, as evaluations may finish
+in a scheduler's threads. A chromosome in an event is the optimiser's own, which goes on to be mutated, so anything
+wanted from it should be read in the callback.
+"""
+
+import asyncio
+import datetime
+import queue
+import threading
+
+
+class Event:
+    __slots__ = ()
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(name + "=" + repr(getattr(self, name))
+                                                     for name in self.__slots__) + ")"
+
+
+class RunStarted(Event):
+    __slots__ = ('start_time',)
+
+    def __init__(self, start_time):
+        """ The optimiser started running, at the datetime start_time."""
+        self.start_time = start_time
+
+
+class ChromosomeEvaluated(Event):
+    __slots__ = ('epoch_num', 'chromosome')
+
+    def __init__(self, epoch_num, chromosome):
+        """
+        A chromosome's evaluation finished, in the epoch after epoch_num epochs were done, as in the log file.
+        Chromosomes whose result was taken from a fitness cache aren't evaluated, so have no event.
+        """
+        self.epoch_num = epoch_num
+        self.chromosome = chromosome
+
+
+class EpochFinished(Event):
+    __slots__ = ('epoch_num', 'best_score', 'mean_score', 'std_dev_score', 'diversity', 'usage_summary', 'elapsed')
+
+    def __init__(self, epoch_num, best_score, mean_score, std_dev_score, diversity, usage_summary, elapsed):
+        """
+        An epoch finished, with the optimiser's statistics after it.
+        :param epoch_num: the number of epochs done.
+        :param usage_summary: the resource usage of the epoch's evaluations, or None if it wasn't measured.
+        :param elapsed: the seconds since the run started.
+        """
+        self.epoch_num = epoch_num
+        self.best_score = best_score
+        self.mean_score = mean_score
+        self.std_dev_score = std_dev_score
+        self.diversity = diversity
+        self.usage_summary = usage_summary
+        self.elapsed = elapsed
+
+
+class RunFinished(Event):
+    __slots__ = ('epoch_num', 'best_score', 'elapsed')
+
+    def __init__(self, epoch_num, best_score, elapsed):
+        """ The run stopped, after epoch_num epochs and elapsed seconds."""
+        self.epoch_num = epoch_num
+        self.best_score = best_score
+        self.elapsed = elapsed
+
+
+class ConsoleReporter:
+    """ A subscriber printing the optimiser's progress, epoch by epoch."""
+
+    def __call__(self, event):
+        if isinstance(event, RunStarted):
+            print("Starting the optimiser...")
+            print("\tStart Time: ", event.start_time.strftime("%H:%M:%S"))
+        elif isinstance(event, EpochFinished):
+            print("Epoch", str(event.epoch_num), "done.")
+            print("\tBest score: ", event.best_score)
+            print("\tAverage Score: ", event.mean_score)
+            print("\tStandard Deviation: ", event.std_dev_score)
+            print("\tDiversity: ", event.diversity)
+            if event.usage_summary is not None:
+                print("\tEvaluations: ", event.usage_summary['evaluations'],
+                      " Mean wall time: ", round(event.usage_summary['mean_wall_time'], 3), "s")
+                if event.usage_summary['max_max_rss'] is not None:
+                    print("\tPeak memory: ", int(event.usage_summary['max_max_rss']), "bytes")
+            print("\tTime elapsed: ", datetime.timedelta(seconds=event.elapsed))
+
+
+class EventStream:
+    _end = object()
+
+    def __init__(self, optimiser):
+        """
+        The events of an optimiser's run, which starts in a background thread when iteration begins. Closing the
+        stream, as leaving a with block over it does, stops the run once its current epoch is done. An error raised
+        by the run is raised by the iteration, once the events before it have been taken.
+        """
+        self.optimiser = optimiser
+        self.events = queue.Queue()
+        self.thread = None
+        self.error = None
+        self.finished = False
+
+    def start(self):
+        if self.thread is None:
+            self.optimiser.subscribe(self.events.put)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        try:
+            self.optimiser.run()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.optimiser.unsubscribe(self.events.put)
+            self.events.put(EventStream._end)
+
+    def next_event(self):
+        """ Wait for the next event, returning None once the run has ended."""
+        self.start()
+        if self.finished:
+            return None
+
+        event = self.events.get()
+        if event is EventStream._end:
+            self.finished = True
+            if self.error is not None:
+                raise self.error
+            return None
+
+        return event
+
+    def close(self):
+        """ Ask the run to stop, then wait for it to finish."""
+        if self.thread is not None and not self.finished:
+            self.optimiser.stop()
+            while self.next_event() is not None:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.next_event()
+        if event is None:
+            raise StopIteration
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await asyncio.get_running_loop().run_in_executor(None, self.next_event)
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,108 @@
+"""
+Feasibility checks and repair of chromosomes before they are evaluated.
+
+Genotypes which break a model's constraints would otherwise get a workspace, a rendered template and a run of the
+target program, only for it to crash or return nonsense. A Feasibility supplied as the optimiser's feasibility checks
+every chromosome without a fitness in this process before any are dispatched. Infeasible chromosomes are repaired if a
+repair function was supplied and, if still infeasible, given the penalty fitness without the filesystem being touched.
+
+The check and repair are either called per chromosome, or if vectorised, once per epoch with the float values of every
+chromosome's genes as an (N, L) array, as engines and the shared memory evaluator use. Vectorised repairs are written
+back with each gene's set_float, so genes must implement it.
+"""
+
+import logging
+
+import numpy as np
+
+from ripsaw.genetics.diversity import numeric_matrix
+
+
+class Feasibility:
+    def __init__(self, check, repair=None, penalty=0.0, vectorised=False, penalty_objectives=None):
+        """
+        A feasibility stage. Supply it to the optimiser as its feasibility.
+        :param check: called with a chromosome, returning whether it is feasible. If vectorised, it is called with an
+        (N, L) array of gene values instead, returning an array of N booleans.
+        :param repair: called with an infeasible chromosome to change its genes in place, or None to only penalise. If
+        vectorised, it is called with the (M, L) values of the infeasible chromosomes, returning their repaired values.
+        :param penalty: the fitness of chromosomes which are still infeasible, which should be below any feasible
+        score, or a function of the chromosome returning it, i.e. graded by how far the constraints are broken.
+        :param vectorised: whether check and repair take arrays of gene values rather than chromosomes.
+        :param penalty_objectives: for multi-objective optimisation, the objectives of chromosomes which are still
+        infeasible, one per objective, or a function of the chromosome returning them. Their fitness is then the sum,
+        as for evaluated chromosomes, and penalty is unused.
+        """
+        self.check = check
+        self.repair = repair
+        self.penalty = penalty
+        self.vectorised = vectorised
+        self.penalty_objectives = penalty_objectives
+
+        self.checked = 0
+        self.repaired = 0
+        self.penalised = 0
+
+    def feasible(self, chromosomes):
+        """ Check a list of chromosomes, returning a boolean array of which are feasible."""
+        if not self.vectorised:
+            return np.asarray([bool(self.check(chromosome)) for chromosome in chromosomes], dtype=bool)
+
+        values = numeric_matrix(chromosomes)
+        if values is None:
+            raise ValueError("Every chromosome must have the same number of genes, each with a float value, for a "
+                             "vectorised feasibility check.")
+
+        return np.asarray(self.check(values), dtype=bool).reshape(len(chromosomes))
+
+    def repair_all(self, chromosomes):
+        """ Repair each of a list of infeasible chromosomes, resetting their fitness as their genes have changed."""
+        if self.vectorised:
+            values = np.asarray(self.repair(numeric_matrix(chromosomes)), dtype=float)
+            for chromosome, row in zip(chromosomes, values.tolist()):
+                for gene, value in zip(chromosome.full_genotype, row):
+                    gene.set_float(value)
+        else:
+            for chromosome in chromosomes:
+                self.repair(chromosome)
+
+        for chromosome in chromosomes:
+            chromosome.reset_fitness()
+
+    def penalise(self, chromosome):
+        """ Give an infeasible chromosome the penalty fitness, or the penalty objectives if they were supplied."""
+        if self.penalty_objectives is None:
+            fitness = self.penalty(chromosome) if callable(self.penalty) else self.penalty
+            chromosome.set_result(fitness=fitness, user_output_log=list())
+            return
+
+        objectives = self.penalty_objectives(chromosome) if callable(self.penalty_objectives) else \
+            self.penalty_objectives
+        chromosome.set_result(fitness=sum(objectives), user_output_log=list(), objectives=objectives)
+
+    def screen(self, chromosomes):
+        """
+        Check every chromosome without a fitness, repairing those which are infeasible where possible and giving
+        the rest the penalty fitness.
+        :return: the list of chromosomes which were penalised.
+        """
+        pending = [chromosome for chromosome in chromosomes if chromosome.fitness is None]
+        if not pending:
+            return list()
+
+        feasible = self.feasible(pending)
+        infeasible = [chromosome for chromosome, ok in zip(pending, feasible) if not ok]
+        self.checked += len(pending)
+
+        if infeasible and self.repair is not None:
+            self.repair_all(infeasible)
+            self.repaired += len(infeasible)
+            infeasible = [chromosome for chromosome, ok in zip(infeasible, self.feasible(infeasible)) if not ok]
+            self.repaired -= len(infeasible)
+
+        for chromosome in infeasible:
+            self.penalise(chromosome)
+        self.penalised += len(infeasible)
+
+        logging.debug("Feasibility - checked: " + str(len(pending)) + " penalised: " + str(len(infeasible)))
+        return infeasible
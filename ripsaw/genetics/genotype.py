@@ -7,11 +7,76 @@ from abc import ABC, abstractmethod
 import numpy as np
 from ripsaw.util.assumptions import chromo_dict_generator
 from ripsaw.local_env_wrapper import LocalEnvWrapper
+from ripsaw.util.logging import Logger
+from ripsaw.util.usage import ProcessUsage
 import hashlib
+import inspect
 import logging
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def accepted_params(function):
+    """ Get the names of the keyword parameters a function accepts, or None if it takes **kwargs."""
+    names = list()
+    for parameter in inspect.signature(function).parameters.values():
+        if parameter.kind is inspect.Parameter.VAR_KEYWORD:
+            return None
+        if parameter.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY):
+            names.append(parameter.name)
+
+    return frozenset(names)
+
+
+def filter_params(function, params):
+    """ Reduce a dictionary of parameters to those which a function will accept."""
+    names = accepted_params(getattr(function, '__func__', function))
+    if names is None:
+        return params
+
+    return {name: value for name, value in params.items() if name in names}
+
+
+class EvaluationSetup:
+    __slots__ = ('target_dir', 'genotype_dict', 'output_dict', 'execute_dict', 'log_dict', 'defer_cleanup', 'launcher')
+
+    def __init__(self, cwd, cmd_args, target_dir,
+                 input_file_path, region_identifier,
+                 output_score_func, output_filename,
+                 output_log_func, output_log_file,
+                 optimiser_dict, defer_cleanup=False, launcher=None, stages=None):
+        """
+        The configuration needed to evaluate chromosomes against a target. It holds no chromosome, so one instance can
+        be shared by every chromosome of an optimiser rather than each carrying its own copy of the dictionaries.
+        If defer_cleanup is set, evaluations leave their workspace in place and record it for a WorkspaceCleaner.
+        Target programs are run with the given launcher, or the process's default launcher if it is None.
+        If stages (execute dictionary entries, see ripsaw.util.stages) are given, they are run in turn in place of
+        the cmd_args program.
+        """
+        self.target_dir = target_dir
+        self.defer_cleanup = defer_cleanup
+        self.launcher = launcher
+        (self.genotype_dict, self.output_dict, self.execute_dict, self.log_dict) = \
+            chromo_dict_generator(cwd, cmd_args, input_file_path,
+                                  None, region_identifier,
+                                  output_score_func, output_filename,
+                                  output_log_func, output_log_file,
+                                  optimiser_dict)
+        if stages is not None:
+            self.execute_dict = {'files': list(stages)}
+
+    def genotype_dict_for(self, value):
+        """ Get the genotype dictionary with every region's value set, normally to a chromosome."""
+        return {'files': [{'URL': file['URL'],
+                           'region_value': {region: value for region in file['region_value']}}
+                          for file in self.genotype_dict['files']]}
 
 
 class Chromosome:
+    __slots__ = ('fitness', 'objectives', 'uuid', 'user_output_log', 'epoch_number', 'creation_epoch_number',
+                 'log_row', 'log_text', 'evaluation_setup', 'workspace', 'usage', 'replicates',
+                 'chromosome_function', 'full_genotype')
+
     def __init__(self, chromosome_function,
                  passed_genes=None):
         """
@@ -23,18 +88,19 @@ class Chromosome:
         A list of genes to set as the genotype of this chromosome, rather than use the genotype function as default.
         """
         self.fitness = None
+        self.objectives = None
         self.uuid = None
         self.user_output_log = None
         self.epoch_number = None
         self.creation_epoch_number = None
 
         self.log_row = None
+        self.log_text = None
 
-        self.genotype_dict = None
-        self.output_dict = None
-        self.execute_dict = None
-        self.log_dict = None
-        self.target_dir = None
+        self.evaluation_setup = None
+        self.workspace = None
+        self.usage = None
+        self.replicates = None
         self.chromosome_function = chromosome_function
 
         if passed_genes:
@@ -56,33 +122,81 @@ class Chromosome:
 
         """ Prepare this chromosome for evaluation."""
 
+        if self.fitness is None:
+            self.use_setup(EvaluationSetup(cwd, cmd_args, target_dir,
+                                           input_file_path, region_identifier,
+                                           output_score_func, output_filename,
+                                           output_log_func, output_log_file,
+                                           optimiser_dict),
+                           optimiser_dict)
+
+    def use_setup(self, evaluation_setup, optimiser_dict):
+        """ Prepare this chromosome for evaluation with a (possibly shared) evaluation setup."""
         if self.fitness is None:
             self.creation_epoch_number = optimiser_dict["epoch_num"]
+            self.evaluation_setup = evaluation_setup
 
-            dicts = chromo_dict_generator(cwd, cmd_args, input_file_path,
-                                          self, region_identifier,
-                                          output_score_func, output_filename,
-                                          output_log_func, output_log_file,
-                                          optimiser_dict)
+    @property
+    def target_dir(self):
+        return self.evaluation_setup.target_dir
 
-            self.target_dir = target_dir
-            (self.genotype_dict, self.output_dict, self.execute_dict, self.log_dict) = dicts
+    @property
+    def genotype_dict(self):
+        return self.evaluation_setup.genotype_dict_for(self)
+
+    @property
+    def output_dict(self):
+        return self.evaluation_setup.output_dict
+
+    @property
+    def execute_dict(self):
+        return self.evaluation_setup.execute_dict
+
+    @property
+    def log_dict(self):
+        return self.evaluation_setup.log_dict
 
     def evaluate(self):
         """ Run the target program, setting this chromosomes fitness and getting logs from the target folder."""
         if self.fitness is None:
-            wrapper = LocalEnvWrapper(folder=self.target_dir)
-            wrapper.set_input_files(genotype_setup=self.genotype_dict)
-            wrapper.execute(execution_dict=self.execute_dict)
-
-            self.fitness = wrapper.get_output_score(get_output_dict=self.output_dict)
-
-            self.user_output_log = wrapper.get_log_row(log_dict=self.log_dict)
-            self.set_log_row()
+            defer_cleanup = self.evaluation_setup.defer_cleanup
+            wrapper = LocalEnvWrapper(folder=self.target_dir, delete_files=not defer_cleanup,
+                                      launcher=self.evaluation_setup.launcher)
+            failed = True
+            try:
+                wrapper.set_input_files(genotype_setup=self.genotype_dict)
+                exit_codes = wrapper.execute(execution_dict=self.execute_dict)
+                self.usage = wrapper.usage()
+
+                objectives = wrapper.get_output_objectives(get_output_dict=self.output_dict)
+                self.set_result(fitness=sum(objectives), user_output_log=wrapper.get_log_row(log_dict=self.log_dict),
+                                objectives=objectives)
+                failed = any(exit_codes)
+            finally:
+                if defer_cleanup:
+                    self.workspace = (wrapper.folder, failed)
+                else:
+                    wrapper.close()
+
+    def set_result(self, fitness, user_output_log, objectives=None):
+        """
+        Set this chromosome's fitness and user log, as found by whichever means it was evaluated.
+        :param fitness: the scalar score of this chromosome.
+        :param user_output_log: a list of values from the user's log function.
+        :param objectives: the separate objective values, for multi-objective optimisation. Defaults to the fitness.
+        """
+        self.fitness = fitness
+        self.objectives = list(objectives) if objectives is not None else [fitness]
+        self.user_output_log = user_output_log
+        self.set_log_row()
 
     def set_log_row(self):
-        """ Return a row for the csv logger. First take info about this chromo and then append user supplied function"""
+        """
+        Return a row for the csv logger. First take info about this chromo and then append user supplied function,
+        then the resource usage of its evaluation (blank if unknown, i.e. when evaluated elsewhere).
+        """
         self.log_row = list()
+        self.log_text = None
 
         self.log_row.append(self.creation_epoch_number)
         self.log_row.append(self.uuid)
@@ -94,16 +208,33 @@ class Chromosome:
             self.log_row.append(float(gene))
 
         self.log_row.extend(self.user_output_log)
+        self.log_row.extend(self.usage.as_row() if self.usage is not None else [""] * len(ProcessUsage.FIELDS))
 
     def get_log_row(self):
         """ Pass up the logging from this object and the user supplied one which ran on the target environment."""
         return self.log_row
 
+    def get_log_text(self):
+        """ Get the log row as the text the csv logger writes for it."""
+        if self.log_text is not None:
+            return self.log_text
+
+        return Logger.format_row(self.log_row)
+
+    def release_log(self):
+        """ Once logged, keep only the formatted log text, dropping the user output and row it was built from."""
+        if self.log_row is not None:
+            self.log_text = Logger.format_row(self.log_row)
+        self.log_row = None
+        self.user_output_log = None
+        self.usage = None
+
     def mutate(self, p_gene_mutate=0, p_total_mutate=0, **mutate_params):
         """
         Call the Chromosome's genotype function, using it's mutation probabilities.
-        Additionally, the mutate_params will be supplied to the genotype function. This could include the information
-        about the optimiser's state i.e the generation number, standard deviation etc.
+        Additionally, the mutate_params will be supplied to each gene's mutate function. This could include the
+        information about the optimiser's state i.e the generation number, standard deviation etc. Only the
+        parameters a gene's mutate function declares (or all of them, if it takes **kwargs) are passed to it.
         :param p_gene_mutate:
         Probability that a single gene is mutated.
         :param p_total_mutate:
@@ -121,13 +252,17 @@ class Chromosome:
         for gene in self.full_genotype:
             if np.random.random() <= p_gene_mutate:
                 logging.debug("Gene Mutating: " + str(self.uuid) + " Fitness: " + str(self.fitness))
-                gene.mutate(**mutate_params)
+                gene.mutate(**filter_params(gene.mutate, mutate_params))
                 self.reset_fitness()
 
     def reset_fitness(self):
         """ Set the fitness back to it's default value."""
         self.set_unique_id()
         self.fitness = None
+        self.objectives = None
+        self.log_text = None
+        self.usage = None
+        self.replicates = None
 
     def get_fitness(self):
         """ Get the 'value' of this chromosome. """
@@ -163,7 +298,13 @@ class Chromosome:
 
 
 class AbstractGene(ABC):
-    """ This is the base class for Genes. It can be used to create Genes that have a requirement of implementation."""
+    """
+    This is the base class for Genes. It can be used to create Genes that have a requirement of implementation.
+    Chromosome.mutate resets the chromosome's fitness itself, so a gene doesn't need to keep a reference to its
+    chromosome. As this base class has no instance dictionary, subclasses may declare __slots__ to stay compact.
+    """
+    __slots__ = ()
+
     @abstractmethod
     def mutate(self):
         pass
@@ -175,3 +316,16 @@ class AbstractGene(ABC):
     @abstractmethod
     def __str__(self):
         pass
+
+    def set_float(self, value):
+        """
+        Set this gene from a float, for engines which search the genes' float values directly. Genes used with them
+        must override this, clipping or rounding the value into what the gene allows.
+        """
+        raise NotImplementedError(type(self).__name__ + " can't be set from a float value.")
+
+
+def genes_without_set_float(chromosome):
+    """ Get the names of the types of a chromosome's genes which don't override AbstractGene.set_float."""
+    return sorted(set(type(gene).__name__ for gene in chromosome.full_genotype
+                      if getattr(type(gene), 'set_float', AbstractGene.set_float) is AbstractGene.set_float))
@@ -0,0 +1,58 @@
+"""
+A compact per-epoch record of the optimiser's population statistics.
+
+Values are kept in a single pre-allocated NumPy array which grows geometrically, so appending an epoch is cheap and
+every field can be read back as an array view without copying.
+"""
+
+import numpy as np
+
+
+class FitnessHistory:
+    FIELDS = ('best', 'mean', 'std_dev', 'diversity')
+
+    def __init__(self, capacity=64):
+        """
+        A store of the best, mean, dispersion and diversity values of every epoch run so far.
+        :param capacity:
+        The number of epochs to allocate space for up front. This is doubled whenever it is exceeded.
+        """
+        self._data = np.full((len(FitnessHistory.FIELDS), max(int(capacity), 1)), np.nan)
+        self._length = 0
+
+    def append(self, best, mean, std_dev, diversity):
+        """ Record the statistics of a single epoch."""
+        if self._length == self._data.shape[1]:
+            grown = np.full((self._data.shape[0], self._data.shape[1] * 2), np.nan)
+            grown[:, :self._length] = self._data[:, :self._length]
+            self._data = grown
+
+        self._data[:, self._length] = (best, mean, std_dev, diversity)
+        self._length += 1
+
+    def field(self, name):
+        """ Get the recorded values of a single field as an array, oldest first."""
+        return self._data[FitnessHistory.FIELDS.index(name), :self._length]
+
+    @property
+    def best(self):
+        return self.field('best')
+
+    @property
+    def mean(self):
+        return self.field('mean')
+
+    @property
+    def std_dev(self):
+        return self.field('std_dev')
+
+    @property
+    def diversity(self):
+        return self.field('diversity')
+
+    def as_array(self):
+        """ Get every field as a (num_fields, num_epochs) array, in the order given by FIELDS."""
+        return self._data[:, :self._length]
+
+    def __len__(self):
+        return self._length
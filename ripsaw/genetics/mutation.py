@@ -0,0 +1,122 @@
+"""
+Mutation schedules which adapt the optimiser's mutation probabilities between epochs.
+
+A schedule is called with the optimiser and the evaluated chromosomes of the current epoch, once statistics for the
+epoch have been recorded, and returns the (p_gene_mutate, p_total_mutate) pair to mutate with.
+"""
+
+import logging
+import numpy as np
+
+
+def clip_rates(p_gene_mutate, p_total_mutate, min_p, max_p):
+    """ Keep a pair of mutation probabilities within bounds."""
+    return float(np.clip(p_gene_mutate, min_p, max_p)), float(np.clip(p_total_mutate, min_p, max_p))
+
+
+class OneFifthSuccessRule:
+    def __init__(self, factor=0.85, target_ratio=1/5, min_p=0.001, max_p=1.0):
+        """
+        Rechenberg's 1/5th success rule. If more than the target ratio of this epoch's new chromosomes were
+        successful, mutation is increased to explore further, otherwise it is decreased to exploit.
+        A new chromosome is counted as successful if it scored above the previous epoch's mean score.
+        :param factor:
+        The multiplicative step applied to both probabilities, between 0 and 1.
+        :param target_ratio:
+        The success ratio at which the mutation probabilities are left as they are.
+        :param min_p:
+        The lowest probability that either rate may take.
+        :param max_p:
+        The highest probability that either rate may take.
+        """
+        self.factor = factor
+        self.target_ratio = target_ratio
+        self.min_p = min_p
+        self.max_p = max_p
+        self.success_ratio = None
+
+    def __call__(self, optimiser, chromosomes):
+        if len(optimiser.history) < 2:
+            return optimiser.p_gene_mutate, optimiser.p_total_mutate
+
+        previous_mean = optimiser.history.mean[-2]
+        new_fitnesses = [chromosome.fitness for chromosome in chromosomes
+                         if chromosome.creation_epoch_number == optimiser.internal_dict["epoch_num"]]
+        if len(new_fitnesses) == 0:
+            return optimiser.p_gene_mutate, optimiser.p_total_mutate
+
+        self.success_ratio = np.count_nonzero(np.asarray(new_fitnesses) > previous_mean) / len(new_fitnesses)
+        logging.debug("1/5th rule success ratio: " + str(self.success_ratio))
+
+        if self.success_ratio > self.target_ratio:
+            step = 1 / self.factor
+        elif self.success_ratio < self.target_ratio:
+            step = self.factor
+        else:
+            step = 1
+
+        return clip_rates(optimiser.p_gene_mutate * step, optimiser.p_total_mutate * step, self.min_p, self.max_p)
+
+
+class DiversityTriggered:
+    def __init__(self, threshold, boost=2.0, max_p=1.0):
+        """
+        Raise mutation while the population's diversity is below a threshold, returning to the initial rates once
+        the population has recovered.
+        :param threshold:
+        The diversity below which mutation is boosted.
+        :param boost:
+        The multiplier applied to the initial probabilities while boosted.
+        :param max_p:
+        The highest probability that either rate may take.
+        """
+        self.threshold = threshold
+        self.boost = boost
+        self.max_p = max_p
+        self.initial_rates = None
+
+    def __call__(self, optimiser, chromosomes):
+        if self.initial_rates is None:
+            self.initial_rates = (optimiser.p_gene_mutate, optimiser.p_total_mutate)
+        p_gene_mutate, p_total_mutate = self.initial_rates
+
+        if optimiser.diversity < self.threshold:
+            logging.debug("Diversity " + str(optimiser.diversity) + " below threshold, boosting mutation.")
+            return clip_rates(p_gene_mutate * self.boost, p_total_mutate * self.boost, 0, self.max_p)
+
+        return p_gene_mutate, p_total_mutate
+
+
+class Annealing:
+    def __init__(self, final_p_gene_mutate, final_p_total_mutate, num_epochs, exponential=False):
+        """
+        Move mutation from the optimiser's initial probabilities to final ones over a number of epochs, after which
+        the final probabilities are kept.
+        :param final_p_gene_mutate:
+        The gene mutation probability to finish at.
+        :param final_p_total_mutate:
+        The total mutation probability to finish at.
+        :param num_epochs:
+        The number of epochs over which to anneal.
+        :param exponential:
+        Interpolate geometrically rather than linearly. Every probability involved must then be above zero.
+        """
+        self.final_rates = (final_p_gene_mutate, final_p_total_mutate)
+        self.num_epochs = num_epochs
+        self.exponential = exponential
+        self.initial_rates = None
+
+    def __call__(self, optimiser, chromosomes):
+        if self.initial_rates is None:
+            self.initial_rates = (optimiser.p_gene_mutate, optimiser.p_total_mutate)
+
+        progress = min((optimiser.internal_dict["epoch_num"] + 1) / self.num_epochs, 1.0)
+        initial = np.asarray(self.initial_rates, dtype=float)
+        final = np.asarray(self.final_rates, dtype=float)
+
+        if self.exponential:
+            rates = initial * (final / initial) ** progress
+        else:
+            rates = initial + (final - initial) * progress
+
+        return float(rates[0]), float(rates[1])
@@ -1,11 +1,24 @@
-from ripsaw.genetics.selection import roulette
+from ripsaw.genetics.selection import roulette, crowded_tournament
 from ripsaw.genetics.crossovers import point_crossover
-from ripsaw.genetics.genotype import Chromosome
+from ripsaw.genetics.genotype import Chromosome, EvaluationSetup, genes_without_set_float
+from ripsaw.genetics.history import FitnessHistory
+from ripsaw.genetics.batch import make_batches, concatenate_region_func, empty_log_func
+from ripsaw.genetics.pareto import nsga2_rank, ParetoArchive
+from ripsaw.genetics.diversity import METRICS, population_diversity, pairwise_distances, shared_fitness, \
+    crowding_replace
+from ripsaw.genetics.events import RunStarted, ChromosomeEvaluated, EpochFinished, RunFinished, ConsoleReporter, \
+    EventStream
 from ripsaw.util.logging import Logger
+from ripsaw.util.cleanup import release_workspace
+from ripsaw.util.usage import summarise_usage
+from ripsaw.util.affinity import CorePlacement
 
 import math
+import os
+import threading
 import time
 import logging
+import numpy as np
 import multiprocessing as mp
 from datetime import datetime
 
@@ -19,7 +32,13 @@ class Optimiser:
                  output_score_func, output_file_path,
                  output_log_func, output_log_file,
                  target_score=math.inf, num_epochs=math.inf, max_time=math.inf,
-                 population=list()):
+                 population=list(), stopping_criteria=(), mutation_schedule=None,
+                 batch_size=1, batch_score_func=None, batch_region_func=concatenate_region_func,
+                 batch_log_func=empty_log_func, evaluator=None, mp_start_method=None, scheduler=None,
+                 multi_objective=False, workspace_cleaner=None, diversity_metric='unique', sharing_radius=None,
+                 crowding_factor=None, eliminate_duplicates=False, fitness_cache=None, log_file=None,
+                 speculator=None, callbacks=(), verbose=True, engine=None, core_placement=None,
+                 replication=None, feasibility=None, archive=None, stages=None, pool_size=None):
 
         # Object parameterisation
         self.population_size = population_size
@@ -42,6 +61,60 @@ class Optimiser:
         self.num_epochs = num_epochs
         self.max_time = max_time
         self.population = population
+        self.stopping_criteria = stopping_criteria
+        self.mutation_schedule = mutation_schedule
+        self.batch_size = batch_size
+        self.batch_score_func = batch_score_func
+        self.batch_region_func = batch_region_func
+        self.batch_log_func = batch_log_func
+        self.evaluator = evaluator
+        self.mp_start_method = mp_start_method
+        self.scheduler = scheduler
+        self.multi_objective = multi_objective
+        self.workspace_cleaner = workspace_cleaner
+        self.diversity_metric = diversity_metric
+        self.sharing_radius = sharing_radius
+        self.crowding_factor = crowding_factor
+        self.eliminate_duplicates = eliminate_duplicates
+        self.fitness_cache = fitness_cache
+        self.log_file = log_file
+        self.speculator = speculator
+        self.engine = engine
+        self.core_placement = core_placement
+        self.replication = replication
+        self.feasibility = feasibility
+        self.archive = archive
+        self.stages = stages
+        self.pool_size = pool_size
+        self.callbacks = list(callbacks)
+        if verbose:
+            self.callbacks.append(ConsoleReporter())
+
+        if speculator is not None:
+            if scheduler is not None and scheduler is not speculator.scheduler or \
+                    fitness_cache is not None and fitness_cache is not speculator.fitness_cache:
+                raise ValueError("A speculator must share the optimiser's scheduler and fitness cache.")
+            self.scheduler = speculator.scheduler
+            self.fitness_cache = speculator.fitness_cache
+
+        if batch_size > 1 and batch_score_func is None:
+            raise ValueError("A batch_score_func is required to split scores out when batch_size is above 1.")
+        if replication is not None and (evaluator is not None or batch_size > 1 or self.fitness_cache is not None):
+            raise ValueError("Replicated evaluation runs the target program per replicate, so can't be used with an "
+                             "evaluator, batches or a fitness cache.")
+        if feasibility is not None and multi_objective and feasibility.penalty_objectives is None:
+            raise ValueError("With multi_objective, a feasibility stage needs penalty_objectives, one per objective.")
+        if engine is not None and multi_objective:
+            raise ValueError("Engines optimise a single objective, so can't be used with multi_objective.")
+        if engine is not None:
+            engine.check(self)
+        if engine is not None or feasibility is not None and feasibility.vectorised and feasibility.repair is not None:
+            unsupported = genes_without_set_float(Chromosome(chromosome_function=chromosome_function))
+            if unsupported:
+                raise ValueError("Engines and vectorised repairs set genes from float values, so every gene must "
+                                 "implement set_float, which " + ", ".join(unsupported) + " don't.")
+        if diversity_metric not in METRICS:
+            raise ValueError("Unknown diversity metric " + repr(diversity_metric) + ", expected one of " + str(METRICS))
 
         # Internal Fields
         self.epoch_number = None
@@ -49,15 +122,163 @@ class Optimiser:
         self.best_score = None
         self.mean_score = None
         self.std_dev_score = None
+        self.diversity = None
+        self.usage_summary = None
+        self.history = FitnessHistory()
+        self.pareto_archive = ParetoArchive()
+        self.front_uuids = set()
         self.internal_dict = {"epoch_num": 0}
+        self.stop_requested = False
+        self.callback_lock = threading.RLock()
 
     @staticmethod
     def evaluate(chromosome):
-        """ For the purposes of multiprocessing, this is a mapped function for a list of chromosomes."""
+        """ For the purposes of multiprocessing, this is a mapped function for a list of chromosomes (or batches)."""
         chromosome.evaluate()
 
         return chromosome
 
+    def pool(self):
+        """
+        Create the worker pool for parallel execution, using the configured multiprocessing start method.
+        With 'forkserver', workers are forked from a small server process rather than from this one, so they don't
+        inherit the population and launching target programs from them stays cheap. With a core placement, each
+        worker is pinned to a slot of its own. It has pool_size workers, or two fewer than the cores if that is None.
+        """
+        size = self.pool_size or max(int(mp.cpu_count())-2, 1)
+        context = mp.get_context(self.mp_start_method)
+        if self.mp_start_method == 'forkserver':
+            context.set_forkserver_preload(['ripsaw.genetics.genotype'])
+
+        if self.core_placement is not None:
+            return context.Pool(min(size, len(self.core_placement.slots)),
+                                initializer=CorePlacement.pin_worker,
+                                initargs=(self.core_placement, context.Value('i', 0)))
+
+        return context.Pool(size)
+
+    def evaluate_population(self, chromosomes):
+        """
+        Evaluate every set up chromosome which doesn't have a fitness, taking the results of genotypes already
+        evaluated from the fitness cache if one was supplied. With replication, replicates are raced over the whole
+        population, so chromosomes already evaluated may be given more. With a feasibility stage, infeasible
+        chromosomes are first repaired or given its penalty fitness, so are never dispatched.
+        """
+        if self.feasibility is not None:
+            for chromosome in self.feasibility.screen(chromosomes):
+                self.evaluated(chromosome)
+
+        if self.replication is not None:
+            return self.replication.evaluate_population(self, chromosomes)
+
+        if self.fitness_cache is not None:
+            return self.fitness_cache.evaluate_population(chromosomes, self.dispatch)
+
+        return self.dispatch(chromosomes)
+
+    def dispatch(self, chromosomes):
+        """
+        Evaluate every set up chromosome which doesn't have a fitness.
+        If an evaluator (such as a ServerPool) was supplied it is used, otherwise the target program is executed per
+        chromosome, or per batch if a batch size is set. Executions are run through the scheduler if one was
+        supplied, or else in a worker pool if parallel_exe is set.
+        """
+        if self.evaluator is not None:
+            pending = [chromosome for chromosome in chromosomes if chromosome.fitness is None]
+            chromosomes = self.evaluator.evaluate_population(chromosomes)
+            for chromosome in pending:
+                self.evaluated(chromosome)
+            return chromosomes
+
+        if self.batch_size > 1:
+            evaluated = [chromosome for chromosome in chromosomes if chromosome.fitness is not None]
+            to_evaluate = [chromosome for chromosome in chromosomes if chromosome.fitness is None]
+            tasks = make_batches(to_evaluate, self.batch_size, region_func=self.batch_region_func,
+                                 score_func=self.batch_score_func, log_func=self.batch_log_func)
+        else:
+            evaluated = list()
+            tasks = chromosomes
+
+        tasks = self.run_tasks(tasks, on_tail=self.speculate_callback(chromosomes), on_done=self.evaluated)
+
+        if self.batch_size > 1:
+            for batch in tasks:
+                evaluated.extend(batch.chromosomes)
+            return evaluated
+
+        return tasks
+
+    def run_tasks(self, tasks, on_tail=None, on_done=None):
+        """
+        Evaluate each task (a chromosome, batch or replicate) without a fitness, through the scheduler if one was
+        supplied, or else in a worker pool if parallel_exe is set, or else in turn.
+        :param on_tail: called as the scheduler reaches the tail of the tasks.
+        :param on_done: called with each task as soon as it has been evaluated.
+        :return: the tasks, evaluated. Worker pools return copies, in any order.
+        """
+        try:
+            if self.scheduler is not None:
+                self.scheduler.run([task for task in tasks if getattr(task, 'fitness', None) is None], client=self,
+                                   on_tail=on_tail, on_done=on_done)
+            elif self.parallel_exe:
+                to_evaluate = [task for task in tasks if getattr(task, 'fitness', None) is None]
+                tasks = [task for task in tasks if getattr(task, 'fitness', None) is not None]
+                with self.pool() as p:
+                    for task in p.imap_unordered(Optimiser.evaluate, to_evaluate):
+                        tasks.append(task)
+                        if on_done is not None:
+                            on_done(task)
+            else:
+                for task in tasks:
+                    if getattr(task, 'fitness', None) is None:
+                        task.evaluate()
+                        if on_done is not None:
+                            on_done(task)
+        finally:
+            for task in tasks:
+                release_workspace(task, self.workspace_cleaner)
+
+        return tasks
+
+    def speculate_callback(self, chromosomes):
+        """ The function starting speculation at the tail of an epoch's evaluation, or None without a speculator."""
+        if self.speculator is None:
+            return None
+
+        return lambda: self.speculator.start(self, chromosomes)
+
+    def subscribe(self, callback):
+        """ Call a function with every event of the optimiser's progress, such as each finished epoch."""
+        with self.callback_lock:
+            self.callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.callback_lock:
+            self.callbacks.remove(callback)
+
+    def emit(self, event):
+        """ Call every subscribed callback with an event, one at a time."""
+        with self.callback_lock:
+            for callback in list(self.callbacks):
+                callback(event)
+
+    def evaluated(self, task):
+        """ Emit the evaluation of a chromosome, or of each chromosome of a batch, as soon as it has finished."""
+        for chromosome in getattr(task, 'chromosomes', [task]):
+            self.emit(ChromosomeEvaluated(epoch_num=self.internal_dict["epoch_num"], chromosome=chromosome))
+
+    def events(self):
+        """
+        Run the optimiser in a background thread, iterating over the events of its progress as they happen, i.e.
+        for event in optimiser.events(), or async for in a coroutine.
+        :return: an EventStream, which stops the run when closed.
+        """
+        return EventStream(self)
+
+    def stop(self):
+        """ Ask a running optimiser to stop once its current epoch is done."""
+        self.stop_requested = True
+
     @staticmethod
     def sort_chromosome_key(chromosome):
         """ Designed to put None before lowest fitness. None at the end was interfering with immortal logic on sort."""
@@ -81,8 +302,153 @@ class Optimiser:
 
         return False
 
+    def custom_stopping_criteria_met(self):
+        """ Go through the supplied stopping criteria, each called with this optimiser. If any are met, return True."""
+        for criterion in self.stopping_criteria:
+            if criterion(self):
+                return True
+
+        return False
+
+    def mutate_params(self):
+        """ The optimiser state which is forwarded to gene mutate functions that accept it."""
+        return {"epoch_num": self.internal_dict["epoch_num"],
+                "best_score": self.best_score,
+                "mean_score": self.mean_score,
+                "std_dev": self.std_dev_score,
+                "diversity": self.diversity}
+
+    def replace_duplicates(self, chromosomes, max_attempts=10):
+        """
+        Replace chromosomes which repeat another's genotype with new random ones, so no genotype is evaluated twice.
+        Evaluated chromosomes are kept in preference to unevaluated ones.
+        :param max_attempts: the most new chromosomes to generate in place of each duplicate before keeping it anyway.
+        """
+        seen = set(chromosome.uuid for chromosome in chromosomes if chromosome.fitness is not None)
+        replaced = 0
+        result = [chromosome for chromosome in chromosomes if chromosome.fitness is not None]
+
+        for chromosome in chromosomes:
+            if chromosome.fitness is not None:
+                continue
+            for _ in range(max_attempts):
+                if chromosome.uuid not in seen:
+                    break
+                chromosome = Chromosome(chromosome_function=self.chromosome_function)
+                replaced += 1
+            seen.add(chromosome.uuid)
+            result.append(chromosome)
+
+        logging.debug("Replaced duplicate chromosomes: " + str(replaced))
+        return result
+
+    def single_objective_selection(self, chromosomes):
+        """ Select parents by roulette, weighted by shared fitness if a sharing radius was supplied."""
+        fitnesses = None
+        if self.sharing_radius is not None:
+            fitnesses = shared_fitness([chromosome.fitness for chromosome in chromosomes],
+                                       pairwise_distances(chromosomes, self.diversity_metric), self.sharing_radius)
+
+        return roulette(population=chromosomes, num_samples=self.num_xovers, fitnesses=fitnesses)
+
+    def replace_with_offspring(self, chromosomes, offspring):
+        """
+        Make room for the offspring in the population, which is sorted weakest first. By default the weakest are
+        culled, or with a crowding factor each offspring replaces the most similar of a sample of the population.
+        """
+        if not self.crowding_factor:
+            return chromosomes[len(offspring):] + offspring
+
+        protected = [i for i, chromosome in enumerate(chromosomes) if self.is_immortal(chromosome)]
+        max_protected = len(chromosomes) - len(offspring)
+        if len(protected) > max_protected:
+            protected = protected[len(protected) - max_protected:]  # The strongest, as the population is sorted.
+
+        return crowding_replace(chromosomes, offspring, self.crowding_factor, protected)
+
+    def multi_objective_selection(self, chromosomes):
+        """
+        Rank the population by non-dominated front and crowding distance (NSGA-II), update the Pareto archive and
+        select parents by crowded tournament.
+        :return: the chromosomes sorted weakest first, and the selected parents.
+        """
+        ranks, crowding = nsga2_rank(np.asarray([chromosome.objectives for chromosome in chromosomes], dtype=float))
+        order = np.lexsort((crowding, -ranks))
+
+        chromosomes = [chromosomes[i] for i in order]
+        ranks, crowding = ranks[order], crowding[order]
+        self.front_uuids = set(chromosome.uuid for chromosome, rank in zip(chromosomes, ranks) if rank == 0)
+        self.pareto_archive.update([chromosome for chromosome, rank in zip(chromosomes, ranks) if rank == 0])
+        logging.debug("Pareto front size: " + str(len(self.front_uuids)) +
+                      " Archive size: " + str(len(self.pareto_archive)))
+
+        selection = crowded_tournament(population=chromosomes, num_samples=self.num_xovers,
+                                       ranks=ranks, crowding=crowding)
+
+        return chromosomes, selection
+
+    def evaluate_setup_population(self, chromosomes):
+        """ Set up every chromosome for this epoch's evaluation, then evaluate those without a fitness."""
+        evaluation_setup = EvaluationSetup(self.cwd, self.exe_file_path, self.target_dir_path,
+                                           self.input_file_path, self.region_identifier,
+                                           self.output_score_func, self.output_file_path,
+                                           self.output_log_func, self.output_log_file,
+                                           self.internal_dict, defer_cleanup=self.workspace_cleaner is not None,
+                                           launcher=self.core_placement, stages=self.stages)
+        for chromosome in chromosomes:
+            chromosome.use_setup(evaluation_setup, self.internal_dict)
+
+        return self.evaluate_population(chromosomes)
+
+    def log_evaluations(self, chromosomes):
+        """
+        Summarise the resource usage of this epoch's evaluations and write every chromosome to the log, and to the
+        archive if one was supplied.
+        """
+        self.usage_summary = summarise_usage([chromosome.usage for chromosome in chromosomes])
+        if self.usage_summary is not None:
+            logging.info("Epoch resource usage: " + str(self.usage_summary))
+            if hasattr(self.scheduler, 'record_usage'):
+                self.scheduler.record_usage(self.usage_summary)
+
+        if self.archive is not None:
+            self.archive.append_population(self.internal_dict["epoch_num"], chromosomes)
+
+        for chromosome in chromosomes:
+            self.logger.log_text(str(self.internal_dict["epoch_num"]) + "," + chromosome.get_log_text())
+            chromosome.release_log()
+
+    def record_statistics(self, chromosomes):
+        """ Record the best, mean, deviation and diversity of the population's scores for this epoch."""
+        scores = [chromosome.get_fitness() for chromosome in chromosomes]
+        self.best_score = max(scores)
+        self.mean_score = sum(scores) / len(scores)
+        self.std_dev_score = sum([abs(self.mean_score - score) for score in scores]) / len(scores)
+        self.diversity = population_diversity(chromosomes, self.diversity_metric)
+        self.history.append(best=self.best_score, mean=self.mean_score,
+                            std_dev=self.std_dev_score, diversity=self.diversity)
+
+    def engine_epoch(self, chromosomes):
+        """ An epoch of the engine in place of crossover and mutation: ask it what to evaluate, then tell it."""
+        chromosomes = self.evaluate_setup_population(self.engine.ask(self, chromosomes))
+        self.log_evaluations(chromosomes)
+
+        chromosomes = self.engine.tell(self, chromosomes)
+        self.record_statistics(chromosomes)
+
+        return chromosomes
+
+    def is_immortal(self, chromosome):
+        """ Whether a chromosome is protected from mutation: the best, or any on the Pareto front if multi-objective."""
+        if self.multi_objective:
+            return chromosome.fitness is not None and chromosome.uuid in self.front_uuids
+
+        return chromosome.fitness == self.best_score
+
     def epoch(self, chromosomes=list()):
         """ Going through the Evaluate -> Selection -> Crossover -> Mutation process once as an epoch."""
+        if self.engine is not None:
+            return self.engine_epoch(chromosomes)
 
         logging.debug("At start of epoch - Chromo fitness in order:" +
                       str([chromosome.fitness for chromosome in chromosomes]))
@@ -93,44 +459,35 @@ class Optimiser:
         for _ in range(to_generate):
             chromosomes.append(Chromosome(chromosome_function=self.chromosome_function))
 
+        if self.eliminate_duplicates:
+            chromosomes = self.replace_duplicates(chromosomes)
+
         # 2. Evaluate every chromosome which doesn't have a fitness.
-        for chromosome in chromosomes:
-            chromosome.setup(self.cwd, self.exe_file_path, self.target_dir_path,
-                             self.input_file_path, self.region_identifier,
-                             self.output_score_func, self.output_file_path,
-                             self.output_log_func, self.output_log_file,
-                             self.internal_dict
-                             )
-
-        if self.parallel_exe:
-            with mp.Pool(int(mp.cpu_count())-2) as p:
-                chromosomes = p.map(Optimiser.evaluate, chromosomes)
-        else:
-            for chromosome in chromosomes:
-                chromosome.evaluate()
+        chromosomes = self.evaluate_setup_population(chromosomes)
 
         # 3. Logging
-        for chromosome in chromosomes:
-            optimiser_log = [self.internal_dict["epoch_num"]]
-            optimiser_log.extend(chromosome.get_log_row())
-            self.logger.log_to_csv(optimiser_log)
+        self.log_evaluations(chromosomes)
 
         chromosomes.sort(key=Optimiser.sort_chromosome_key)
         logging.debug("Before Crossover - Chromo fitness in order:" +
                       str([chromosome.fitness for chromosome in chromosomes]))
 
-        scores = [chromosome.get_fitness() for chromosome in chromosomes]
-        self.best_score = max(scores)
-        self.mean_score = sum([chromosome.get_fitness() for chromosome in chromosomes]) / self.population_size
-        self.std_dev_score = sum([abs(self.mean_score - score) for score in scores]) / self.population_size
+        self.record_statistics(chromosomes)
+
+        if self.mutation_schedule:
+            self.p_gene_mutate, self.p_total_mutate = self.mutation_schedule(self, chromosomes)
+            logging.debug("Mutation probabilities - gene: " + str(self.p_gene_mutate) +
+                          " total: " + str(self.p_total_mutate))
 
         # 4. Crossovers
-        selection = roulette(population=chromosomes, num_samples=self.num_xovers)
+        if self.multi_objective:
+            chromosomes, selection = self.multi_objective_selection(chromosomes)
+        else:
+            selection = self.single_objective_selection(chromosomes)
 
         offspring = point_crossover(chromosomes=selection, num_points=self.num_xover_points)
 
-        chromosomes = chromosomes[len(offspring):]  # Cull the weakest.
-        chromosomes.extend(offspring)
+        chromosomes = self.replace_with_offspring(chromosomes, offspring)
 
         # 5. Mutate
         chromosomes.sort(key=Optimiser.sort_chromosome_key)
@@ -138,36 +495,44 @@ class Optimiser:
                       str([chromosome.fitness for chromosome in chromosomes]))
 
         for i, chromosome in enumerate(chromosomes):
-            if chromosome.fitness != self.best_score:  # The minus one offset is to protect the immortal.
+            if not self.is_immortal(chromosome):
                 chromosome.mutate(p_gene_mutate=self.p_gene_mutate,
-                                  p_total_mutate=self.p_total_mutate)
+                                  p_total_mutate=self.p_total_mutate,
+                                  **self.mutate_params())
             else:
                 logging.debug("Immortal protected, fitness:" + str(chromosomes[i].get_fitness()))
 
         return chromosomes
 
     def run(self):
-        """ In Charge of running epochs until a stopping criteria is met."""
+        """ In Charge of running epochs until a stopping criteria is met, emitting events of its progress."""
 
         self.best_score = -math.inf
+        self.stop_requested = False
         start_time_s = time.time()
-        start_time_dt = datetime.now()
+        self.logger = Logger(target_file=self.log_file)
 
-        start_time_hhmmss = start_time_dt.strftime("%H:%M:%S")
-        self.logger = Logger()
+        if self.workspace_cleaner is not None:
+            self.workspace_cleaner.sweep_orphans(os.path.dirname(os.path.abspath(self.target_dir_path)))
 
-        print("Starting the optimiser...")
-        print("\tStart Time: ", start_time_hhmmss)
+        self.emit(RunStarted(start_time=datetime.now()))
         while Optimiser.stopping_criteria_met(start_time=start_time_s, max_time=self.max_time,
                                               current_epoch=self.internal_dict["epoch_num"], max_epochs=self.num_epochs,
-                                              best_score=self.best_score, target_score=self.target_score) is not True:
+                                              best_score=self.best_score, target_score=self.target_score) is not True \
+                and self.custom_stopping_criteria_met() is not True and not self.stop_requested:
 
             self.population = self.epoch(chromosomes=self.population)
             self.internal_dict["epoch_num"] += 1
-            current_time_dt = datetime.now()
 
-            print("Epoch", str(self.internal_dict["epoch_num"]), "done.")
-            print("\tBest score: ", self.best_score)
-            print("\tAverage Score: ", self.mean_score)
-            print("\tStandard Deviation: ", self.std_dev_score)
-            print("\tTime elapsed: ", current_time_dt - start_time_dt)
+            self.emit(EpochFinished(epoch_num=self.internal_dict["epoch_num"], best_score=self.best_score,
+                                    mean_score=self.mean_score, std_dev_score=self.std_dev_score,
+                                    diversity=self.diversity, usage_summary=self.usage_summary,
+                                    elapsed=time.time() - start_time_s))
+
+        if self.speculator is not None:
+            self.speculator.cancel()
+        if self.archive is not None:
+            self.archive.flush()
+
+        self.emit(RunFinished(epoch_num=self.internal_dict["epoch_num"], best_score=self.best_score,
+                              elapsed=time.time() - start_time_s))
@@ -0,0 +1,130 @@
+"""
+Multi-objective ranking in the style of NSGA-II.
+
+Objectives are given as an (N, M) array of N chromosomes' M objective values, where every objective is maximised in
+keeping with fitness. Negate an objective in its output function to minimise it instead.
+"""
+
+import copy
+import numpy as np
+
+# The most elements of the (rows, N, M) comparison arrays built at once when finding dominations.
+CHUNK_ELEMENTS = 2 ** 22
+
+
+def domination_matrix(objectives):
+    """
+    Find which points dominate which: the result's [i, j] is True if point i is no worse than point j in every
+    objective and better in at least one. The comparison is built in chunks of rows to bound its memory.
+    :param objectives: an (N, M) array of objective values.
+    :return: an (N, N) boolean array.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    num_points = objectives.shape[0]
+    chunk = max(CHUNK_ELEMENTS // max(objectives.size, 1), 1)
+
+    dominates = np.empty((num_points, num_points), dtype=bool)
+    for start in range(0, num_points, chunk):
+        rows = objectives[start:start + chunk, None, :]
+        dominates[start:start + chunk] = ((rows >= objectives[None, :, :]).all(axis=2) &
+                                          (rows > objectives[None, :, :]).any(axis=2))
+
+    return dominates
+
+
+def fast_non_dominated_sort(objectives):
+    """
+    Rank points into successive non-dominated fronts, as in Deb et al.'s fast non-dominated sort.
+    :param objectives: an (N, M) array of objective values.
+    :return: an array of N ranks, where rank 0 is the Pareto front.
+    """
+    dominates = domination_matrix(objectives)
+    domination_count = dominates.sum(axis=0)
+    ranks = np.full(dominates.shape[0], -1, dtype=int)
+
+    rank = 0
+    front = np.flatnonzero(domination_count == 0)
+    while front.size:
+        ranks[front] = rank
+        domination_count = domination_count - dominates[front].sum(axis=0)
+        domination_count[ranks >= 0] = -1
+        front = np.flatnonzero(domination_count == 0)
+        rank += 1
+
+    return ranks
+
+
+def crowding_distance(objectives):
+    """
+    Find the crowding distance of every point within a single front. Points at the extremes of any objective get an
+    infinite distance so they are always preferred.
+    :param objectives: an (N, M) array of objective values of one front.
+    :return: an array of N crowding distances.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    num_points = objectives.shape[0]
+    if num_points <= 2:
+        return np.full(num_points, np.inf)
+
+    order = np.argsort(objectives, axis=0)
+    ordered = np.take_along_axis(objectives, order, axis=0)
+    span = ordered[-1] - ordered[0]
+    span[span == 0] = np.inf
+
+    distances = np.zeros_like(objectives)
+    np.put_along_axis(distances, order[1:-1], (ordered[2:] - ordered[:-2]) / span, axis=0)
+    np.put_along_axis(distances, order[[0, -1]], np.inf, axis=0)
+
+    return distances.sum(axis=1)
+
+
+def nsga2_rank(objectives):
+    """
+    Rank points by non-dominated front and by crowding distance within each front.
+    :param objectives: an (N, M) array of objective values.
+    :return: an array of N ranks and an array of N crowding distances.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    ranks = fast_non_dominated_sort(objectives)
+    crowding = np.zeros(len(ranks))
+
+    for rank in range(ranks.max() + 1 if len(ranks) else 0):
+        front = np.flatnonzero(ranks == rank)
+        crowding[front] = crowding_distance(objectives[front])
+
+    return ranks, crowding
+
+
+class ParetoArchive:
+    def __init__(self):
+        """ The non-dominated chromosomes found over every epoch of a run."""
+        self.members = list()
+
+    def objectives(self):
+        """ Get the archive members' objectives as an (N, M) array."""
+        return np.asarray([member.objectives for member in self.members], dtype=float)
+
+    def update(self, chromosomes):
+        """
+        Add any chromosomes which are not dominated by the archive, and drop members they dominate.
+        Chromosomes are copied in, so later mutation of the population doesn't change the archive.
+        :param chromosomes: a list of evaluated chromosomes.
+        """
+        known = set(member.uuid for member in self.members)
+        candidates = list()
+        for chromosome in chromosomes:
+            if chromosome.uuid not in known:
+                known.add(chromosome.uuid)
+                candidates.append(chromosome)
+
+        if not candidates:
+            return
+
+        pool = self.members + candidates
+        ranks = fast_non_dominated_sort([member.objectives for member in pool])
+        archive_size = len(self.members)
+        self.members = [member if i < archive_size else copy.deepcopy(member)
+                        for i, member in enumerate(pool) if ranks[i] == 0]
+
+    def __len__(self):
+        return len(self.members)
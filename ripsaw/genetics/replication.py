@@ -0,0 +1,188 @@
+"""
+Replicated evaluation of stochastic targets, with racing.
+
+A stochastic target scores a genotype differently on every run, so a single lucky run can make a chromosome the
+immortal elite for good. With a Replication supplied as the optimiser's replication, each genotype is run several
+times, each run (a replicate) with its own seed written into a region of the input file, and its fitness is the mean
+over its replicates. Replicate i of every genotype has the same seed, so genotypes are compared on common seeds.
+
+Rather than spend a fixed number of replicates on every genotype, evaluation is raced: every genotype is given
+min_replicates, then, round after round, a further replicate is given only to those whose confidence interval on the
+mean still overlaps the boundary of the elite, i.e. which are neither clearly among the elite_size best nor clearly
+outside them, up to max_replicates. Genotypes evaluated in earlier epochs take part again, so an elite which was lucky
+gets the replicates to show it. The replicates of each round are run together, through the optimiser's scheduler or
+worker pool as chromosomes are.
+
+The number of replicates and the half width of the confidence interval are appended to each chromosome's user log.
+"""
+
+import math
+import statistics
+
+import numpy as np
+
+from ripsaw.local_env_wrapper import LocalEnvWrapper
+from ripsaw.util.usage import ProcessUsage
+
+
+def t_quantile(p, df):
+    """ The quantile p of Student's t distribution: exact for 1 or 2 degrees of freedom, else by Cornish-Fisher."""
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = statistics.NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def confidence_interval(values, confidence=0.95):
+    """ Get the mean of some values and the half width of its confidence interval, which is infinite for one value."""
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return mean, math.inf
+
+    return mean, t_quantile((1 + confidence) / 2, len(values) - 1) * float(np.std(values, ddof=1)) / \
+        math.sqrt(len(values))
+
+
+class Replicate:
+    __slots__ = ('chromosome', 'candidate', 'seed', 'seed_region', 'objectives', 'user_output_log', 'usage',
+                 'workspace')
+
+    def __init__(self, chromosome, candidate, seed, seed_region):
+        """
+        One run of a chromosome's genotype with a seed, evaluated as a chromosome is.
+        :param candidate: the position of the chromosome among those being raced.
+        :param seed_region: the region identifier of the input file to write the seed in.
+        """
+        self.chromosome = chromosome
+        self.candidate = candidate
+        self.seed = seed
+        self.seed_region = seed_region
+        self.objectives = None
+        self.user_output_log = None
+        self.usage = None
+        self.workspace = None
+
+    def evaluate(self):
+        """ Run the target program with the chromosome's genotype and this seed, keeping the objectives and log."""
+        setup = self.chromosome.evaluation_setup
+        wrapper = LocalEnvWrapper(folder=setup.target_dir, delete_files=not setup.defer_cleanup,
+                                  launcher=setup.launcher)
+        failed = True
+        try:
+            genotype_dict = self.chromosome.genotype_dict
+            for file in genotype_dict['files']:
+                file['region_value'][self.seed_region] = self.seed
+            wrapper.set_input_files(genotype_setup=genotype_dict)
+            exit_codes = wrapper.execute(execution_dict=setup.execute_dict)
+            self.usage = wrapper.usage()
+
+            self.objectives = list(wrapper.get_output_objectives(get_output_dict=setup.output_dict))
+            self.user_output_log = wrapper.get_log_row(log_dict=setup.log_dict)
+            failed = any(exit_codes)
+        finally:
+            if setup.defer_cleanup:
+                self.workspace = (wrapper.folder, failed)
+            else:
+                wrapper.close()
+
+
+class Replication:
+    def __init__(self, seed_region, min_replicates=2, max_replicates=10, elite_size=1, confidence=0.95, base_seed=0):
+        """
+        Replicated evaluation with racing. Supply it to the optimiser as its replication.
+        :param seed_region: the region identifier, in the template's input file, which is replaced by each seed.
+        :param min_replicates: the number of replicates every genotype is given, at least 2 as racing compares
+        confidence intervals, which a single replicate doesn't bound.
+        :param max_replicates: the most replicates any genotype is given.
+        :param elite_size: the number of best genotypes racing separates from the rest.
+        :param confidence: the confidence level of the intervals racing compares.
+        :param base_seed: the seed of every genotype's first replicate, replicate i having base_seed + i.
+        """
+        if not 2 <= min_replicates <= max_replicates:
+            raise ValueError("min_replicates must be at least 2, for a confidence interval, and no more than "
+                             "max_replicates.")
+
+        self.seed_region = seed_region
+        self.min_replicates = min_replicates
+        self.max_replicates = max_replicates
+        self.elite_size = elite_size
+        self.confidence = confidence
+        self.base_seed = base_seed
+
+    def interval(self, chromosome):
+        """ The mean fitness of a chromosome's replicates and its half width, which is 0 if it has no replicates."""
+        if not chromosome.replicates:
+            return chromosome.fitness, 0.0
+
+        return confidence_interval([sum(objectives) for objectives in chromosome.replicates], self.confidence)
+
+    def undecided(self, chromosomes):
+        """
+        Get the chromosomes which may yet be given a replicate, as racing can't yet place them in or out of the elite:
+        their interval reaches above the elite_size-th best lower bound and below the next best upper bound.
+        """
+        if len(chromosomes) <= self.elite_size:
+            return list()
+
+        intervals = [self.interval(chromosome) for chromosome in chromosomes]
+        lowers = sorted((mean - half_width for mean, half_width in intervals), reverse=True)
+        uppers = sorted((mean + half_width for mean, half_width in intervals), reverse=True)
+        elite_lower, rest_upper = lowers[self.elite_size - 1], uppers[self.elite_size]
+
+        return [chromosome for chromosome, (mean, half_width) in zip(chromosomes, intervals)
+                if chromosome.replicates is not None and len(chromosome.replicates) < self.max_replicates and
+                mean + half_width > elite_lower and mean - half_width < rest_upper]
+
+    def replicates_for(self, chromosomes, candidates, count=None):
+        """ Make the next replicates of some chromosomes, up to count replicates each, or one more each if None."""
+        return [Replicate(chromosome, candidates[id(chromosome)], self.base_seed + i, self.seed_region)
+                for chromosome in chromosomes
+                for i in range(len(chromosome.replicates), count or len(chromosome.replicates) + 1)]
+
+    def set_result(self, chromosome, replicates):
+        """ Set a chromosome's result from the mean of its replicates, with this epoch's replicates' usage."""
+        objectives = np.mean(chromosome.replicates, axis=0).tolist()
+        mean, half_width = self.interval(chromosome)
+        chromosome.usage = ProcessUsage.combine(replicate.usage for replicate in replicates
+                                                if replicate.usage is not None)
+        chromosome.set_result(fitness=mean, objectives=objectives,
+                              user_output_log=list(replicates[0].user_output_log) +
+                              [len(chromosome.replicates), half_width])
+
+    def evaluate_population(self, optimiser, chromosomes):
+        """
+        Evaluate every chromosome without a fitness by racing its replicates against the rest of the population,
+        running each round's replicates through the optimiser.
+        :return: the chromosomes, with their results set.
+        """
+        pending = [chromosome for chromosome in chromosomes if chromosome.fitness is None]
+        for chromosome in pending:
+            chromosome.replicates = list()
+        candidates = {id(chromosome): i for i, chromosome in enumerate(chromosomes)}
+        finished = dict()
+
+        tasks = self.replicates_for(pending, candidates, self.min_replicates)
+        while tasks:
+            done = optimiser.run_tasks(tasks)
+            done.sort(key=lambda replicate: (replicate.candidate, replicate.seed))
+            for replicate in done:
+                chromosome = chromosomes[replicate.candidate]
+                chromosome.replicates.append(replicate.objectives)
+                finished.setdefault(replicate.candidate, list()).append(replicate)
+            for candidate, replicates in finished.items():
+                self.set_result(chromosomes[candidate], replicates)
+
+            tasks = self.replicates_for(self.undecided(chromosomes), candidates)
+
+        for chromosome in pending:
+            optimiser.evaluated(chromosome)
+
+        return chromosomes
@@ -4,7 +4,7 @@ import sys
 import logging
 
 
-def roulette(population, num_samples, duplicates=False):
+def roulette(population, num_samples, duplicates=False, fitnesses=None):
     """
     Select a determined number of samples from the population, p(select) weighted by population fitness.
     :param population:
@@ -13,14 +13,16 @@ def roulette(population, num_samples, duplicates=False):
     The number of chromosomes to select
     :param duplicates:
     If duplicate chromosomes are permitted.
+    :param fitnesses:
+    The fitnesses to weight by in place of the chromosomes' own, i.e. shared fitnesses.
     :return population:
     List of selected chromosomes.
     """
-    min_fitness = min([chromosome.fitness for chromosome in population])
+    if fitnesses is None:
+        fitnesses = [chromosome.fitness for chromosome in population]
+    min_fitness = min(fitnesses)
     logging.debug("min fitness: " + str(min_fitness))
-    fitnesses = list()
-    for chromosome in population:
-        fitnesses.append(chromosome.fitness + abs(min_fitness) + sys.float_info.epsilon)
+    fitnesses = [fitness + abs(min_fitness) + sys.float_info.epsilon for fitness in fitnesses]
     total_fitness = sum(fitnesses)
 
     if total_fitness == 0:  # Avoid divide by zero
@@ -58,3 +60,41 @@ def uniform_random(population, num_samples, duplicates=False):
         returned_chromos.append(population[i])
 
     return returned_chromos
+
+
+def crowded_tournament(population, num_samples, ranks, crowding, duplicates=False):
+    """
+    Select a determined number of chromosomes by binary tournaments, as in NSGA-II. Of two chromosomes drawn at
+    random, the one on the better (lower) front wins, or if they share a front the one with the larger crowding
+    distance.
+    :param population:
+    A list of chromosomes.
+    :param num_samples:
+    The number of chromosomes to select
+    :param ranks:
+    The non-dominated front rank of every chromosome.
+    :param crowding:
+    The crowding distance of every chromosome.
+    :param duplicates:
+    If duplicate chromosomes are permitted.
+    :return:
+    List of selected chromosomes.
+    """
+    available = list(range(len(population)))
+    returned_chromos = list()
+
+    for _ in range(num_samples):
+        if len(available) == 1:
+            winner = available[0]
+        else:
+            a, b = npr.choice(a=available, size=2, replace=False)
+            if ranks[a] != ranks[b]:
+                winner = a if ranks[a] < ranks[b] else b
+            else:
+                winner = a if crowding[a] >= crowding[b] else b
+
+        returned_chromos.append(population[winner])
+        if not duplicates:
+            available.remove(winner)
+
+    return returned_chromos
@@ -0,0 +1,161 @@
+"""
+Speculative evaluation on idle capacity.
+
+Towards the end of an epoch's evaluation most of the scheduler's capacity sits idle while the last evaluations finish.
+A speculator fills it with likely members of the next generation - crossovers and mutants of the best chromosomes
+finished so far - and stores their results in the fitness cache, so if the next epoch produces one of those genotypes
+its result is already known. Speculative evaluations only take capacity nobody is waiting for, and are killed as soon
+as real work has to wait, so they never hold up the optimiser. Results of killed evaluations are discarded.
+"""
+
+import copy
+import logging
+import threading
+
+import numpy.random as npr
+
+from ripsaw.genetics.genotype import Chromosome
+from ripsaw.genetics.crossovers import point_crossover
+from ripsaw.util.launcher import CancellableLauncher
+
+
+class SpeculationRound:
+    def __init__(self):
+        """ The speculative work started at one epoch's tail, stopped by the next or cancelled outright."""
+        self.stopped = threading.Event()
+        self.launcher = CancellableLauncher()
+        self.running = 0
+
+
+class Speculator:
+    def __init__(self, scheduler, fitness_cache, num_elites=4, max_per_round=16, poll_interval=0.05,
+                 max_attempts=None):
+        """
+        A speculator filling a scheduler's idle capacity. Supply it to the optimiser as its speculator; the optimiser
+        then uses the speculator's scheduler and fitness cache.
+        :param scheduler: the ResourceScheduler the optimiser evaluates through.
+        :param fitness_cache: the FitnessCache to store speculative results in.
+        :param num_elites: the number of best chromosomes candidates are bred from.
+        :param max_per_round: the most speculative evaluations to start at each epoch's tail.
+        :param poll_interval: the seconds between checks of whether the round has been stopped while waiting.
+        :param max_attempts: the most candidates to breed at each epoch's tail, counting those skipped as already
+        cached or bred, so a converged population doesn't keep breeding. None for 10 times max_per_round.
+        """
+        self.scheduler = scheduler
+        self.fitness_cache = fitness_cache
+        self.num_elites = num_elites
+        self.max_per_round = max_per_round
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts if max_attempts is not None else 10 * max_per_round
+
+        self.rounds = list()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        scheduler.preemptors.append(self.cancel)
+
+    def candidates(self, optimiser, chromosomes):
+        """
+        Breed likely members of the next generation from the best chromosomes evaluated so far, alternating
+        crossovers and mutants of them. The population's genes are copied, never changed.
+        """
+        finished = [chromosome for chromosome in chromosomes if chromosome.fitness is not None]
+        elites = sorted(finished, key=lambda chromosome: chromosome.fitness)[-self.num_elites:]
+        if not elites:
+            return
+
+        while True:
+            if len(elites) > 1:
+                parents = [Chromosome(chromosome_function=parent.chromosome_function,
+                                      passed_genes=copy.deepcopy(parent.full_genotype))
+                           for parent in (elites[i] for i in npr.choice(len(elites), size=2, replace=False))]
+                yield from point_crossover(chromosomes=parents, num_points=optimiser.num_xover_points)
+
+            elite = elites[npr.randint(len(elites))]
+            mutant = Chromosome(chromosome_function=elite.chromosome_function,
+                                passed_genes=copy.deepcopy(elite.full_genotype))
+            mutant.mutate(p_gene_mutate=optimiser.p_gene_mutate, p_total_mutate=optimiser.p_total_mutate,
+                          **optimiser.mutate_params())
+            yield mutant
+
+    def start(self, optimiser, chromosomes):
+        """ Begin speculating at an epoch's tail, stopping the previous round from starting any more evaluations."""
+        self.stop()
+        speculation_round = SpeculationRound()
+        with self.lock:
+            self.rounds.append(speculation_round)
+        threading.Thread(target=self.run_round, args=(speculation_round, optimiser, chromosomes), daemon=True).start()
+
+    def run_round(self, speculation_round, optimiser, chromosomes):
+        try:
+            evaluation_setup = copy.copy(next(chromosome.evaluation_setup for chromosome in chromosomes
+                                              if chromosome.evaluation_setup is not None))
+        except StopIteration:
+            return
+        evaluation_setup.launcher = speculation_round.launcher
+        evaluation_setup.defer_cleanup = False
+        optimiser_dict = dict(optimiser.internal_dict)
+
+        num_started = 0
+        seen = set()
+        for num_attempts, candidate in enumerate(self.candidates(optimiser, chromosomes)):
+            if num_started >= self.max_per_round or num_attempts >= self.max_attempts or \
+                    speculation_round.stopped.is_set():
+                break
+            if candidate.uuid in self.fitness_cache or candidate.uuid in seen:
+                continue
+            seen.add(candidate.uuid)
+
+            while not self.scheduler.try_admit_speculative(timeout=self.poll_interval):
+                if speculation_round.stopped.is_set():
+                    return
+
+            candidate.use_setup(evaluation_setup, optimiser_dict)
+            with self.lock:
+                stopped = speculation_round.stopped.is_set()
+                if not stopped:
+                    speculation_round.running += 1
+                    self.started += 1
+            if stopped:
+                self.scheduler.release_speculative()  # Outside the lock, as preemption takes them the other way.
+                return
+            num_started += 1
+            threading.Thread(target=self.evaluate, args=(speculation_round, candidate), daemon=True).start()
+
+    def evaluate(self, speculation_round, candidate):
+        """ Evaluate one candidate into the fitness cache, unless it is cancelled along the way."""
+        try:
+            candidate.evaluate()
+            if not speculation_round.launcher.cancelled:
+                self.fitness_cache.put(candidate)
+                with self.lock:
+                    self.completed += 1
+        except Exception as e:
+            if not speculation_round.launcher.cancelled:
+                logging.debug("Speculative evaluation failed: " + repr(e))
+        finally:
+            self.scheduler.release_speculative()
+            with self.lock:
+                speculation_round.running -= 1
+                if speculation_round.launcher.cancelled:
+                    self.cancelled += 1
+                if speculation_round.running == 0 and speculation_round.stopped.is_set() and \
+                        speculation_round in self.rounds:
+                    self.rounds.remove(speculation_round)
+
+    def stop(self):
+        """ Stop starting speculative evaluations, letting those running finish."""
+        with self.lock:
+            for speculation_round in list(self.rounds):
+                speculation_round.stopped.set()
+                if speculation_round.running == 0:
+                    self.rounds.remove(speculation_round)
+
+    def cancel(self):
+        """ Stop starting speculative evaluations and kill those running, discarding their results."""
+        with self.lock:
+            rounds = list(self.rounds)
+        self.stop()
+        for speculation_round in rounds:
+            speculation_round.launcher.cancel()
@@ -0,0 +1,59 @@
+"""
+Stopping criteria which can be supplied to the optimiser.
+
+A stopping criterion is any callable which takes the optimiser and returns True when the run should stop. The classes
+here are built on the optimiser's fitness history; users may supply their own functions alongside them.
+"""
+
+import logging
+
+
+class Stagnation:
+    def __init__(self, window, epsilon=0.0):
+        """
+        Stop when the best score has not improved by more than epsilon over the last window epochs.
+        :param window:
+        The number of epochs to look back over.
+        :param epsilon:
+        The improvement in best score which must be exceeded for the run to be considered as progressing.
+        """
+        self.window = window
+        self.epsilon = epsilon
+
+    def __call__(self, optimiser):
+        best = optimiser.history.best
+        if len(best) <= self.window:
+            return False
+
+        improvement = best[-1] - best[-self.window - 1]
+        if improvement <= self.epsilon:
+            logging.info("Stagnation: best score improved by " + str(improvement) +
+                         " over " + str(self.window) + " epochs.")
+            return True
+
+        return False
+
+
+class DiversityCollapse:
+    def __init__(self, threshold, window=1):
+        """
+        Stop when the population diversity has been at or below a threshold for a number of consecutive epochs.
+        :param threshold:
+        The diversity value at or below which the population is considered collapsed.
+        :param window:
+        The number of consecutive epochs the diversity must stay collapsed for.
+        """
+        self.threshold = threshold
+        self.window = window
+
+    def __call__(self, optimiser):
+        diversity = optimiser.history.diversity
+        if len(diversity) < self.window:
+            return False
+
+        if (diversity[-self.window:] <= self.threshold).all():
+            logging.info("Diversity collapse: diversity at or below " + str(self.threshold) +
+                         " for " + str(self.window) + " epochs.")
+            return True
+
+        return False
@@ -0,0 +1,119 @@
+"""
+Concurrent parameter sweeps.
+
+Many optimiser configurations are run at once, each in a thread of this process, sharing one ResourceScheduler so they
+take fair turns of the machine's cores rather than fighting over them, and one FitnessCache so a genotype met by
+several configurations is only evaluated once. Every configuration must evaluate the same target.
+"""
+
+import copy
+import itertools
+import logging
+import os
+import threading
+import time
+
+from ripsaw.genetics.cache import FitnessCache
+from ripsaw.genetics.optimiser import Optimiser
+from ripsaw.util.scheduler import ResourceScheduler
+
+# Optimiser parameters holding per run state, which each configuration is given its own copy of.
+STATEFUL_PARAMETERS = ('mutation_schedule', 'stopping_criteria')
+
+
+def grid(**parameters):
+    """
+    Build every combination of parameter values, i.e. grid(population_size=[10, 20], p_gene_mutate=[0.1, 0.5]).
+    :return: a list of dictionaries of optimiser parameters.
+    """
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+
+def configuration_name(configuration):
+    return ",".join(name + "=" + str(value) for name, value in configuration.items())
+
+
+class Sweep:
+    def __init__(self, base_parameters, configurations, scheduler=None, fitness_cache=None, log_dir="."):
+        """
+        A runner of many optimiser configurations at once.
+        :param base_parameters: the optimiser parameters common to every configuration.
+        :param configurations: a list of dictionaries of the parameters which vary, overriding the base parameters.
+        :param scheduler: the scheduler shared by every configuration, or None for a ResourceScheduler of the machine.
+        :param fitness_cache: the cache shared by every configuration, or None for a new FitnessCache.
+        :param log_dir: the folder to write each configuration's log file into.
+        """
+        self.base_parameters = base_parameters
+        self.configurations = configurations
+        self.scheduler = scheduler if scheduler is not None else ResourceScheduler()
+        self.fitness_cache = fitness_cache if fitness_cache is not None else FitnessCache()
+        self.log_dir = log_dir
+        self.results = list()
+
+    def make_optimiser(self, index, configuration, start_time):
+        parameters = dict(self.base_parameters)
+        parameters.update(configuration)
+        for name in STATEFUL_PARAMETERS:
+            if name in parameters:
+                parameters[name] = copy.deepcopy(parameters[name])
+        parameters.update(population=list(), scheduler=self.scheduler, fitness_cache=self.fitness_cache,
+                          log_file=os.path.join(self.log_dir, "sweep_" + str(int(start_time)) + "_" +
+                                                str(index) + ".csv"))
+
+        return Optimiser(**parameters)
+
+    def run_configuration(self, index, configuration, start_time):
+        """ Run one configuration to completion, recording its result or the error it raised."""
+        result = self.results[index]
+        try:
+            optimiser = self.make_optimiser(index, configuration, start_time)
+            result['optimiser'] = optimiser
+            optimiser.run()
+            result.update(best_score=optimiser.best_score, mean_score=optimiser.mean_score,
+                          num_epochs=optimiser.internal_dict["epoch_num"], log_file=optimiser.log_file)
+        except Exception as e:
+            logging.exception("Sweep configuration " + result['name'] + " failed.")
+            result['error'] = repr(e)
+        finally:
+            result['time'] = time.time() - start_time
+
+    def run(self):
+        """
+        Run every configuration concurrently until each meets its stopping criteria.
+        :return: a list of result dictionaries in the order of the configurations, with the name, configuration,
+        best_score, mean_score, num_epochs, time, log_file and optimiser of each, or an error if it failed.
+        """
+        start_time = time.time()
+        self.results = [{'name': configuration_name(configuration), 'configuration': configuration,
+                         'best_score': None, 'mean_score': None, 'num_epochs': 0, 'error': None}
+                        for configuration in self.configurations]
+
+        threads = [threading.Thread(target=self.run_configuration, args=(index, configuration, start_time))
+                   for index, configuration in enumerate(self.configurations)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return self.results
+
+    def summary(self):
+        """ Compare the configurations' results as a table, best first, with the fitness cache's hit rate."""
+        ranked = sorted(self.results, key=lambda result: (result['best_score'] is None, -(result['best_score'] or 0)))
+        lines = ["{:>4}  {:>12}  {:>12}  {:>6}  {:>8}  {}".format("rank", "best", "mean", "epochs", "time s",
+                                                                  "configuration")]
+        for rank, result in enumerate(ranked, 1):
+            if result['error'] is not None:
+                lines.append("{:>4}  {:>12}  {:>12}  {:>6}  {:>8.1f}  {}  failed: {}".format(
+                    rank, "-", "-", result['num_epochs'], result['time'], result['name'], result['error']))
+            else:
+                lines.append("{:>4}  {:>12.6g}  {:>12.6g}  {:>6}  {:>8.1f}  {}".format(
+                    rank, result['best_score'], result['mean_score'], result['num_epochs'], result['time'],
+                    result['name']))
+
+        lookups = self.fitness_cache.hits + self.fitness_cache.misses
+        lines.append("Evaluations: " + str(self.fitness_cache.misses) + ", shared from cache: " +
+                     str(self.fitness_cache.hits) + " of " + str(lookups) + " lookups")
+
+        return "\n".join(lines)
@@ -4,15 +4,18 @@ The local environment wrapper.
 Execution is expected to be on a single, multi-core machine with no networking.
 """
 
-import subprocess
 import ripsaw.util.file
+from ripsaw.util.launcher import default_launcher
+from ripsaw.util.usage import ProcessUsage
 import os
 
 
 class LocalEnvWrapper:
-    def __init__(self, folder, use_uuid=True, delete_files=True):
+    def __init__(self, folder, use_uuid=True, delete_files=True, launcher=None):
         self.use_uuid = use_uuid
         self.delete_files = delete_files
+        self.launcher = launcher if launcher is not None else default_launcher()
+        self.usages = list()
 
         if use_uuid:
             self.folder = ripsaw.util.file.clone_directory_uuid(source=folder)
@@ -71,6 +74,23 @@ class LocalEnvWrapper:
 
         return score
 
+    def get_output_objectives(self, get_output_dict):
+        """
+        Open up a series of files and use a function on them, keeping each result as a separate objective.
+        :param get_output_dict: a dictionary of 'files'(see unit tests)
+        :return: a list of the scores of every function(file), in order. Functions may return a list of scores.
+        """
+        objectives = list()
+        for file in get_output_dict['files']:  # file contains 'URL':value for 'function':function
+            url = os.path.join(self.folder, file['URL'])
+            result = file['function'](url)
+            if isinstance(result, (list, tuple)):
+                objectives.extend(float(value) for value in result)
+            else:
+                objectives.append(float(result))
+
+        return objectives
+
     def get_log_row(self, log_dict):
         output_row = list()
 
@@ -80,12 +100,59 @@ class LocalEnvWrapper:
 
         return output_row
 
+    def get_batch_output_scores(self, get_output_dict, batch_size):
+        """
+        Open up a series of files and use a function on them which splits out a score for each member of a batch.
+        :param get_output_dict: a dictionary of 'files'(see unit tests), where each function takes (url, batch_size).
+        :param batch_size: the number of chromosomes that were rendered into the batch.
+        :return: a list of the sum of scores across every function(file), one per batch member.
+        """
+        scores = [float() for _ in range(batch_size)]
+        for file in get_output_dict['files']:
+            url = os.path.join(self.folder, file['URL'])
+            file_scores = file['function'](url, batch_size)
+            if len(file_scores) != batch_size:
+                raise ValueError("Expected " + str(batch_size) + " scores from " + url +
+                                 " but got " + str(len(file_scores)))
+            for i, score in enumerate(file_scores):
+                scores[i] += float(score)
+
+        return scores
+
+    def get_batch_log_rows(self, log_dict, batch_size):
+        """
+        Open up a series of files and use a function on them which splits out a log row for each member of a batch.
+        :param log_dict: a dictionary of 'files'(see unit tests), where each function takes (url, batch_size).
+        :param batch_size: the number of chromosomes that were rendered into the batch.
+        :return: a list of log rows, one per batch member.
+        """
+        output_rows = [list() for _ in range(batch_size)]
+        for file in log_dict['files']:
+            url = os.path.join(self.folder, file['URL'])
+            file_rows = file['function'](url, batch_size)
+            if len(file_rows) != batch_size:
+                raise ValueError("Expected " + str(batch_size) + " log rows from " + url +
+                                 " but got " + str(len(file_rows)))
+            for i, row in enumerate(file_rows):
+                output_rows[i].extend(row)
+
+        return output_rows
+
     def execute(self, execution_dict):
         """
-        Open up a series of programs via their executable URL.
+        Open up a series of programs via their executable URL. The resources each used are kept in usages.
+        A stage with a cache (see ripsaw.util.stages) whose inputs have been seen before isn't run, its outputs being
+        copied from the cache instead, and counts as exiting with 0.
         :param execution_dict:  a dictionary of 'files'(see unit tests)
+        :return: a list of the programs' exit codes.
         """
+        exit_codes = list()
         for file in execution_dict['files']:
+            key, restored = self.restore_stage(file)
+            if restored:
+                exit_codes.append(0)
+                continue
+
             url = os.path.join(self.folder, file['URL'])
             cwd = os.path.join(self.folder, file['cwd'])
 
@@ -99,22 +166,42 @@ class LocalEnvWrapper:
             #       "\n CWD:", cwd,
             #       "\n Output Supression: ", file['suppress_output'])
 
-            if file['as_admin'] is True:
-                execution_payload = ['sudo', url]
-            else:
-                execution_payload = url
-
-            if file['suppress_output']:
-                process = subprocess.Popen(execution_payload, cwd=cwd,
-                                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            else:
-                process = subprocess.Popen(execution_payload, cwd=cwd)
-            process.wait()
+            usage = self.launcher.run_measured(url, cwd=cwd, suppress_output=file['suppress_output'],
+                                               as_admin=file['as_admin'] is True)
+            self.usages.append(usage)
+            exit_codes.append(usage.exit_code)
+            self.store_stage(file, key, usage.exit_code)
 
             # input("Waiting..")
 
-    def __del__(self):
+        return exit_codes
+
+    def restore_stage(self, file):
+        """
+        Copy a stage's outputs into the folder from its cache, if it has one and its inputs have been seen before.
+        :return: the stage's cache key, or None if it has no cache, and whether its outputs were restored.
+        """
+        cache = file.get('cache')
+        key = cache.key(self.folder, file) if cache is not None else None
+
+        return key, key is not None and cache.restore(key, self.folder, file)
+
+    def store_stage(self, file, key, exit_code):
+        """ Cache a stage's outputs from the folder, if it has a cache and exited with 0."""
+        if key is not None and exit_code == 0:
+            file['cache'].store(key, self.folder, file)
+
+    def usage(self):
+        """ The combined ProcessUsage of every program executed, or None if none have been."""
+        return ProcessUsage.combine(self.usages)
+
+    def close(self):
+        """ Remove the cloned folder now, rather than when this wrapper is garbage collected."""
         if self.use_uuid and self.delete_files:
             ripsaw.util.file.wipe_directory(self.folder)
+            self.delete_files = False
+
+    def __del__(self):
+        self.close()
 
 
@@ -0,0 +1,202 @@
+"""
+The server environment wrapper.
+
+Rather than launching a fresh process for every evaluation, a fixed set of long-running target processes are kept
+alive and fed evaluations over their stdin and stdout.
+
+The protocol, one line in each direction per evaluation, is:
+    * Request: the rendered genotype encoded as a single line JSON string, i.e. "X\\n1.5\\nZ\\n-2.0\\n"
+    * Response: the score, optionally followed by tab separated log values, i.e. 1.25<TAB>some<TAB>log
+    * Health check: the request PING must be answered with the response PONG.
+
+A target should flush stdout after every response. Anything it writes to stderr is passed through.
+Processes that exit, fail to respond in time, give a response which can't be parsed or answer a health check
+incorrectly are restarted.
+"""
+
+import json
+import logging
+import queue
+import subprocess
+import threading
+
+
+class ServerProcess:
+    def __init__(self, args, cwd=None, env=None, timeout=None):
+        """
+        A single long-running target process.
+        :param args: the program and arguments to launch, as for subprocess.Popen.
+        :param cwd: the working directory of the process.
+        :param env: the environment of the process, or None to inherit this one.
+        :param timeout: the seconds to wait for a response before treating the process as failed, or None to wait.
+        """
+        self.args = args
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout
+        self.process = None
+        self.responses = None
+        self.restarts = -1
+
+    def start(self):
+        """ Launch the process, along with a thread which queues up every line it writes."""
+        self.process = subprocess.Popen(self.args, cwd=self.cwd, env=self.env, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, universal_newlines=True, bufsize=1)
+        self.responses = queue.Queue()
+        self.restarts += 1
+        reader = threading.Thread(target=ServerProcess.read_lines, args=(self.process.stdout, self.responses),
+                                  daemon=True)
+        reader.start()
+
+    @staticmethod
+    def read_lines(stream, responses):
+        """ Queue up every line from a stream, followed by None when it closes."""
+        for line in stream:
+            responses.put(line.rstrip("\n"))
+        responses.put(None)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def communicate(self, line):
+        """ Send a line and wait for a response line, raising RuntimeError if none comes."""
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+            response = self.responses.get(timeout=self.timeout)
+        except (OSError, ValueError, queue.Empty) as e:
+            raise RuntimeError("Server process " + str(self.args) + " failed to respond: " + repr(e))
+
+        if response is None:
+            raise RuntimeError("Server process " + str(self.args) + " exited with code " + str(self.process.wait()))
+
+        return response
+
+    def healthy(self):
+        """ Check the process is running and answers a health check."""
+        if not self.alive():
+            return False
+        try:
+            return self.communicate("PING") == "PONG"
+        except RuntimeError:
+            return False
+
+    def request(self, genotype):
+        """
+        Send a rendered genotype for evaluation.
+        :param genotype: the string value to evaluate.
+        :return: the score and a list of any log values.
+        """
+        response = self.communicate(json.dumps(genotype))
+        try:
+            tokens = response.split("\t")
+            return float(tokens[0]), tokens[1:]
+        except (ValueError, IndexError) as e:
+            raise RuntimeError("Server process " + str(self.args) + " gave an invalid response " + repr(response) +
+                               ": " + repr(e))
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def close(self):
+        if self.process is None:
+            return
+
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+class ServerPool:
+    def __init__(self, args, num_servers, cwd=None, env=None, timeout=None, render_func=str, max_retries=2):
+        """
+        A pool of server processes which evaluates chromosomes. Supply it to the optimiser as its evaluator.
+        :param args: the program and arguments to launch each server with, as for subprocess.Popen.
+        :param num_servers: the number of server processes to keep alive.
+        :param cwd: the working directory of the servers.
+        :param env: the environment of the servers, or None to inherit this one.
+        :param timeout: the seconds to wait for a response before the server is restarted, or None to wait.
+        :param render_func: a function rendering a chromosome into the string which is sent as a request.
+        :param max_retries: the number of times an evaluation is retried on a restarted server before giving up.
+        """
+        self.render_func = render_func
+        self.max_retries = max_retries
+        self.servers = [ServerProcess(args=args, cwd=cwd, env=env, timeout=timeout) for _ in range(num_servers)]
+
+        for server in self.servers:
+            server.start()
+
+    def health_check(self):
+        """ Restart any server which has died or doesn't answer a health check."""
+        for server in self.servers:
+            if not server.healthy():
+                logging.warning("Restarting unhealthy server process " + str(server.args))
+                server.restart()
+
+    def evaluate_chromosome(self, server, chromosome):
+        """ Evaluate a chromosome on a server, restarting it and retrying the request if it fails."""
+        genotype = self.render_func(chromosome)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                score, user_output_log = server.request(genotype)
+                chromosome.set_result(fitness=score, user_output_log=user_output_log)
+                return
+            except RuntimeError as e:
+                logging.warning(str(e) + " - restarting, attempt " + str(attempt + 1))
+                server.restart()
+
+        raise RuntimeError("Evaluation of chromosome " + str(chromosome.uuid) + " failed after " +
+                           str(self.max_retries + 1) + " attempts.")
+
+    def serve(self, server, tasks, errors):
+        """ Keep a server busy with tasks until there are none left, recording any error so the pool raises it."""
+        while not errors:
+            try:
+                chromosome = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.evaluate_chromosome(server, chromosome)
+            except Exception as e:
+                errors.append(e)
+
+    def evaluate_population(self, chromosomes):
+        """ Evaluate every chromosome which doesn't have a fitness, spread across the servers."""
+        self.health_check()
+
+        tasks = queue.Queue()
+        for chromosome in chromosomes:
+            if chromosome.fitness is None:
+                tasks.put(chromosome)
+
+        errors = list()
+        threads = [threading.Thread(target=self.serve, args=(server, tasks, errors)) for server in self.servers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return chromosomes
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
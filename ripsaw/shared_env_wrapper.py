@@ -0,0 +1,157 @@
+"""
+The shared memory environment wrapper.
+
+For targets cheap enough to be a Python fitness function, pickling every chromosome to a worker and back costs more
+than evaluating it. Here the numeric values of the population's genes, and their fitnesses, are kept in shared memory
+blocks which the optimiser and every worker map. Workers are sent ranges of row indices only, evaluate the fitness
+function on those rows of the gene array and write the results into the fitness array in place, so nothing of the
+population is copied per worker or per epoch. The blocks are reused between epochs, and grown when the population is.
+
+Every gene must have a float value and every chromosome the same number of genes. The fitness function must be
+picklable, i.e. defined at module level, as it is sent to each worker once when the pool starts.
+"""
+
+import math
+import multiprocessing as mp
+
+import numpy as np
+
+from ripsaw.genetics.diversity import numeric_matrix
+from ripsaw.util.shared import SharedArray
+
+# The worker side state: the fitness function, whether it is vectorised and the arrays attached so far by name.
+_worker = {'function': None, 'vectorised': False, 'arrays': dict()}
+
+
+def init_worker(fitness_function, vectorised):
+    _worker['function'] = fitness_function
+    _worker['vectorised'] = vectorised
+
+
+def attached(*specs):
+    """ Get a worker's mappings of shared arrays, unmapping any it held before which the optimiser has replaced."""
+    arrays = _worker['arrays']
+    names = [spec[0] for spec in specs]
+    for stale in [name for name in arrays if name not in names]:
+        arrays.pop(stale).close()
+    for spec in specs:
+        if spec[0] not in arrays:
+            arrays[spec[0]] = SharedArray.attach(spec)
+
+    return [arrays[name].array for name in names]
+
+
+def evaluate_block(fitness_function, vectorised, genes, fitness, start, stop):
+    """ Evaluate rows start to stop of a gene array, writing their scores into the same rows of a fitness array."""
+    if vectorised:
+        fitness[start:stop] = fitness_function(genes[start:stop])
+    else:
+        for row in range(start, stop):
+            fitness[row] = fitness_function(genes[row])
+
+
+def evaluate_rows(task):
+    """ The function mapped over the pool, with tasks of the gene and fitness arrays' specs and a range of rows."""
+    genes_spec, fitness_spec, start, stop = task
+    genes, fitness = attached(genes_spec, fitness_spec)
+    evaluate_block(_worker['function'], _worker['vectorised'], genes, fitness, start, stop)
+
+    return stop - start
+
+
+class SharedMemoryEvaluator:
+    def __init__(self, fitness_function, num_workers=None, vectorised=False, chunk_size=None, mp_start_method=None):
+        """
+        An evaluator scoring chromosomes with a Python function in worker processes which share the population's
+        genes and fitnesses in memory. Supply it to the optimiser as its evaluator.
+        :param fitness_function: a function of a chromosome's float gene values, as a 1-D array, returning its score.
+        :param num_workers: the number of worker processes, None for as many as the optimiser's pool would use, or 0
+        to evaluate in this process.
+        :param vectorised: whether the fitness function instead takes a 2-D array of rows and returns a score per row.
+        :param chunk_size: the number of rows per task, or None to split each epoch into about 4 tasks per worker.
+        :param mp_start_method: the multiprocessing start method of the workers, or None for the default.
+        """
+        self.fitness_function = fitness_function
+        self.num_workers = max(int(mp.cpu_count()) - 2, 1) if num_workers is None else num_workers
+        self.vectorised = vectorised
+        self.chunk_size = chunk_size
+        self.mp_start_method = mp_start_method
+
+        self.genes = None
+        self.fitness = None
+        self.workers = None
+
+    def reserve(self, num_rows, num_genes):
+        """ Make sure the shared arrays hold at least num_rows of num_genes, replacing them with larger ones if not."""
+        if self.genes is not None and self.genes.shape[0] >= num_rows and self.genes.shape[1] == num_genes:
+            return
+
+        capacity = num_rows
+        if self.genes is not None and self.genes.shape[1] == num_genes:
+            capacity = max(num_rows, 2 * self.genes.shape[0])
+        self.release_arrays()
+        self.genes = SharedArray((capacity, num_genes))
+        self.fitness = SharedArray((capacity,))
+
+    def pool(self):
+        """ Get the worker pool, starting it on first use. It is kept between epochs, along with its mappings."""
+        if self.workers is None:
+            context = mp.get_context(self.mp_start_method)
+            self.workers = context.Pool(self.num_workers, initializer=init_worker,
+                                        initargs=(self.fitness_function, self.vectorised))
+
+        return self.workers
+
+    def tasks(self, num_rows):
+        chunk_size = self.chunk_size or max(math.ceil(num_rows / (4 * self.num_workers)), 1)
+        return [(self.genes.spec, self.fitness.spec, start, min(start + chunk_size, num_rows))
+                for start in range(0, num_rows, chunk_size)]
+
+    def evaluate_population(self, chromosomes):
+        """ Evaluate every chromosome which doesn't have a fitness."""
+        pending = [chromosome for chromosome in chromosomes if chromosome.fitness is None]
+        if not pending:
+            return chromosomes
+
+        values = numeric_matrix(pending)
+        if values is None:
+            raise ValueError("Every chromosome must have the same number of genes, each with a float value, to be "
+                             "evaluated in shared memory.")
+        num_rows = len(pending)
+        self.reserve(num_rows, values.shape[1])
+        self.genes.array[:num_rows] = values
+        self.fitness.array[:num_rows] = np.nan
+
+        if self.num_workers:
+            self.pool().map(evaluate_rows, self.tasks(num_rows))
+        else:
+            evaluate_block(self.fitness_function, self.vectorised, self.genes.array, self.fitness.array, 0, num_rows)
+
+        for chromosome, fitness in zip(pending, self.fitness.array[:num_rows].tolist()):
+            chromosome.set_result(fitness=fitness, user_output_log=[])
+
+        return chromosomes
+
+    def release_arrays(self):
+        for shared in (self.genes, self.fitness):
+            if shared is not None:
+                shared.close()
+        self.genes = None
+        self.fitness = None
+
+    def close(self):
+        """ Stop the workers and remove the shared memory blocks."""
+        if self.workers is not None:
+            self.workers.terminate()
+            self.workers.join()
+            self.workers = None
+        self.release_arrays()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,275 @@
+"""
+The spool environment wrapper.
+
+Evaluations are distributed through a spool directory on a filesystem shared by every node, so no network ports are
+needed. The spool has three folders:
+    * pending: task descriptors waiting to be claimed, as <task_id>.task
+    * claimed: tasks being run, as <task_id>.<claim_id>.task. A worker claims a task by renaming it here under its
+      own claim ID, which is atomic, and renews its lease by touching it. Tasks whose lease has expired are moved back
+      to pending, so a worker which outlives its lease finds its claim gone rather than removing another's.
+    * results: results of finished tasks, as <task_id>.result
+
+Task IDs start with the ID of the evaluator which submitted them, so an evaluator removes the results of its own tasks
+which are no longer outstanding - duplicates of requeued tasks, or tasks it cancelled - and leaves other evaluators'.
+
+Files are written under a temporary name and renamed into place, so a reader never sees a partial file.
+Task descriptors and results are pickled, so workers must be able to import the same gene and function definitions
+as the optimiser. Start a worker on any node with:
+    python -m ripsaw.spool_env_wrapper <spool_dir>
+"""
+
+import argparse
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+from uuid import uuid4
+
+from ripsaw.util.cleanup import release_workspace
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+RESULTS = 'results'
+
+
+def make_spool(spool_dir):
+    """ Create the spool's folders if they don't already exist."""
+    for folder in (PENDING, CLAIMED, RESULTS):
+        os.makedirs(os.path.join(spool_dir, folder), exist_ok=True)
+
+
+def write_atomic(path, payload):
+    """ Pickle a payload into a file, which only appears under its name once completely written."""
+    temp_path = path + "." + uuid4().hex + ".tmp"
+    with open(temp_path, 'wb') as out_fs:
+        pickle.dump(payload, out_fs)
+    os.replace(temp_path, path)
+
+
+def read_pickle(path):
+    with open(path, 'rb') as in_fs:
+        return pickle.load(in_fs)
+
+
+def task_ids(folder, suffix):
+    """ Get the IDs of the complete files with a suffix in a folder, without any claim ID."""
+    return [name[:-len(suffix)].split('.')[0] for name in os.listdir(folder) if name.endswith(suffix)]
+
+
+def claimed_files(spool_dir, task_id=None):
+    """ Get the paths of the claims of a task in a spool, or of every claimed task if task_id is None."""
+    claimed = os.path.join(spool_dir, CLAIMED)
+    return [os.path.join(claimed, name) for name in os.listdir(claimed)
+            if name.endswith('.task') and (task_id is None or name.split('.')[0] == task_id)]
+
+
+class SpoolWorker:
+    def __init__(self, spool_dir, lease_time=60.0, poll_interval=0.5, cleaner=None):
+        """
+        A worker which claims tasks from a spool, evaluates them with the local environment wrapper and writes back
+        their results.
+        :param spool_dir: the spool directory on the shared filesystem.
+        :param lease_time: the seconds a claim lasts without being renewed. Must match the evaluator's.
+        :param poll_interval: the seconds to wait between looking for tasks when there are none.
+        :param cleaner: a WorkspaceCleaner for workspaces left by tasks with deferred cleanup, or None to remove them.
+        """
+        self.spool_dir = spool_dir
+        self.cleaner = cleaner
+        self.lease_time = lease_time
+        self.poll_interval = poll_interval
+        self.worker_id = socket.gethostname() + "-" + str(os.getpid())
+        self.claim_id = uuid4().hex
+        make_spool(spool_dir)
+
+    def claimed_path(self, task_id):
+        """ The path of this worker's claim on a task."""
+        return os.path.join(self.spool_dir, CLAIMED, task_id + '.' + self.claim_id + '.task')
+
+    def claim(self):
+        """ Try to claim a pending task, returning its ID, or None if there are none left to claim."""
+        pending = os.path.join(self.spool_dir, PENDING)
+        for task_id in task_ids(pending, '.task'):
+            try:
+                os.rename(os.path.join(pending, task_id + '.task'), self.claimed_path(task_id))
+            except OSError:
+                continue  # Claimed by another worker first.
+            return task_id
+
+        return None
+
+    def renew_lease(self, claimed_path, finished):
+        """ Keep touching a claimed task until it is finished, so its lease doesn't expire."""
+        while not finished.wait(self.lease_time / 3):
+            try:
+                os.utime(claimed_path)
+            except OSError:
+                return  # The lease expired and the task was requeued.
+
+    def run_task(self, task_id):
+        """ Evaluate a claimed task and write its result, or the error it raised."""
+        claimed_path = self.claimed_path(task_id)
+        finished = threading.Event()
+        renewer = threading.Thread(target=self.renew_lease, args=(claimed_path, finished), daemon=True)
+        renewer.start()
+
+        try:
+            chromosome = read_pickle(claimed_path)['chromosome']
+            try:
+                chromosome.evaluate()
+            finally:
+                release_workspace(chromosome, self.cleaner)
+            result = {'fitness': chromosome.fitness, 'objectives': chromosome.objectives,
+                      'user_output_log': chromosome.user_output_log, 'usage': chromosome.usage,
+                      'worker': self.worker_id}
+        except Exception as e:
+            logging.exception("Task " + task_id + " failed.")
+            result = {'error': repr(e), 'worker': self.worker_id}
+        finally:
+            finished.set()
+            renewer.join()
+
+        write_atomic(os.path.join(self.spool_dir, RESULTS, task_id + '.result'), result)
+        self.release(task_id)
+
+    def release(self, task_id):
+        """ Remove this worker's claim on a finished task, unless its lease expired and it was requeued."""
+        try:
+            os.remove(self.claimed_path(task_id))
+        except OSError:
+            pass
+
+    def run(self, max_tasks=None, idle_timeout=None):
+        """
+        Claim and run tasks until stopped.
+        :param max_tasks: the number of tasks after which to stop, or None to carry on.
+        :param idle_timeout: the seconds without any pending task after which to stop, or None to wait forever.
+        :return: the number of tasks run.
+        """
+        num_tasks = 0
+        idle_since = time.time()
+
+        while max_tasks is None or num_tasks < max_tasks:
+            task_id = self.claim()
+            if task_id is None:
+                if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            self.run_task(task_id)
+            num_tasks += 1
+            idle_since = time.time()
+
+        return num_tasks
+
+
+class SpoolEvaluator:
+    def __init__(self, spool_dir, lease_time=60.0, poll_interval=0.5, timeout=None):
+        """
+        An evaluator which writes chromosomes into a spool for workers to evaluate, then waits for their results.
+        Supply it to the optimiser as its evaluator.
+        :param spool_dir: the spool directory on the shared filesystem.
+        :param lease_time: the seconds after which a claimed task whose lease isn't renewed is given to another worker.
+        :param poll_interval: the seconds to wait between looking for results.
+        :param timeout: the seconds to wait for an epoch's results before raising TimeoutError, or None to wait.
+        """
+        self.spool_dir = spool_dir
+        self.lease_time = lease_time
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.evaluator_id = uuid4().hex
+        make_spool(spool_dir)
+
+    def submit(self, chromosome):
+        """ Write a chromosome into the spool as a pending task, returning its task ID."""
+        task_id = self.evaluator_id + '-' + uuid4().hex
+        write_atomic(os.path.join(self.spool_dir, PENDING, task_id + '.task'), {'chromosome': chromosome})
+
+        return task_id
+
+    def requeue_expired(self):
+        """ Move claimed tasks whose lease has expired back to pending, for when a worker has died."""
+        for path in claimed_files(self.spool_dir):
+            task_id = os.path.basename(path).split('.')[0]
+            try:
+                if time.time() - os.path.getmtime(path) > self.lease_time:
+                    os.rename(path, os.path.join(self.spool_dir, PENDING, task_id + '.task'))
+                    logging.warning("Lease expired on task " + task_id + ", requeued.")
+            except OSError:
+                pass  # Finished or requeued in the meantime.
+
+    def cancel(self, outstanding):
+        """
+        Withdraw outstanding tasks from the spool, removing them from outstanding. Results of cancelled tasks which
+        were already running are removed by later collects.
+        """
+        for task_id in list(outstanding):
+            paths = [os.path.join(self.spool_dir, PENDING, task_id + '.task'),
+                     os.path.join(self.spool_dir, RESULTS, task_id + '.result')]
+            for path in paths + claimed_files(self.spool_dir, task_id):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            del outstanding[task_id]
+
+    def collect(self, outstanding):
+        """
+        Set the result of every outstanding task which has finished, removing them from outstanding. If a task
+        failed, the rest are cancelled and its error raised.
+        """
+        results = os.path.join(self.spool_dir, RESULTS)
+        for task_id in task_ids(results, '.result'):
+            path = os.path.join(results, task_id + '.result')
+            chromosome = outstanding.pop(task_id, None)
+            if chromosome is None:
+                if task_id.startswith(self.evaluator_id + '-'):
+                    try:
+                        os.remove(path)  # A duplicate from a requeued task, or a task cancelled earlier.
+                    except OSError:
+                        pass
+                continue  # Otherwise another optimiser's.
+
+            result = read_pickle(path)
+            os.remove(path)
+            if 'error' in result:
+                outstanding[task_id] = chromosome  # In case its task wasn't withdrawn.
+                self.cancel(outstanding)
+                raise RuntimeError("Task " + task_id + " failed on worker " + result['worker'] + ": " +
+                                   result['error'])
+            chromosome.usage = result.get('usage')
+            chromosome.set_result(fitness=result['fitness'], user_output_log=result['user_output_log'],
+                                  objectives=result['objectives'])
+
+    def evaluate_population(self, chromosomes):
+        """ Evaluate every chromosome which doesn't have a fitness through the spool."""
+        outstanding = {self.submit(chromosome): chromosome for chromosome in chromosomes if chromosome.fitness is None}
+        start_time = time.time()
+
+        while outstanding:
+            self.collect(outstanding)
+            if not outstanding:
+                break
+            if self.timeout is not None and time.time() - start_time > self.timeout:
+                self.cancel(outstanding)
+                raise TimeoutError(str(len(outstanding)) + " spool tasks were not finished in time.")
+
+            self.requeue_expired()
+            time.sleep(self.poll_interval)
+
+        return chromosomes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a RIPSAW spool worker.")
+    parser.add_argument('spool_dir', help="the spool directory on the shared filesystem")
+    parser.add_argument('--lease-time', type=float, default=60.0, help="seconds a claim lasts without renewal")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="seconds between looking for tasks")
+    parser.add_argument('--max-tasks', type=int, default=None, help="stop after this many tasks")
+    parser.add_argument('--idle-timeout', type=float, default=None, help="stop after this many idle seconds")
+    args = parser.parse_args()
+
+    worker = SpoolWorker(args.spool_dir, lease_time=args.lease_time, poll_interval=args.poll_interval)
+    worker.run(max_tasks=args.max_tasks, idle_timeout=args.idle_timeout)
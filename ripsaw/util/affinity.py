@@ -0,0 +1,166 @@
+"""
+CPU affinity and NUMA aware placement of target programs.
+
+Left alone, target programs float over every core, so their caches are thrashed and multi-threaded models compete for
+the same cores. A CorePlacement splits the cores this process may use into slots of a fixed number of cores, never
+straddling a NUMA node, and runs each program pinned to a slot with os.sched_setaffinity. On Linux affinity belongs to
+a thread and is inherited by the children it starts, so the launching thread is pinned just before the program is
+started and restored after. Worker processes of the optimiser's pool are each pinned to a slot of their own. The
+thread count variables of common threading libraries are set to the slot's size, so models don't start more threads
+than they have cores.
+
+Where sched_setaffinity isn't available programs are started unpinned, with the thread count variables still set.
+"""
+
+import glob
+import itertools
+import os
+import re
+import threading
+
+from ripsaw.util.launcher import Launcher
+
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS')
+
+# The slot of this process, once it is a pool worker pinned by CorePlacement.pin_worker.
+_worker_slot = None
+
+
+def parse_cpu_list(text):
+    """ Parse a Linux cpu list, i.e. "0-3,8,10-11", into a sorted list of cpu numbers."""
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+
+    return sorted(cpus)
+
+
+def available_cpus():
+    """ The cpus this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """ Get the cpus this process may run on, grouped by NUMA node, or as one node where the layout can't be read."""
+    available = set(available_cpus())
+    nodes = list()
+    paths = glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')
+    for path in sorted(paths, key=lambda path: int(re.search(r'node(\d+)', path).group(1))):
+        try:
+            with open(path, 'r') as in_fs:
+                cpus = [cpu for cpu in parse_cpu_list(in_fs.read()) if cpu in available]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+
+    return nodes or [sorted(available)]
+
+
+def core_sets(cores_per_slot, nodes):
+    """
+    Split the cores of each NUMA node into sets of cores_per_slot, alternating between nodes so consecutive slots are
+    spread over them. Cores left over on a node are unused. If a slot is larger than any node, slots span nodes.
+    :param nodes: a list of the cpus of each node.
+    :return: a list of the cpus of each slot.
+    """
+    per_node = [[node[i:i + cores_per_slot] for i in range(0, len(node) - cores_per_slot + 1, cores_per_slot)]
+                for node in nodes]
+    slots = [cores for group in itertools.zip_longest(*per_node) for cores in group if cores is not None]
+    if slots:
+        return slots
+
+    cpus = [cpu for node in nodes for cpu in node]
+    return [cpus[i:i + cores_per_slot] for i in range(0, len(cpus), cores_per_slot)]
+
+
+class CorePlacement(Launcher):
+    def __init__(self, cores_per_slot=1, nodes=None, env=None, use_posix_spawn=None):
+        """
+        A launcher running each target program pinned to a slot of dedicated cores. Supply it to the optimiser as its
+        core_placement, and give a ResourceScheduler the same cores_per_evaluation.
+        :param cores_per_slot: the number of cores of each slot, i.e. the model's thread count.
+        :param nodes: the cpus of each NUMA node, or None to read them from the system.
+        :param env: the environment for every child, or None to take a copy of this process's environment.
+        :param use_posix_spawn: whether to use os.posix_spawn, or None to use it wherever it is available.
+        """
+        super().__init__(env=env, use_posix_spawn=use_posix_spawn)
+        self.cores_per_slot = cores_per_slot
+        self.slots = core_sets(cores_per_slot, nodes if nodes is not None else numa_nodes())
+        self.slot_envs = list()
+        for cores in self.slots:
+            slot_env = dict(self.env)
+            slot_env.update({variable: str(len(cores)) for variable in THREAD_VARIABLES})
+            self.slot_envs.append(slot_env)
+
+        self.in_use = [0] * len(self.slots)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Take the least used slot, or this pool worker's own slot."""
+        if _worker_slot is not None:
+            return _worker_slot % len(self.slots)
+
+        with self.lock:
+            slot = min(range(len(self.slots)), key=self.in_use.__getitem__)
+            self.in_use[slot] += 1
+
+        return slot
+
+    def release(self, slot):
+        if _worker_slot is None:
+            with self.lock:
+                self.in_use[slot] -= 1
+
+    def run_measured(self, url, cwd, suppress_output=False, as_admin=False, env=None):
+        """ Run a program to completion pinned to a slot, as Launcher.run_measured does."""
+        slot = self.acquire()
+        pin = hasattr(os, 'sched_setaffinity')
+        previous = os.sched_getaffinity(0) if pin else None
+        try:
+            if pin:
+                os.sched_setaffinity(0, self.slots[slot])
+            return super().run_measured(url, cwd, suppress_output, as_admin,
+                                        env=self.slot_envs[slot] if env is None else env)
+        finally:
+            if pin:
+                os.sched_setaffinity(0, previous)
+            self.release(slot)
+
+    def reserve(self):
+        """ Reserve a slot for a child started by other means, which pins itself there before running the program."""
+        slot = self.acquire()
+        cores = self.slots[slot]
+        pin = (lambda: os.sched_setaffinity(0, cores)) if hasattr(os, 'sched_setaffinity') else None
+
+        return slot, self.slot_envs[slot], pin
+
+    def unreserve(self, slot):
+        self.release(slot)
+
+    @staticmethod
+    def pin_worker(placement, counter):
+        """ A pool initializer, giving each worker process the next slot in turn and pinning it there."""
+        global _worker_slot
+        with counter.get_lock():
+            _worker_slot = counter.value % len(placement.slots)
+            counter.value += 1
+
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, placement.slots[_worker_slot])
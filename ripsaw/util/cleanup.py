@@ -0,0 +1,192 @@
+"""
+Deferred removal of finished workspaces.
+
+Removing a large cloned workspace can take seconds. Rather than an evaluation waiting for it, finished workspaces are
+handed to a cleaner which removes them in batches on a background thread, optionally keeping the most recent or
+failed ones for inspection.
+"""
+
+import atexit
+import collections
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+
+from ripsaw.util.file import WORKSPACE_MARKER
+
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def directory_size(folder):
+    """ Get the total size in bytes of the files in a folder."""
+    size = 0
+    for path, _, files in os.walk(folder):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(path, file)).st_size
+            except OSError:
+                pass
+
+    return size
+
+
+def workspace_age(folder):
+    """
+    Get the seconds since a workspace was cloned, from its marker, or else from the folder's status change time, as
+    its modification time is copied from the template.
+    """
+    try:
+        created = os.path.getmtime(os.path.join(folder, WORKSPACE_MARKER))
+    except OSError:
+        created = os.stat(folder).st_ctime
+
+    return time.time() - created
+
+
+def workspace_in_use(folder):
+    """ Whether a workspace's marker names a process on this host which is still running."""
+    try:
+        with open(os.path.join(folder, WORKSPACE_MARKER), 'r') as in_fs:
+            host, pid = in_fs.read().split()
+        if host != socket.gethostname():
+            return False
+        os.kill(int(pid), 0)
+    except PermissionError:
+        return True
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+def release_workspace(task, cleaner=None):
+    """
+    Dispose of the workspace left by a chromosome or batch evaluated with deferred cleanup, if there is one.
+    :param task: a chromosome or batch which may have a workspace of (folder, failed).
+    :param cleaner: the cleaner to hand it to, or None to remove it now.
+    """
+    workspace = getattr(task, 'workspace', None)
+    if workspace is None:
+        return
+
+    task.workspace = None
+    folder, failed = workspace
+    if cleaner is None:
+        shutil.rmtree(folder, ignore_errors=True)
+    else:
+        cleaner.submit(folder, failed=failed)
+
+
+class WorkspaceCleaner:
+    def __init__(self, max_pending_bytes=None, retain_recent=0, retain_failed=0, batch_size=16):
+        """
+        A background remover of workspaces.
+        :param max_pending_bytes: the most bytes of workspaces to have waiting for removal. Submitting more blocks
+        until removal catches up. None for no limit.
+        :param retain_recent: the number of most recent successful workspaces to keep rather than remove.
+        :param retain_failed: the number of most recent failed workspaces to keep rather than remove.
+        :param batch_size: the most workspaces removed each time the background thread wakes.
+        """
+        self.max_pending_bytes = max_pending_bytes
+        self.batch_size = batch_size
+        self.retained = collections.deque(maxlen=retain_recent) if retain_recent else None
+        self.retained_failed = collections.deque(maxlen=retain_failed) if retain_failed else None
+
+        self.pending = collections.deque()
+        self.pending_bytes = 0
+        self.in_progress = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.remove_pending, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, folder, failed=False):
+        """
+        Hand over a finished workspace for removal, or for retention if it is among the most recent.
+        :param folder: the workspace folder.
+        :param failed: whether the evaluation in the workspace failed.
+        """
+        retained = self.retained_failed if failed else self.retained
+        if retained is not None:
+            if len(retained) == retained.maxlen:
+                self.enqueue(retained.popleft())
+            retained.append(folder)
+        else:
+            self.enqueue(folder)
+
+    def enqueue(self, folder):
+        """ Queue a folder for removal, waiting while the pending limit is exceeded."""
+        size = directory_size(folder) if self.max_pending_bytes is not None else 0
+
+        with self.condition:
+            while self.max_pending_bytes is not None and self.pending and \
+                    self.pending_bytes + size > self.max_pending_bytes:
+                self.condition.wait()
+            self.pending.append((folder, size))
+            self.pending_bytes += size
+            self.condition.notify_all()
+
+    def remove_pending(self):
+        """ The background thread, removing pending folders in batches until closed."""
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending and self.closed:
+                    return
+                batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                self.in_progress += len(batch)
+
+            for folder, size in batch:
+                shutil.rmtree(folder, ignore_errors=True)
+
+            with self.condition:
+                self.pending_bytes -= sum(size for _, size in batch)
+                self.in_progress -= len(batch)
+                self.condition.notify_all()
+
+    def flush(self):
+        """ Wait until every queued workspace has been removed."""
+        with self.condition:
+            while self.pending or self.in_progress:
+                self.condition.wait()
+
+    def sweep_orphans(self, parent_dir, min_age=3600.0):
+        """
+        Queue for removal the UUID named workspaces in a folder which were left behind by crashed runs. Workspaces
+        whose process is still running on this host, or which were cloned within min_age, are left alone, as they
+        may belong to other runs sharing the folder.
+        :param parent_dir: the folder workspaces are cloned into, i.e. the parent of the target directory.
+        :param min_age: the seconds since a workspace was cloned before it may be treated as orphaned.
+        :return: the number of orphaned workspaces found.
+        """
+        kept = set(self.retained or ()) | set(self.retained_failed or ())
+        orphans = list()
+        for name in os.listdir(parent_dir):
+            folder = os.path.join(parent_dir, name)
+            try:
+                if UUID_PATTERN.match(name) and folder not in kept and os.path.isdir(folder) and \
+                        workspace_age(folder) > min_age and not workspace_in_use(folder):
+                    orphans.append(folder)
+            except OSError:
+                continue
+
+        if orphans:
+            logging.info("Removing " + str(len(orphans)) + " orphaned workspaces from " + parent_dir)
+        for folder in orphans:
+            self.enqueue(folder)
+
+        return len(orphans)
+
+    def close(self):
+        """ Remove everything queued and stop the background thread. Retained workspaces are kept."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
@@ -0,0 +1,220 @@
+"""
+Fast extraction of scores and log values from large output files.
+
+Reading a whole multi-gigabyte output file line by line to find one result costs far more than the evaluation is
+worth. The extractors here are callables which can be used as the function of an output or log file:
+    * TailSearch reads backwards from the end of the file, for results written near the end.
+    * MmapSearch memory maps the file and searches it with a compiled regular expression.
+    * FieldExtractor finds several fields in one pass over a memory mapped file, for log rows or several objectives.
+Patterns must have one group, whose text is converted to the value, and are fastest when anchored to the start of a
+line with '^'. They are compiled once, and the extractors can be pickled to worker processes as long as their convert
+function can.
+"""
+
+import mmap
+import os
+import re
+
+
+def compile_pattern(pattern):
+    """ Compile a str or bytes pattern into a bytes regular expression, which is what the extractors search."""
+    if isinstance(pattern, re.Pattern):
+        pattern = pattern.pattern
+    if isinstance(pattern, str):
+        pattern = pattern.encode('utf-8')
+
+    return re.compile(pattern, re.MULTILINE)
+
+
+def reverse_lines(url, block_size=1 << 16, max_bytes=None):
+    """
+    Read the lines of a file from the last to the first, without reading the rest of the file.
+    :param url: the file's path.
+    :param block_size: the bytes read at a time.
+    :param max_bytes: the most bytes to read back from the end of the file, or None for the whole file.
+    :return: a generator of the lines as bytes, without their line endings.
+    """
+    with open(url, 'rb') as in_fs:
+        end = in_fs.seek(0, os.SEEK_END)
+        start = 0 if max_bytes is None else max(end - max_bytes, 0)
+        position = end
+        remainder = b''
+
+        while position > start:
+            read_size = min(block_size, position - start)
+            position -= read_size
+            in_fs.seek(position)
+            lines = (in_fs.read(read_size) + remainder).split(b'\n')
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.rstrip(b'\r')
+
+        yield remainder.rstrip(b'\r')
+
+
+def tail_lines(url, num_lines=1, block_size=1 << 16):
+    """ Get the last lines of a file as str, ignoring a trailing line ending."""
+    lines = list()
+    for line in reverse_lines(url, block_size=block_size):
+        if not lines and not line:
+            continue
+        lines.append(line.decode('utf-8', errors='replace'))
+        if len(lines) == num_lines:
+            break
+
+    return lines[::-1]
+
+
+def no_match(default, pattern, url):
+    if default is None:
+        raise ValueError("No match for " + repr(pattern.pattern) + " in " + url)
+
+    return default
+
+
+class TailSearch:
+    def __init__(self, pattern, convert=float, max_bytes=None, default=None, block_size=1 << 16):
+        """
+        An extractor of the value in the last line of a file matching a pattern, reading backwards from its end.
+        :param pattern: a regular expression with one group, i.e. r'Result: (\\S+)'. Lines are matched separately.
+        :param convert: the function converting the group's text, i.e. float or str.
+        :param max_bytes: the most bytes to search back from the end of the file, or None for the whole file.
+        :param default: the value when nothing matches, or None to raise ValueError.
+        :param block_size: the bytes read at a time.
+        """
+        self.pattern = compile_pattern(pattern)
+        self.convert = convert
+        self.max_bytes = max_bytes
+        self.default = default
+        self.block_size = block_size
+
+    def __call__(self, url):
+        for line in reverse_lines(url, block_size=self.block_size, max_bytes=self.max_bytes):
+            match = self.pattern.search(line)
+            if match is not None:
+                return self.convert(match.group(1).decode('utf-8'))
+
+        return no_match(self.default, self.pattern, url)
+
+
+def map_file(url):
+    """ Memory map a file read only, or return None if it's empty and so can't be mapped."""
+    with open(url, 'rb') as in_fs:
+        if os.fstat(in_fs.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(in_fs.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def find_match(pattern, mapped, start, last):
+    """ Find the first, or last, match of a compiled pattern in a mapped file from a position, or None."""
+    if not last:
+        return pattern.search(mapped, start)
+
+    match = None
+    for match in pattern.finditer(mapped, start):
+        pass
+
+    return match
+
+
+class MmapSearch:
+    def __init__(self, pattern, convert=float, last=False, tail_bytes=None, default=None):
+        """
+        An extractor of the value matching a pattern, searching a memory mapped file.
+        :param pattern: a regular expression with one group, which may span lines.
+        :param convert: the function converting the group's text, i.e. float or str.
+        :param last: whether to use the last match rather than the first, which has to search to the end.
+        :param tail_bytes: the bytes at the end of the file to search, or None for the whole file.
+        :param default: the value when nothing matches, or None to raise ValueError.
+        """
+        self.pattern = compile_pattern(pattern)
+        self.convert = convert
+        self.last = last
+        self.tail_bytes = tail_bytes
+        self.default = default
+
+    def __call__(self, url):
+        mapped = map_file(url)
+        if mapped is None:
+            return no_match(self.default, self.pattern, url)
+
+        with mapped:
+            start = 0 if self.tail_bytes is None else max(len(mapped) - self.tail_bytes, 0)
+            match = find_match(self.pattern, mapped, start, self.last)
+            if match is None:
+                return no_match(self.default, self.pattern, url)
+            return self.convert(match.group(1).decode('utf-8'))
+
+
+class FieldExtractor:
+    def __init__(self, patterns, convert=float, last=False, tail_bytes=None, default=None):
+        """
+        An extractor of several fields in one pass over a memory mapped file, returning a list of their values in
+        order. Use it as a log function, or as an output function for several objectives. Each field gets the value
+        MmapSearch would give it, unless it only matches inside another field's match: a field not found in the pass
+        is searched for alone, but with last, a field's later matches inside another's are missed.
+        :param patterns: a list of regular expressions, each with one group, and without numbered backreferences.
+        :param convert: the function converting each group's text, or a list of one per pattern.
+        :param last: whether to use the last match of each field rather than the first. When False the search stops
+        as soon as every field has been found.
+        :param tail_bytes: the bytes at the end of the file to search, or None for the whole file.
+        :param default: the value of fields which aren't found, or None to raise ValueError.
+        """
+        self.patterns = [compile_pattern(pattern) for pattern in patterns]
+        self.converts = list(convert) if isinstance(convert, (list, tuple)) else [convert] * len(self.patterns)
+        if len(self.converts) != len(self.patterns):
+            raise ValueError("Expected one convert function per pattern.")
+        self.last = last
+        self.tail_bytes = tail_bytes
+        self.default = default
+
+        # Each field is wrapped in a named group, so which one matched is known without renumbering its own group.
+        # When every field is anchored to the start of a line the anchor is shared, which lets the search skip
+        # through the rest of each line many times faster.
+        sources = [pattern.pattern for pattern in self.patterns]
+        anchored = all(source.startswith(b'^') for source in sources)
+        if anchored:
+            sources = [source[1:] for source in sources]
+        alternatives = b'|'.join(b'(?P<f' + str(i).encode() + b'>' + source + b')' for i, source in enumerate(sources))
+        self.combined = re.compile(b'^(?:' + alternatives + b')' if anchored else alternatives, re.MULTILINE)
+        if any(pattern.groups < 1 for pattern in self.patterns):
+            raise ValueError("Every pattern must have a group, whose text is converted to the value.")
+        self.groups = [self.combined.groupindex['f' + str(i)] + 1 for i in range(len(self.patterns))]
+
+    def __call__(self, url):
+        texts = [None] * len(self.patterns)
+        mapped = map_file(url)
+
+        if mapped is not None:
+            with mapped:
+                start = 0 if self.tail_bytes is None else max(len(mapped) - self.tail_bytes, 0)
+                remaining = len(self.patterns)
+                for match in self.combined.finditer(mapped, start):
+                    # The first field to match at a position wins the alternation, so the later fields are tried there
+                    # too. Values are taken from the combined match's groups, as the fields' own may use lookaround.
+                    first = int(match.lastgroup[1:])
+                    for i in range(first, len(self.patterns)):
+                        if texts[i] is not None and not self.last:
+                            continue
+                        field = match if i == first else self.patterns[i].match(mapped, match.start())
+                        if field is None:
+                            continue
+                        if texts[i] is None:
+                            remaining -= 1
+                        texts[i] = field.group(self.groups[i] if i == first else 1)
+                    if not self.last and remaining == 0:
+                        break
+
+                for i, pattern in enumerate(self.patterns):
+                    if texts[i] is None:
+                        match = find_match(pattern, mapped, start, self.last)
+                        texts[i] = match.group(1) if match is not None else None
+
+        values = list()
+        for pattern, convert, text in zip(self.patterns, self.converts, texts):
+            if text is None:
+                values.append(no_match(self.default, pattern, url))
+            else:
+                values.append(convert(text.decode('utf-8')))
+
+        return values
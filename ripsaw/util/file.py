@@ -1,7 +1,12 @@
 import os
 import shutil
+import socket
 from uuid import uuid4
 
+# A file marking a cloned workspace with the host and process which made it. Its modification time is the clone's
+# creation time, as copytree gives the clone the template's times.
+WORKSPACE_MARKER = '.ripsaw_workspace'
+
 
 def clone_directory_uuid(source):
     uuid_name = str(uuid4())
@@ -9,6 +14,8 @@ def clone_directory_uuid(source):
     uuid_destination = os.path.join(path_top, uuid_name)
 
     shutil.copytree(source, uuid_destination)
+    with open(os.path.join(uuid_destination, WORKSPACE_MARKER), 'w') as out_fs:
+        out_fs.write(socket.gethostname() + " " + str(os.getpid()))
 
     return uuid_destination
 
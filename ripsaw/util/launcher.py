@@ -0,0 +1,188 @@
+"""
+Launching of target programs with as little overhead as possible.
+
+A large optimiser process (or a pool worker forked from one) pays for copying its address space every time it forks.
+Where available, os.posix_spawn is used instead, which lets the C library create the child without that copy.
+posix_spawn cannot set the child's working directory, so children are started through a minimal /bin/sh shim which
+changes directory and then execs the target in its place, so the child waited for is the target itself. Children are
+waited for with os.wait4 where available, to account for the resources they used.
+"""
+
+import errno
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+from ripsaw.util.usage import ProcessUsage
+
+CHDIR_SHIM = ['/bin/sh', '-c', 'cd -- "$0" && exec "$@"']
+
+
+class Launcher:
+    def __init__(self, env=None, use_posix_spawn=None):
+        """
+        A launcher for target programs, where the environment is built once and argv once per program.
+        :param env: the environment for every child, or None to take a copy of this process's environment.
+        :param use_posix_spawn: whether to use os.posix_spawn, or None to use it wherever it is available.
+        """
+        self.env = dict(os.environ if env is None else env)
+
+        if use_posix_spawn is None:
+            use_posix_spawn = hasattr(os, 'posix_spawnp') and os.path.exists(CHDIR_SHIM[0])
+        self.use_posix_spawn = use_posix_spawn
+
+        self.argvs = dict()
+
+    def argv(self, url, as_admin=False):
+        """ Get the argument list to run a program with, building it the first time it is asked for."""
+        key = (tuple(url) if isinstance(url, list) else url, as_admin)
+        if key not in self.argvs:
+            argv = list(url) if isinstance(url, list) else [url]
+            if as_admin:
+                argv.insert(0, 'sudo')
+            self.argvs[key] = argv
+
+        return self.argvs[key]
+
+    def run(self, url, cwd, suppress_output=False, as_admin=False):
+        """
+        Run a program to completion.
+        :param url: the program to run, or a list of the program and its arguments.
+        :param cwd: the working directory to run it in.
+        :param suppress_output: whether to connect the program's stdin and stdout to the null device.
+        :param as_admin: whether to run the program with sudo.
+        :return: the exit code of the program, negative if it was killed by a signal.
+        """
+        return self.run_measured(url, cwd, suppress_output, as_admin).exit_code
+
+    def run_measured(self, url, cwd, suppress_output=False, as_admin=False, env=None):
+        """
+        Run a program to completion, as run does, accounting for the resources it used.
+        :param env: the environment for this program, or None for the launcher's.
+        :return: the ProcessUsage of the program, including its exit code.
+        """
+        argv = self.argv(url, as_admin)
+        env = self.env if env is None else env
+        start = time.perf_counter()
+
+        if self.use_posix_spawn:
+            pid = self.posix_spawn(argv, cwd, suppress_output, env)
+        else:
+            if suppress_output:
+                process = subprocess.Popen(argv, cwd=cwd, env=env,
+                                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+            else:
+                process = subprocess.Popen(argv, cwd=cwd, env=env)
+
+            self.started(process.pid)
+            if not hasattr(os, 'wait4'):
+                exit_code = process.wait()
+                self.finished(process.pid)
+                return ProcessUsage(wall_time=time.perf_counter() - start, exit_code=exit_code)
+            pid = process.pid
+
+        try:
+            _, status, rusage = os.wait4(pid, 0)
+        finally:
+            self.finished(pid)
+        usage = ProcessUsage.from_rusage(time.perf_counter() - start, status, rusage)
+        if not self.use_posix_spawn:
+            process.returncode = usage.exit_code  # Reaped here, so Popen mustn't wait for it again.
+
+        return usage
+
+    def reserve(self):
+        """
+        Reserve what a child started by other means, i.e. asyncio, needs to run as this launcher's would.
+        :return: a token to give back to unreserve, the child's environment and a function to call in the child
+        before it runs the program, or None.
+        """
+        return None, self.env, None
+
+    def unreserve(self, token):
+        """ Give back what reserve took, once the child has been waited for."""
+        pass
+
+    def started(self, pid):
+        """ Called with the pid of every child as it starts, for launchers which keep track of their children."""
+        pass
+
+    def finished(self, pid):
+        """ Called with the pid of every child once it has been waited for."""
+        pass
+
+    @staticmethod
+    def check_executable(program):
+        """ Raise the error Popen would, had it been used, if a program can't be executed."""
+        if shutil.which(program) is None:
+            if os.path.exists(program):
+                raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), program)
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+
+    def posix_spawn(self, argv, cwd, suppress_output, env=None):
+        """ Start an argument list in a working directory with posix_spawn, via the chdir shim, returning its pid."""
+        Launcher.check_executable(argv[0])
+        if not os.path.isdir(cwd):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cwd)
+
+        file_actions = list()
+        if suppress_output:
+            file_actions.append((os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0))
+            file_actions.append((os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0))
+
+        pid = os.posix_spawnp(CHDIR_SHIM[0], CHDIR_SHIM + [cwd] + argv, self.env if env is None else env,
+                              file_actions=file_actions)
+        self.started(pid)
+
+        return pid
+
+
+class CancellableLauncher(Launcher):
+    def __init__(self, env=None, use_posix_spawn=None):
+        """
+        A launcher for work which may be abandoned, such as speculative evaluations. Cancelling it kills every child
+        it has running, and any it is asked to start afterwards.
+        """
+        super().__init__(env=env, use_posix_spawn=use_posix_spawn)
+        self.children = set()
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def started(self, pid):
+        with self.lock:
+            self.children.add(pid)
+            if self.cancelled:
+                CancellableLauncher.kill(pid)
+
+    def finished(self, pid):
+        with self.lock:
+            self.children.discard(pid)
+
+    @staticmethod
+    def kill(pid):
+        try:
+            os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except OSError:
+            pass  # Already exited.
+
+    def cancel(self):
+        """ Kill every running child, and every child started from now on."""
+        with self.lock:
+            self.cancelled = True
+            for pid in self.children:
+                CancellableLauncher.kill(pid)
+
+
+_default_launcher = None
+
+
+def default_launcher():
+    """ Get this process's launcher, creating it on first use so the environment is only built once per worker."""
+    global _default_launcher
+    if _default_launcher is None:
+        _default_launcher = Launcher()
+
+    return _default_launcher
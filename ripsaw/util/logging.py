@@ -14,9 +14,16 @@ class Logger:
         default_header.extend(user_headers)
         self.log_to_csv(default_header)
 
+    @staticmethod
+    def format_row(log_row):
+        """ Format a list as the text of one csv line, without the line ending."""
+        return "".join(str(value) + "," for value in log_row)
+
     def log_to_csv(self, log_row):
         """ This function logs a list into a csv format."""
+        self.log_text(Logger.format_row(log_row))
+
+    def log_text(self, text):
+        """ This function logs a preformatted line of csv text."""
         with open(self.target_file, 'a') as out_fs:
-            for value in log_row:
-                out_fs.write(str(value) + ",")
-            out_fs.write("\n")
+            out_fs.write(text + "\n")
@@ -0,0 +1,253 @@
+"""
+A resource-aware scheduler for running evaluations concurrently.
+
+Each evaluation declares what it costs in cores and memory. The scheduler only admits a new evaluation while that
+capacity is free, and tunes how many it runs at once from the machine's load average, its available memory and the
+throughput it observes. Evaluations run in threads of this process, as the real work happens in the child processes
+they wait on. When several clients, such as optimisers in a sweep, share one scheduler, capacity is shared fairly by
+admitting whichever waiting client has the fewest evaluations running. Speculative work may use capacity nobody is
+waiting for, and is preempted as soon as real work has to wait.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+
+def load_average():
+    """ Get the one minute load average, or None where the platform doesn't report it."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def available_memory():
+    """ Get the memory available for new processes in bytes, or None where it can't be read."""
+    try:
+        with open('/proc/meminfo', 'r') as in_fs:
+            for line in in_fs:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+class ResourceScheduler:
+    def __init__(self, cores_per_evaluation=1, memory_per_evaluation=0, total_cores=None, memory_reserve=0,
+                 min_concurrency=1, max_concurrency=None, target_load=None, adjust_interval=1.0, learn_memory=False):
+        """
+        A scheduler which admits evaluations while there is capacity for them. Supply it to the optimiser as its
+        scheduler. It is thread safe, so one scheduler may be shared by several optimisers.
+        :param cores_per_evaluation: the number of cores each evaluation uses, i.e. the model's thread count.
+        :param memory_per_evaluation: the bytes of memory each evaluation needs, or 0 not to plan for memory.
+        :param total_cores: the number of cores to schedule across, or None for every core of the machine.
+        :param memory_reserve: the bytes of available memory to always leave free.
+        :param min_concurrency: the fewest evaluations to run at once.
+        :param max_concurrency: the most evaluations to run at once, or None to allow as many as the cores permit.
+        :param target_load: the load average above which concurrency is reduced, or None for total_cores.
+        :param adjust_interval: the least number of seconds between adjustments of the concurrency.
+        :param learn_memory: whether to plan with the peak memory of evaluations as measured, once it is known, in
+        place of memory_per_evaluation.
+        """
+        self.cores_per_evaluation = cores_per_evaluation
+        self.memory_per_evaluation = memory_per_evaluation
+        self.total_cores = total_cores if total_cores is not None else (os.cpu_count() or 1)
+        self.memory_reserve = memory_reserve
+        self.min_concurrency = max(min_concurrency, 1)
+        core_slots = max(int(self.total_cores // cores_per_evaluation), 1)
+        self.max_concurrency = max(min(max_concurrency or core_slots, core_slots), self.min_concurrency)
+        self.target_load = target_load if target_load is not None else self.total_cores
+        self.adjust_interval = adjust_interval
+        self.learn_memory = learn_memory
+
+        self.concurrency = self.max_concurrency
+        self.memory_slots = None
+        self.running = 0
+        self.completed = 0
+        self.running_by_client = collections.Counter()
+        self.waiting = list()
+        self.speculative = 0
+        self.preemptors = list()
+        self.next_ticket = 0
+        self.condition = threading.Condition()
+
+        self.last_adjust_time = time.time()
+        self.last_adjust_completed = 0
+        self.last_throughput = None
+        self.last_change = 0
+
+    def plan_memory(self):
+        """
+        Set how many evaluations the declared memory cost allows for, from the memory available now plus that
+        already planned for evaluations which are running.
+        """
+        memory = available_memory()
+        if not self.memory_per_evaluation or memory is None:
+            self.memory_slots = None
+        else:
+            free_slots = int((memory - self.memory_reserve) // self.memory_per_evaluation)
+            self.memory_slots = self.running + max(free_slots, 0)
+
+    def record_usage(self, usage_summary):
+        """ Take note of the resource usage the optimiser measured over an epoch, learning memory_per_evaluation."""
+        if self.learn_memory and usage_summary.get('max_max_rss'):
+            with self.condition:
+                self.memory_per_evaluation = max(self.memory_per_evaluation, usage_summary['max_max_rss'])
+                logging.debug("Scheduler memory per evaluation: " + str(self.memory_per_evaluation))
+
+    def capacity(self):
+        """
+        The number of evaluations which may currently run at once. No more are admitted while available memory is
+        below the reserve, but one is always allowed so that work progresses.
+        """
+        capacity = self.concurrency
+        if self.memory_slots is not None:
+            capacity = min(capacity, self.memory_slots)
+            memory = available_memory()
+            if memory is not None and memory < self.memory_reserve:
+                capacity = min(capacity, self.running)
+
+        return max(capacity, 1)
+
+    def adjust(self):
+        """
+        Tune the concurrency from what has been observed since the last adjustment. It is cut back by a quarter
+        while the load average is above target, otherwise it grows by one while it is saturated and that keeps
+        improving throughput, and steps back if the last increase made throughput worse.
+        """
+        now = time.time()
+        elapsed = now - self.last_adjust_time
+        if elapsed < self.adjust_interval:
+            return
+
+        throughput = (self.completed - self.last_adjust_completed) / elapsed
+        load = load_average()
+        change = 0
+
+        if load is not None and load > self.target_load:
+            change = int(self.concurrency * 0.75) - self.concurrency
+        elif self.last_throughput is not None and self.last_change > 0 and throughput < self.last_throughput * 0.95:
+            change = -1
+        elif self.running >= self.concurrency:
+            change = 1
+
+        new_concurrency = min(max(self.concurrency + change, self.min_concurrency), self.max_concurrency)
+        if new_concurrency != self.concurrency:
+            logging.debug("Scheduler concurrency " + str(self.concurrency) + " -> " + str(new_concurrency) +
+                          " (load: " + str(load) + ", throughput: " + str(throughput) + "/s)")
+
+        self.last_change = new_concurrency - self.concurrency
+        self.concurrency = new_concurrency
+        self.last_throughput = throughput
+        self.last_adjust_time = now
+        self.last_adjust_completed = self.completed
+
+    def next_ticket_due(self):
+        """ The ticket of the waiter to admit next: of the client with the fewest running, the longest waiting."""
+        return min(self.waiting, key=lambda waiter: (self.running_by_client[waiter[1]], waiter[0]))[0]
+
+    def admit(self, client=None):
+        """ Wait until there is capacity for another evaluation and it is this client's turn, then reserve it."""
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.waiting.append((ticket, client))
+
+            while self.running >= self.capacity() or self.next_ticket_due() != ticket:
+                if self.speculative:
+                    self.preempt()
+                self.condition.wait(timeout=self.adjust_interval)
+                self.adjust()
+
+            self.waiting.remove((ticket, client))
+            self.running += 1
+            self.running_by_client[client] += 1
+            self.condition.notify_all()  # The next waiter may also fit.
+
+    def try_admit_speculative(self, timeout=0.0):
+        """
+        Reserve capacity for a speculative evaluation if it is free and nobody is waiting for it.
+        :param timeout: the most seconds to wait for capacity to become free.
+        :return: whether capacity was reserved.
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.waiting or self.running >= self.capacity():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(timeout=remaining)
+            self.running += 1
+            self.speculative += 1
+            return True
+
+    def release_speculative(self):
+        """ Give back the capacity of a finished or cancelled speculative evaluation."""
+        with self.condition:
+            self.running -= 1
+            self.speculative -= 1
+            self.condition.notify_all()
+
+    def preempt(self):
+        """ Cancel speculative work so real work doesn't wait for it. Preemptors must not take the scheduler's lock."""
+        for preemptor in self.preemptors:
+            preemptor()
+
+    def release(self, client=None):
+        """ Give back the capacity of a finished evaluation."""
+        with self.condition:
+            self.running -= 1
+            self.completed += 1
+            self.running_by_client[client] -= 1
+            if not self.running_by_client[client]:
+                del self.running_by_client[client]
+            self.adjust()
+            self.condition.notify_all()
+
+    def run_task(self, task, errors, client=None, on_done=None):
+        try:
+            task.evaluate()
+            if on_done is not None:
+                on_done(task)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self.release(client)
+
+    def run(self, tasks, client=None, on_tail=None, on_done=None):
+        """
+        Evaluate every task (anything with an evaluate method, such as a chromosome or batch) as capacity allows.
+        :param tasks: a list of tasks.
+        :param client: whatever identifies the caller, i.e. the optimiser, for sharing capacity fairly between callers.
+        :param on_tail: a function called once every task has been admitted, while the last are still running.
+        :param on_done: a function called with each task as it finishes, from the thread which evaluated it.
+        :return: the list of tasks, evaluated in place.
+        """
+        with self.condition:
+            self.plan_memory()
+
+        errors = list()
+        threads = list()
+        for task in tasks:
+            if errors:
+                break
+            self.admit(client)
+            thread = threading.Thread(target=self.run_task, args=(task, errors, client, on_done))
+            thread.start()
+            threads.append(thread)
+
+        if on_tail is not None and not errors:
+            on_tail()
+
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return tasks
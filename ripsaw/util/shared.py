@@ -0,0 +1,52 @@
+"""
+Numpy arrays in shared memory.
+
+An array is created in a multiprocessing.shared_memory block by one process and attached by name from others, so every
+process maps the same pages rather than receiving a pickled copy. Only the spec - the block's name, the array's shape
+and dtype - needs to be sent between processes.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    def __init__(self, shape, dtype=float, name=None):
+        """
+        A numpy array backed by a shared memory block.
+        :param shape: the shape of the array.
+        :param dtype: the dtype of the array.
+        :param name: the name of an existing block to attach, or None to create a new block, owned by this process.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        if self.owner:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    @property
+    def spec(self):
+        """ What another process needs to attach this array: its block's name, shape and dtype."""
+        return self.memory.name, self.shape, self.dtype.str
+
+    @staticmethod
+    def attach(spec):
+        name, shape, dtype = spec
+        return SharedArray(shape, dtype, name=name)
+
+    def close(self):
+        """ Unmap the block, and remove it if this process created it. Views of the array mustn't outlive this."""
+        if self.memory is None:
+            return
+
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
@@ -0,0 +1,121 @@
+"""
+Stages of a multi-program target, with their outputs cached by a hash of their inputs.
+
+An execute dictionary may list several programs run in turn in each workspace, i.e. a preprocessor, the simulation
+and a post-processor. A stage declared with the files it reads and the artefacts it writes, and given a StageCache,
+is skipped whenever the same inputs have been seen before: its artefacts are copied into the workspace from the cache
+instead. So where an expensive preprocessor depends on a few genes, rendered into its own input file, it only runs
+again when those genes change. A later stage can list an earlier stage's artefacts among its inputs.
+
+The key of a stage hashes its program, the contents of its input files (every file, for a directory) after the
+genotype has been rendered into them, and whatever its key function returns for the workspace, i.e. the lines of a
+shared input file it reads. Artefacts are only cached from a stage which exited with 0 and wrote them all. Entries are
+written to a temporary directory and renamed into place, so workers of any process can share a cache directory.
+The cache isn't invalidated by anything else a stage depends on, so clear it when the programs or template change.
+"""
+
+import hashlib
+import os
+import shutil
+from uuid import uuid4
+
+
+def stage(url, cwd, inputs=(), outputs=(), cache=None, key_func=None, name=None, suppress_output=True,
+          as_admin=False):
+    """
+    Build the execute dictionary entry of a program run as a stage, for the optimiser's stages.
+    :param url: the program, relative to the workspace.
+    :param cwd: the working directory of the program, relative to the workspace.
+    :param inputs: the files or directories, relative to the workspace, which the stage's outputs depend on.
+    :param outputs: the files or directories, relative to the workspace, which the stage writes.
+    :param cache: a StageCache to reuse outputs from, or None to always run the stage.
+    :param key_func: a function of the workspace folder returning a string which is also hashed, or None.
+    :param name: the name of the stage, hashed into its key, defaulting to its url.
+    """
+    return {'URL': url, 'cwd': cwd, 'suppress_output': suppress_output, 'as_admin': as_admin,
+            'name': name if name is not None else url, 'inputs': list(inputs), 'outputs': list(outputs),
+            'cache': cache, 'key_func': key_func}
+
+
+def hash_path(digest, path):
+    """ Add the contents of a file, or of every file under a directory, to a hash, marking paths which are missing."""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                full_path = os.path.join(root, filename)
+                digest.update(os.path.relpath(full_path, path).encode() + b'\0')
+                hash_path(digest, full_path)
+    elif os.path.isfile(path):
+        with open(path, 'rb') as in_fs:
+            for block in iter(lambda: in_fs.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0file')
+    else:
+        digest.update(b'\0missing')
+
+
+def copy_path(source, destination):
+    """ Copy a file or directory, replacing a directory already at the destination."""
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, dirs_exist_ok=True)
+    else:
+        shutil.copy2(source, destination)
+
+
+class StageCache:
+    def __init__(self, directory):
+        """
+        A directory of stage outputs by the hash of their inputs, which may be shared by many workers and runs.
+        The hits and misses are counted in each process separately.
+        """
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, folder, stage):
+        """ Hash the name, program, inputs and key function of a stage in a workspace folder."""
+        digest = hashlib.sha256(str(stage['name']).encode() + b'\0')
+        hash_path(digest, os.path.join(folder, stage['URL']))
+        for path in stage['inputs']:
+            digest.update(str(path).encode() + b'\0')
+            hash_path(digest, os.path.join(folder, path))
+        if stage.get('key_func') is not None:
+            digest.update(str(stage['key_func'](folder)).encode())
+
+        return digest.hexdigest()
+
+    def restore(self, key, folder, stage):
+        """ Copy a stage's cached outputs into a workspace folder, returning False if they aren't cached."""
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            self.misses += 1
+            return False
+
+        for path in stage['outputs']:
+            copy_path(os.path.join(entry, path), os.path.join(folder, path))
+        self.hits += 1
+
+        return True
+
+    def store(self, key, folder, stage):
+        """ Cache a stage's outputs from a workspace folder, returning False if any is missing."""
+        if not all(os.path.exists(os.path.join(folder, path)) for path in stage['outputs']):
+            return False
+
+        entry = os.path.join(self.directory, key)
+        temporary = os.path.join(self.directory, '.tmp-' + str(uuid4()))
+        try:
+            for path in stage['outputs']:
+                copy_path(os.path.join(folder, path), os.path.join(temporary, path))
+            os.makedirs(temporary, exist_ok=True)
+            os.rename(temporary, entry)
+        except OSError:
+            if not os.path.isdir(entry):
+                raise
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+        return True
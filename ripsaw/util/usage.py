@@ -0,0 +1,114 @@
+"""
+Resource accounting of target programs.
+
+The launcher waits for each child with os.wait4, which returns the child's resource usage along with its exit status.
+That usage is kept with the chromosome evaluated, appended to its log row and summarised per epoch, to find genotypes
+which make the target slow or memory hungry and to give the scheduler real numbers to plan with. Where wait4 isn't
+available only the wall time and exit code are known, and the other fields are None.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# ru_maxrss is in kilobytes on Linux but bytes on macOS.
+MAX_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+class ProcessUsage:
+    FIELDS = ('wall_time', 'user_time', 'system_time', 'max_rss', 'block_input', 'block_output', 'exit_code')
+    __slots__ = FIELDS
+
+    def __init__(self, wall_time, user_time=None, system_time=None, max_rss=None, block_input=None,
+                 block_output=None, exit_code=None):
+        """
+        The resources used by one or more target programs run for an evaluation.
+        :param wall_time: the seconds from launch to exit.
+        :param user_time: the seconds of CPU time in user mode.
+        :param system_time: the seconds of CPU time in the kernel.
+        :param max_rss: the peak resident memory in bytes.
+        :param block_input: the number of block input operations.
+        :param block_output: the number of block output operations.
+        :param exit_code: the exit code, negative if killed by a signal.
+        """
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+        self.block_input = block_input
+        self.block_output = block_output
+        self.exit_code = exit_code
+
+    @staticmethod
+    def from_rusage(wall_time, status, rusage):
+        """ Build the usage of a child from its wait status and os.wait4 resource usage."""
+        return ProcessUsage(wall_time=wall_time, user_time=rusage.ru_utime, system_time=rusage.ru_stime,
+                            max_rss=rusage.ru_maxrss * MAX_RSS_UNIT, block_input=rusage.ru_inblock,
+                            block_output=rusage.ru_oublock, exit_code=os.waitstatus_to_exitcode(status))
+
+    @staticmethod
+    def combine(usages):
+        """
+        Combine the usage of programs run one after another: times and operations add up, the peak memory is the
+        largest and the exit code is the first which isn't 0. Returns None for no usages.
+        """
+        usages = list(usages)
+        if not usages:
+            return None
+        if len(usages) == 1:
+            return usages[0]
+
+        def total(field):
+            values = [getattr(usage, field) for usage in usages if getattr(usage, field) is not None]
+            return sum(values) if values else None
+
+        max_rss = [usage.max_rss for usage in usages if usage.max_rss is not None]
+        exit_codes = [usage.exit_code for usage in usages if usage.exit_code]
+
+        return ProcessUsage(wall_time=total('wall_time'), user_time=total('user_time'),
+                            system_time=total('system_time'), max_rss=max(max_rss) if max_rss else None,
+                            block_input=total('block_input'), block_output=total('block_output'),
+                            exit_code=exit_codes[0] if exit_codes else 0)
+
+    def cpu_time(self):
+        if self.user_time is None:
+            return None
+        return self.user_time + self.system_time
+
+    def as_row(self):
+        """ The usage as log values, in the order of FIELDS, with unknown values left blank."""
+        return ["" if getattr(self, field) is None else getattr(self, field) for field in ProcessUsage.FIELDS]
+
+    def __repr__(self):
+        return "ProcessUsage(" + ", ".join(field + "=" + repr(getattr(self, field))
+                                           for field in ProcessUsage.FIELDS) + ")"
+
+
+def summarise_usage(usages):
+    """
+    Summarise the usage of an epoch's evaluations.
+    :param usages: a list of ProcessUsage, one per evaluation.
+    :return: a dictionary of the number of evaluations, the mean and max of wall and CPU time in seconds, the mean and
+    max of peak memory in bytes, the total block operations and the number which failed, or None for no usages.
+    """
+    usages = [usage for usage in usages if usage is not None]
+    if not usages:
+        return None
+
+    def column(values):
+        return np.asarray([value for value in values if value is not None], dtype=float)
+
+    wall = column(usage.wall_time for usage in usages)
+    cpu = column(usage.cpu_time() for usage in usages)
+    rss = column(usage.max_rss for usage in usages)
+    blocks = column((usage.block_input or 0) + (usage.block_output or 0) for usage in usages)
+
+    return {'evaluations': len(usages),
+            'mean_wall_time': float(wall.mean()), 'max_wall_time': float(wall.max()),
+            'mean_cpu_time': float(cpu.mean()) if cpu.size else None,
+            'max_cpu_time': float(cpu.max()) if cpu.size else None,
+            'mean_max_rss': float(rss.mean()) if rss.size else None,
+            'max_max_rss': float(rss.max()) if rss.size else None,
+            'block_operations': int(blocks.sum()),
+            'failures': sum(1 for usage in usages if usage.exit_code)}
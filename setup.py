@@ -12,6 +12,11 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://gitlab.com/maritime-warfare-centre/ripsaw",
+    packages=setuptools.find_packages(exclude=["tests"]),
+    install_requires=["numpy"],
+    entry_points={
+        "console_scripts": ["ripsaw=ripsaw.__main__:main"]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
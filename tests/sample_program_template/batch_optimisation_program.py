@@ -0,0 +1,20 @@
+import math as math
+import sys
+epsilon = sys.float_info.epsilon
+
+# A batch version of the sample optimisation program, where every X begins a new parameter set.
+with open("input.txt", 'r') as in_fs:
+    lines = in_fs.readlines()
+
+    parameter_sets = list()
+    for i, line in enumerate(lines):
+        if "X" in line:
+            parameter_sets.append({'x': float(lines[i+1]), 'z': int()})
+        if "Z" in line:
+            parameter_sets[-1]['z'] = float(lines[i+1])
+
+    with open("output.txt", 'w') as out_fs:
+        for i, parameters in enumerate(parameter_sets):
+            x, z = parameters['x'], parameters['z']
+            y = -(abs((x-1)/math.exp(math.sin(1/(x-1+epsilon)))) * abs((z-1)/math.exp(math.sin(1/(z-1+epsilon))))) + 2
+            out_fs.write("Result " + str(i) + " was " + str(y) + "\n")
@@ -0,0 +1,2 @@
+#!/bin/sh
+python3 batch_optimisation_program.py
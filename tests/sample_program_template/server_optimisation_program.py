@@ -0,0 +1,24 @@
+import json
+import math as math
+import sys
+epsilon = sys.float_info.epsilon
+
+# A server version of the sample optimisation program, answering one JSON encoded genotype per line on stdin.
+for request in sys.stdin:
+    request = request.strip()
+    if request == "PING":
+        print("PONG", flush=True)
+        continue
+
+    lines = json.loads(request).split("\n")
+    x = int()
+    z = int()
+    for i, line in enumerate(lines):
+        if "X" in line:
+            x = float(lines[i+1])
+        if "Z" in line:
+            z = float(lines[i+1])
+
+    y = -(abs((x-1)/math.exp(math.sin(1/(x-1+epsilon)))) * abs((z-1)/math.exp(math.sin(1/(z-1+epsilon))))) + 2
+
+    print(str(y) + "\t" + str(x) + "\t" + str(z), flush=True)
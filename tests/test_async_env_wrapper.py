@@ -0,0 +1,104 @@
+"""
+Test functionality of the asyncio environment wrapper.
+
+The 'setUp' function creates set up chromosomes to be used in the unit tests.
+"""
+import asyncio
+import unittest
+import os
+import shutil
+import tempfile
+from ripsaw.async_env_wrapper import AsyncEvaluator, AsyncEnvWrapper
+from ripsaw.util.launcher import Launcher
+from ripsaw.util.stages import StageCache, stage
+from ripsaw.genetics.genotype import Chromosome
+from tests import test_genetics
+from tests import test_env_wrapper
+
+
+@unittest.skipIf(os.name == "nt", "The sample program used is only supplied as a shell script.")
+class TestAsyncEnvWrapper(unittest.TestCase):
+    def test_evaluate_population(self):
+        self.chromosomes[0].fitness = 100
+
+        AsyncEvaluator(max_concurrency=4).evaluate_population(self.chromosomes)
+
+        self.assertEqual(100, self.chromosomes[0].fitness)
+        for chromosome in self.chromosomes[1:]:
+            self.assertIsInstance(chromosome.fitness, float)
+            self.assertEqual(chromosome.fitness, chromosome.get_log_row()[2])
+
+    def test_workspaces_removed(self):
+        parent = os.path.dirname(self.target_dir_path)
+        before = set(os.listdir(parent))
+
+        AsyncEvaluator().evaluate_population(self.chromosomes)
+
+        self.assertEqual(before, set(os.listdir(parent)))
+
+    def test_launcher_used(self):
+        class RecordingLauncher(Launcher):
+            def __init__(self):
+                super().__init__()
+                self.reserved = 0
+                self.unreserved = 0
+
+            def reserve(self):
+                self.reserved += 1
+                return super().reserve()
+
+            def unreserve(self, token):
+                self.unreserved += 1
+
+        launcher = RecordingLauncher()
+        for chromosome in self.chromosomes:
+            chromosome.evaluation_setup.launcher = launcher
+
+        AsyncEvaluator(max_concurrency=4).evaluate_population(self.chromosomes)
+
+        self.assertEqual((8, 8), (launcher.reserved, launcher.unreserved))
+
+    def test_stage_cache(self):
+        folder = tempfile.mkdtemp()
+        try:
+            template = os.path.join(folder, 'template')
+            os.makedirs(template)
+            with open(os.path.join(template, 'params.inp'), 'w') as out_fs:
+                out_fs.write("1\n")
+            with open(os.path.join(template, 'pre.sh'), 'w') as out_fs:
+                out_fs.write("#!/bin/sh\ncat params.inp > params.out\n")
+            os.chmod(os.path.join(template, 'pre.sh'), 0o755)
+            cache = StageCache(os.path.join(folder, 'cache'))
+            execute_dict = {'files': [stage('pre.sh', '.', inputs=['params.inp'], outputs=['params.out'],
+                                            cache=cache)]}
+
+            for _ in range(2):
+                wrapper = AsyncEnvWrapper(template)
+                try:
+                    self.assertEqual([0], asyncio.run(wrapper.execute_async(execute_dict)))
+                    self.assertTrue(os.path.exists(os.path.join(wrapper.folder, 'params.out')))
+                finally:
+                    wrapper.close()
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+        finally:
+            shutil.rmtree(folder)
+
+    def setUp(self):
+        self.target_dir_path = os.path.dirname(os.path.abspath(__file__))
+        self.chromosomes = list()
+        for _ in range(8):
+            chromosome = Chromosome(chromosome_function=test_genetics.TestGenetics.for_test_program_chromosome_function)
+            # The batch program scores a batch of one the same way as the sample program.
+            chromosome.setup("sample_program_template",
+                             os.path.join('sample_program_template', 'run_batch_program.sh'), self.target_dir_path,
+                             os.path.join('sample_program_template', 'input.txt'), '<region1>\n',
+                             test_env_wrapper.TestEnvWrapper.get_output_score_func,
+                             os.path.join('sample_program_template', 'output.txt'),
+                             test_genetics.TestGenetics.get_output_log,
+                             os.path.join('sample_program_template', 'output.txt'),
+                             optimiser_dict={"epoch_num": 0})
+            self.chromosomes.append(chromosome)
+
+
+if __name__ == '__main__':
+    unittest.main()
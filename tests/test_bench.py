@@ -0,0 +1,99 @@
+"""
+Test functionality of the throughput calibration.
+"""
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from ripsaw import bench
+from ripsaw.genetics.genotype import EvaluationSetup
+from tests import test_genetics
+from tests import test_env_wrapper
+
+
+class TestBench(unittest.TestCase):
+    def test_default_levels(self):
+        self.assertEqual([1, 2, 4, 6], bench.default_levels(6))
+        self.assertEqual([1, 2, 4, 8], bench.default_levels(8))
+        self.assertEqual([1], bench.default_levels(1))
+
+    def test_find_knee(self):
+        results = [{'strategy': 'sync', 'concurrency': c, 'throughput': t}
+                   for c, t in [(1, 10.0), (2, 19.0), (4, 30.0), (8, 31.0), (16, 40.0)]]
+        self.assertEqual(4, bench.find_knee(results)['concurrency'])
+        self.assertEqual(1, bench.find_knee(results, min_gain=1.0)['concurrency'])
+
+    def test_recommend(self):
+        results = [{'strategy': 'sync', 'concurrency': 1, 'throughput': 10.0},
+                   {'strategy': 'sync', 'concurrency': 2, 'throughput': 10.5},
+                   {'strategy': 'deferred', 'concurrency': 1, 'throughput': 10.0},
+                   {'strategy': 'deferred', 'concurrency': 2, 'throughput': 18.0}]
+        best = bench.recommend(results)
+        self.assertEqual(('deferred', 2), (best['strategy'], best['concurrency']))
+
+    def test_import_function(self):
+        self.assertIs(test_env_wrapper.TestEnvWrapper.get_output_score_func,
+                      bench.import_function('tests.test_env_wrapper:TestEnvWrapper.get_output_score_func'))
+
+    @unittest.skipIf(os.name == "nt", "The sample program used is only supplied as a shell script.")
+    def test_console_script_imports_from_working_directory(self):
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        folder = tempfile.mkdtemp()
+        try:
+            # Like the installed console script, run from a bin directory which isn't the working directory.
+            bin_dir, model_dir = os.path.join(folder, 'bin'), os.path.join(folder, 'model')
+            os.makedirs(bin_dir)
+            os.makedirs(model_dir)
+            script = os.path.join(bin_dir, 'ripsaw')
+            with open(script, 'w') as out_fs:
+                out_fs.write("import sys\nfrom ripsaw.__main__ import main\nsys.exit(main())\n")
+            with open(os.path.join(model_dir, 'bench_model.py'), 'w') as out_fs:
+                out_fs.write("from tests.test_env_wrapper import TestEnvWrapper\n"
+                             "from tests.test_genetics import TestGenetics\n"
+                             "get_score = TestEnvWrapper.get_output_score_func\n"
+                             "chromosome_function = TestGenetics.for_test_program_chromosome_function\n")
+
+            output = subprocess.run([sys.executable, script, 'bench',
+                                     '--target-dir', os.path.join(package_dir, 'tests'),
+                                     '--exe', os.path.join('sample_program_template', 'run_batch_program.sh'),
+                                     '--cwd', 'sample_program_template',
+                                     '--input-file', os.path.join('sample_program_template', 'input.txt'),
+                                     '--region', '<region1>',
+                                     '--output-file', os.path.join('sample_program_template', 'output.txt'),
+                                     '--score-func', 'bench_model:get_score',
+                                     '--chromosome-func', 'bench_model:chromosome_function',
+                                     '--levels', '1', '--evaluations', '1', '--strategies', 'sync'],
+                                    cwd=model_dir, env=dict(os.environ, PYTHONPATH=package_dir),
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            self.assertEqual(0, output.returncode, output.stdout)
+            self.assertIn("Recommended configuration", output.stdout)
+        finally:
+            shutil.rmtree(folder)
+
+    @unittest.skipIf(os.name == "nt", "The sample program used is only supplied as a shell script.")
+    def test_measure(self):
+        target_dir_path = os.path.dirname(os.path.abspath(__file__))
+        evaluation_setup = EvaluationSetup("sample_program_template",
+                                           os.path.join('sample_program_template', 'run_batch_program.sh'),
+                                           target_dir_path, os.path.join('sample_program_template', 'input.txt'),
+                                           '<region1>\n', test_env_wrapper.TestEnvWrapper.get_output_score_func,
+                                           os.path.join('sample_program_template', 'output.txt'),
+                                           test_genetics.TestGenetics.get_output_log,
+                                           os.path.join('sample_program_template', 'output.txt'),
+                                           {"epoch_num": 0})
+        before = set(os.listdir(os.path.dirname(target_dir_path)))
+
+        for strategy in bench.WORKSPACE_STRATEGIES:
+            result = bench.measure(evaluation_setup, test_genetics.TestGenetics.for_test_program_chromosome_function,
+                                   2, 4, strategy)
+            self.assertEqual((2, strategy), (result['concurrency'], result['strategy']))
+            self.assertGreater(result['throughput'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+
+        self.assertEqual(before, set(os.listdir(os.path.dirname(target_dir_path))))
+
+
+if __name__ == '__main__':
+    unittest.main()
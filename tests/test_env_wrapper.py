@@ -60,6 +60,21 @@ class TestEnvWrapper(unittest.TestCase):
         score = self.wrapper.get_output_score(get_output_dict=self.output_dict)
         self.assertEqual(123, score)
 
+    def test_get_batch_output_scores(self):
+        """
+        Split one output file into several scores, and check a wrongly sized split is caught.
+        """
+        def split_func(url, batch_size):
+            return [self.get_output_score_func(url)] * batch_size
+
+        self.output_dict['files'][0]['function'] = split_func
+        scores = self.wrapper.get_batch_output_scores(get_output_dict=self.output_dict, batch_size=3)
+        self.assertEqual([123, 123, 123], scores)
+
+        self.output_dict['files'][0]['function'] = lambda url, batch_size: [1]
+        with self.assertRaises(ValueError):
+            self.wrapper.get_batch_output_scores(get_output_dict=self.output_dict, batch_size=3)
+
     def setUp(self):
         """
         All the components we need for the other unit tests in this file.
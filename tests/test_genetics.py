@@ -6,12 +6,35 @@ The 'setUp' function creates variables and functions to be used in the unit test
 import unittest
 from unittest.mock import patch
 import numpy as np
-from ripsaw.genetics.genotype import AbstractGene, Chromosome
+from ripsaw.genetics.genotype import AbstractGene, Chromosome, EvaluationSetup
 from ripsaw.genetics.crossovers import point_crossover, multiple_crossovers
-from ripsaw.genetics.selection import roulette, uniform_random
+from ripsaw.genetics.selection import roulette, uniform_random, crowded_tournament
+from ripsaw.genetics.pareto import fast_non_dominated_sort, crowding_distance, ParetoArchive
+from ripsaw.util.cleanup import WorkspaceCleaner, release_workspace
 from ripsaw.genetics.optimiser import Optimiser
+from ripsaw.genetics.history import FitnessHistory
+from ripsaw.genetics.stopping import Stagnation, DiversityCollapse
+from ripsaw.genetics.mutation import OneFifthSuccessRule, DiversityTriggered, Annealing
+from ripsaw.genetics.batch import ChromosomeBatch, make_batches
+from ripsaw.genetics.cache import FitnessCache
+from ripsaw.genetics.sweep import grid, configuration_name
+from ripsaw.genetics.speculation import Speculator, SpeculationRound
+from ripsaw.genetics.events import RunStarted, ChromosomeEvaluated, EpochFinished, RunFinished
+from ripsaw.genetics.engines import CMAES, DifferentialEvolution
+from ripsaw.genetics.replication import Replicate, Replication, t_quantile
+from ripsaw.genetics.feasibility import Feasibility
+from ripsaw.genetics.archive import RunArchive, ArchiveReader
+from ripsaw.shared_env_wrapper import SharedMemoryEvaluator
+from ripsaw.util.scheduler import ResourceScheduler
+from ripsaw.genetics.diversity import population_diversity, pairwise_hamming, pairwise_euclidean, \
+    mean_pairwise_distance, gene_entropy, shared_fitness
+import asyncio
 import os
 import sys
+import tempfile
+import threading
+import time
+import types
 from tests.test_env_wrapper import TestEnvWrapper
 
 # logging.getLogger().setLevel(logging.DEBUG)
@@ -42,6 +65,9 @@ class TestProgramXGene(AbstractGene):
         if self.chromosome:
             self.chromosome.reset_fitness()
 
+    def set_float(self, value):
+        self.value = float(np.clip(value, -5, 5))
+
 
 class TestProgramZGene(AbstractGene):
     def __init__(self, chromosome=None):
@@ -70,11 +96,23 @@ class TestProgramZGene(AbstractGene):
         if self.chromosome:
             self.chromosome.reset_fitness()
 
+    def set_float(self, value):
+        self.value = float(np.clip(value, -5, 5))
+
 
 class TestGene(AbstractGene):
     pass
 
 
+class TestFixedGene(TestProgramXGene):
+    set_float = AbstractGene.set_float
+
+
+class TestStateAwareGene(TestProgramXGene):
+    def mutate(self, epoch_num=None, diversity=None):
+        self.value = (epoch_num, diversity)
+
+
 class TestGenetics(unittest.TestCase):
     @staticmethod
     def get_output_score_func(output_file):
@@ -90,6 +128,18 @@ class TestGenetics(unittest.TestCase):
                     return tokens[-1]
             raise Exception("Result couldn't be found - was the file created? URL:" + str(output_file))
 
+    @staticmethod
+    def get_batch_output_scores_func(output_file, batch_size):
+        """
+        A tests function for splitting a score per batch member out of a batch program's output file.
+        """
+        scores = list()
+        with open(output_file, 'r') as in_fs:
+            for line in in_fs.readlines():
+                if "Result" in line:
+                    scores.append(line.split(" ")[-1])
+        return scores
+
     @staticmethod
     def multi_gene_chromosome_function(chromosome, num_chromo=3):
         genes = []
@@ -428,6 +478,541 @@ class TestGenetics(unittest.TestCase):
         print("Uniform Counter:", counter)
         self.assertTrue(in_range)
 
+    def test_fitness_history_growth(self):
+        history = FitnessHistory(capacity=2)
+        for i in range(5):
+            history.append(best=i, mean=i / 2, std_dev=1.0, diversity=1.0)
+
+        self.assertEqual(5, len(history))
+        self.assertEqual([0, 1, 2, 3, 4], list(history.best))
+        self.assertEqual((4, 5), history.as_array().shape)
+
+    def test_stagnation_criterion(self):
+        optimiser = Optimiser.__new__(Optimiser)
+        optimiser.history = FitnessHistory()
+        criterion = Stagnation(window=3, epsilon=0.01)
+
+        for best in [1.0, 1.5, 1.505, 1.505]:
+            optimiser.history.append(best=best, mean=0, std_dev=0, diversity=1)
+        self.assertFalse(criterion(optimiser))
+
+        optimiser.history.append(best=1.508, mean=0, std_dev=0, diversity=1)
+        self.assertTrue(criterion(optimiser))
+
+    def test_diversity_collapse_criterion(self):
+        optimiser = Optimiser.__new__(Optimiser)
+        optimiser.history = FitnessHistory()
+        optimiser.stopping_criteria = [DiversityCollapse(threshold=0.2, window=2), lambda o: False]
+
+        for diversity in [1.0, 0.1, 0.5, 0.1]:
+            optimiser.history.append(best=0, mean=0, std_dev=0, diversity=diversity)
+        self.assertFalse(optimiser.custom_stopping_criteria_met())
+
+        optimiser.history.append(best=0, mean=0, std_dev=0, diversity=0.2)
+        self.assertTrue(optimiser.custom_stopping_criteria_met())
+
+    def test_mutate_params_filtered(self):
+        chromosome = Chromosome(chromosome_function=lambda chromosome: [TestStateAwareGene(), TestProgramXGene()])
+        chromosome.mutate(p_gene_mutate=1.0, epoch_num=3, diversity=0.5, std_dev=1.0)
+
+        self.assertEqual((3, 0.5), chromosome[0].value)
+        self.assertIsInstance(chromosome[1].value, float)
+
+    def test_one_fifth_success_rule(self):
+        optimiser = Optimiser.__new__(Optimiser)
+        optimiser.history = FitnessHistory()
+        optimiser.p_gene_mutate, optimiser.p_total_mutate = 0.5, 0.1
+        optimiser.internal_dict = {"epoch_num": 1}
+        for mean in [1.0, 2.0]:
+            optimiser.history.append(best=0, mean=mean, std_dev=0, diversity=1)
+
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(4)]
+        for chromosome, fitness in zip(chromosomes, [3, 0, 0, 0]):
+            chromosome.fitness = fitness
+            chromosome.creation_epoch_number = 1
+
+        schedule = OneFifthSuccessRule(factor=0.5)
+        self.assertEqual((1.0, 0.2), schedule(optimiser, chromosomes))
+        chromosomes[0].fitness = 0
+        self.assertEqual((0.25, 0.05), schedule(optimiser, chromosomes))
+
+    def test_diversity_triggered_and_annealing(self):
+        optimiser = Optimiser.__new__(Optimiser)
+        optimiser.p_gene_mutate, optimiser.p_total_mutate = 0.2, 0.1
+        optimiser.internal_dict = {"epoch_num": 0}
+
+        optimiser.diversity = 0.1
+        self.assertEqual((0.4, 0.2), DiversityTriggered(threshold=0.5)(optimiser, []))
+
+        schedule = Annealing(final_p_gene_mutate=0.0, final_p_total_mutate=0.0, num_epochs=2)
+        self.assertEqual((0.1, 0.05), schedule(optimiser, []))
+        optimiser.internal_dict["epoch_num"] = 5
+        self.assertEqual((0.0, 0.0), schedule(optimiser, []))
+
+    @unittest.skipIf(os.name == "nt", "The batch sample program is only supplied as a shell script.")
+    def test_batch_evaluate(self):
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.for_test_program_chromosome_function)
+                       for _ in range(5)]
+        for chromosome in chromosomes:
+            chromosome.setup("sample_program_template", os.path.join('sample_program_template', 'run_batch_program.sh'),
+                             os.path.dirname(os.path.abspath(__file__)),
+                             os.path.join('sample_program_template', 'input.txt'), '<region1>\n',
+                             TestEnvWrapper.get_output_score_func,
+                             os.path.join('sample_program_template', 'output.txt'),
+                             TestGenetics.get_output_log, os.path.join('sample_program_template', 'output.txt'),
+                             optimiser_dict={"epoch_num": 0})
+
+        batches = make_batches(chromosomes, 2, region_func=lambda chromos: "".join(str(c) for c in chromos),
+                               score_func=TestGenetics.get_batch_output_scores_func,
+                               log_func=lambda url, batch_size: [[url]] * batch_size)
+        self.assertEqual([2, 2, 1], [len(batch) for batch in batches])
+
+        for batch in batches:
+            batch.evaluate()
+
+        for chromosome in chromosomes:
+            self.assertIsInstance(chromosome.fitness, float)
+            self.assertEqual(chromosome.fitness, chromosome.get_log_row()[2])
+
+    def test_chromosome_compact(self):
+        evaluation_setup = EvaluationSetup("sample_program_template", "run_program.sh", "target",
+                                           "input.txt", "<region1>\n",
+                                           TestEnvWrapper.get_output_score_func, "output.txt",
+                                           TestGenetics.get_output_log, "output.txt",
+                                           optimiser_dict={"epoch_num": 0})
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(2)]
+        for chromosome in chromosomes:
+            chromosome.use_setup(evaluation_setup, optimiser_dict={"epoch_num": 2})
+            self.assertFalse(hasattr(chromosome, '__dict__'))
+
+        self.assertIs(chromosomes[0].execute_dict, chromosomes[1].execute_dict)
+        self.assertIs(chromosomes[1], chromosomes[1].genotype_dict['files'][0]['region_value']["<region1>\n"])
+
+        chromosomes[0].set_result(fitness=1.5, user_output_log=["log"])
+        log_text = chromosomes[0].get_log_text()
+        self.assertTrue(log_text.startswith("2," + chromosomes[0].uuid + ",1.5,"))
+        self.assertTrue(log_text.endswith("log," + "," * 7))  # No resource usage, as it wasn't executed here.
+
+        chromosomes[0].release_log()
+        self.assertIsNone(chromosomes[0].get_log_row())
+        self.assertIsNone(chromosomes[0].user_output_log)
+        self.assertEqual(log_text, chromosomes[0].get_log_text())
+
+    def test_fast_non_dominated_sort(self):
+        objectives = np.random.uniform(size=(60, 3))
+        ranks = fast_non_dominated_sort(objectives)
+
+        for i in range(len(objectives)):
+            dominators = [j for j in range(len(objectives)) if (objectives[j] >= objectives[i]).all() and
+                          (objectives[j] > objectives[i]).any()]
+            if dominators:
+                self.assertEqual(ranks[i], max(ranks[j] for j in dominators) + 1)
+            else:
+                self.assertEqual(0, ranks[i])
+
+        self.assertEqual([0, 0, 1, 2], list(fast_non_dominated_sort([[2, 1], [1, 2], [1, 1], [0, 0]])))
+
+    def test_crowding_distance(self):
+        distances = crowding_distance([[0, 4], [1, 3], [3, 1], [4, 0]])
+
+        self.assertEqual([np.inf, 1.5, 1.5, np.inf], list(distances))
+
+    def test_pareto_archive_and_tournament(self):
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(3)]
+        for chromosome, objectives in zip(chromosomes, [[2, 1], [1, 2], [1, 1]]):
+            chromosome.set_result(fitness=sum(objectives), user_output_log=[], objectives=objectives)
+
+        archive = ParetoArchive()
+        archive.update(chromosomes)
+        self.assertEqual({chromosomes[0].uuid, chromosomes[1].uuid}, set(member.uuid for member in archive.members))
+
+        chromosomes[2].set_result(fitness=6, user_output_log=[], objectives=[3, 3])
+        chromosomes[2].set_unique_id()
+        archive.update(chromosomes[2:])
+        self.assertEqual([chromosomes[2].uuid], [member.uuid for member in archive.members])
+
+        selection = crowded_tournament(chromosomes[:2], num_samples=1, ranks=[1, 0], crowding=[0, 0])
+        self.assertIs(chromosomes[1], selection[0])
+
+    @unittest.skipIf(os.name == "nt", "The batch sample program is only supplied as a shell script.")
+    def test_deferred_workspace_cleanup(self):
+        target_dir_path = os.path.dirname(os.path.abspath(__file__))
+        evaluation_setup = EvaluationSetup("sample_program_template",
+                                           os.path.join('sample_program_template', 'run_batch_program.sh'),
+                                           target_dir_path, os.path.join('sample_program_template', 'input.txt'),
+                                           '<region1>\n', TestEnvWrapper.get_output_score_func,
+                                           os.path.join('sample_program_template', 'output.txt'),
+                                           TestGenetics.get_output_log,
+                                           os.path.join('sample_program_template', 'output.txt'),
+                                           optimiser_dict={"epoch_num": 0}, defer_cleanup=True)
+        chromosome = Chromosome(chromosome_function=TestGenetics.for_test_program_chromosome_function)
+        chromosome.use_setup(evaluation_setup, optimiser_dict={"epoch_num": 0})
+        chromosome.evaluate()
+
+        folder, failed = chromosome.workspace
+        self.assertFalse(failed)
+        self.assertTrue(os.path.exists(os.path.join(folder, 'sample_program_template', 'output.txt')))
+
+        cleaner = WorkspaceCleaner()
+        release_workspace(chromosome, cleaner)
+        cleaner.close()
+        self.assertIsNone(chromosome.workspace)
+        self.assertFalse(os.path.exists(folder))
+
+    def test_diversity_metrics(self):
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(4)]
+        clones = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                             passed_genes=chromosomes[0].full_genotype) for _ in range(4)]
+
+        for metric in ('unique', 'hamming', 'entropy'):
+            self.assertAlmostEqual(1.0, population_diversity(chromosomes, metric))
+        for metric in ('hamming', 'euclidean', 'entropy'):
+            self.assertAlmostEqual(0.0, population_diversity(clones, metric))
+        self.assertAlmostEqual(0.25, population_diversity(clones, 'unique'))
+        self.assertGreater(population_diversity(chromosomes, 'euclidean'), 0)
+
+        codes = np.array([[0, 0, 0], [0, 1, 1], [1, 1, 1]])
+        np.testing.assert_allclose([[0, 2 / 3, 1], [2 / 3, 0, 1 / 3], [1, 1 / 3, 0]], pairwise_hamming(codes))
+        self.assertAlmostEqual(2 / 3, mean_pairwise_distance(codes, 'hamming'))
+        many_codes = np.random.randint(2, size=(100, 20))
+        self.assertAlmostEqual(mean_pairwise_distance(many_codes, 'hamming'),
+                               mean_pairwise_distance(many_codes, 'hamming', max_pairs=1000), delta=0.05)
+        np.testing.assert_allclose([np.log(3) - 2 / 3 * np.log(2)] * 2, gene_entropy(codes)[1:] * np.log(3))
+
+        values = np.array([[0.0, 0.0], [1.0, 1.0], [1.0, 0.0]])
+        np.testing.assert_allclose([0, 1, np.sqrt(0.5)], pairwise_euclidean(values)[0])
+
+    def test_fitness_sharing(self):
+        distances = np.array([[0, 0.1, 1], [0.1, 0, 1], [1, 1, 0]])
+        shared = shared_fitness([2, 2, 2], distances, radius=0.5)
+        self.assertAlmostEqual(shared[0], shared[1])
+        self.assertGreater(shared[2], shared[0])
+        self.assertGreater(shared_fitness([-1, 0, 0], distances, radius=0.5).min(), 0)
+
+    def test_duplicate_elimination_and_crowding(self):
+        optimiser = Optimiser.__new__(Optimiser)
+        optimiser.chromosome_function = TestGenetics.multi_gene_chromosome_function
+        optimiser.crowding_factor = 3
+        optimiser.multi_objective = False
+
+        parent = Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function)
+        parent.fitness = 1.0
+        duplicates = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                                 passed_genes=parent.full_genotype) for _ in range(3)]
+        self.assertEqual({parent.uuid}, set(chromosome.uuid for chromosome in duplicates))
+        chromosomes = optimiser.replace_duplicates(duplicates + [parent])
+        self.assertIs(parent, chromosomes[0])
+        self.assertEqual(4, len(set(chromosome.uuid for chromosome in chromosomes)))
+
+        population = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(3)]
+        for fitness, chromosome in enumerate(population):
+            chromosome.fitness = float(fitness)
+        optimiser.best_score = 2.0
+        child = Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                           passed_genes=population[1].full_genotype[:2] + population[0].full_genotype[2:])
+        replaced = optimiser.replace_with_offspring(population, [child])
+        self.assertEqual([population[0], child, population[2]], replaced)
+
+    def test_fitness_cache(self):
+        cache = FitnessCache()
+        evaluated = list()
+
+        def evaluate(chromosomes):
+            for chromosome in chromosomes:
+                evaluated.append(chromosome)
+                chromosome.set_result(fitness=float(len(evaluated)), user_output_log=[])
+            return chromosomes
+
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(3)]
+        chromosomes.append(Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                                      passed_genes=chromosomes[0].full_genotype))
+        result = cache.evaluate_population(chromosomes, evaluate)
+        self.assertEqual(4, len(result))
+        self.assertEqual(3, len(evaluated))
+        self.assertEqual(chromosomes[0].fitness, chromosomes[3].fitness)
+
+        again = Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                           passed_genes=chromosomes[1].full_genotype)
+        cache.evaluate_population([again], evaluate)
+        self.assertEqual((3, chromosomes[1].fitness), (len(evaluated), again.fitness))
+        self.assertEqual((2, 3), (cache.hits, cache.misses))
+
+        # A genotype claimed elsewhere whose evaluation fails is evaluated by the waiter instead.
+        fresh = Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function)
+        self.assertEqual(([fresh], []), cache.partition([fresh]))
+        copy = Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function,
+                          passed_genes=fresh.full_genotype)
+        threading.Timer(0.05, cache.abandon, args=(fresh.uuid,)).start()
+        cache.evaluate_population([copy], evaluate)
+        self.assertEqual(4, len(evaluated))
+        self.assertIsNotNone(copy.fitness)
+
+    def test_sweep_grid(self):
+        configurations = grid(population_size=[10, 20], p_gene_mutate=[0.1])
+        self.assertEqual([{'population_size': 10, 'p_gene_mutate': 0.1},
+                          {'population_size': 20, 'p_gene_mutate': 0.1}], configurations)
+        self.assertEqual("population_size=10,p_gene_mutate=0.1", configuration_name(configurations[0]))
+
+    def test_speculator(self):
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(6)]
+        genotypes = [str(chromosome) for chromosome in chromosomes]
+        for i, chromosome in enumerate(chromosomes):
+            chromosome.fitness = float(i)
+            chromosome.evaluation_setup = types.SimpleNamespace(launcher=None, defer_cleanup=True)
+        optimiser = types.SimpleNamespace(num_xover_points=1, p_gene_mutate=1.0, p_total_mutate=0.0,
+                                          mutate_params=lambda: {}, internal_dict={'epoch_num': 1})
+
+        def evaluate(chromosome):
+            chromosome.set_result(fitness=1.0, user_output_log=[])
+
+        cache = FitnessCache()
+        speculator = Speculator(ResourceScheduler(total_cores=2), cache, num_elites=3, max_per_round=4)
+        with patch.object(Chromosome, 'evaluate', evaluate):
+            speculator.start(optimiser, chromosomes)
+            deadline = time.time() + 5
+            while speculator.completed < 4 and time.time() < deadline:
+                time.sleep(0.01)
+        speculator.stop()
+
+        self.assertEqual((4, 4, 0), (speculator.started, speculator.completed, speculator.cancelled))
+        self.assertEqual(4, len(cache))
+        self.assertEqual((0, 0), (speculator.scheduler.running, speculator.scheduler.speculative))
+        self.assertEqual(genotypes, [str(chromosome) for chromosome in chromosomes])  # Bred from copies.
+
+        # A converged population breeds nothing new, so the round ends once its attempts are spent.
+        converged = types.SimpleNamespace(num_xover_points=1, p_gene_mutate=0.0, p_total_mutate=0.0,
+                                          mutate_params=lambda: {}, internal_dict={'epoch_num': 2})
+        speculator = Speculator(ResourceScheduler(total_cores=2), FitnessCache(), num_elites=1, max_per_round=4)
+        with patch.object(Chromosome, 'evaluate', evaluate):
+            thread = threading.Thread(target=speculator.run_round, args=(SpeculationRound(), converged, chromosomes),
+                                      daemon=True)
+            thread.start()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, speculator.started)
+
+    def make_function_optimiser(self, log_dir, population_size=6, evaluator=None, chromosome_function=None,
+                                **parameters):
+        """
+        An optimiser scoring chromosomes by the sum of their genes, in this process rather than by a target, unless
+        another evaluator is given.
+        """
+        return Optimiser(population_size=population_size,
+                         chromosome_function=chromosome_function or TestGenetics.multi_gene_chromosome_function,
+                         num_xovers=2, num_xover_points=1, p_gene_mutate=0.5, p_total_mutate=0.1,
+                         cwd="sample_program_template", parallel_exe=False,
+                         exe_file_path=os.path.join('sample_program_template', 'run_program.sh'),
+                         target_dir_path=log_dir, input_file_path=os.path.join('sample_program_template', 'input.txt'),
+                         region_identifier='<region1>\n', output_score_func=TestEnvWrapper.get_output_score_func,
+                         output_file_path=os.path.join('sample_program_template', 'output.txt'),
+                         output_log_func=TestGenetics.get_output_log,
+                         output_log_file=os.path.join('sample_program_template', 'output.txt'), population=list(),
+                         verbose=False,
+                         evaluator=evaluator if evaluator is not None else
+                         SharedMemoryEvaluator(lambda genes: float(np.sum(genes)), num_workers=0),
+                         log_file=os.path.join(log_dir, "log.csv"), **parameters)
+
+    def test_pool_size(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            with self.make_function_optimiser(log_dir, pool_size=3).pool() as pool:
+                self.assertEqual(3, pool._processes)
+            with self.make_function_optimiser(log_dir).pool() as pool:
+                self.assertEqual(max(os.cpu_count() - 2, 1), pool._processes)
+
+    def test_optimiser_events(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            events = list()
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=3, callbacks=[events.append])
+            optimiser.run()
+            self.assertIsInstance(events[0], RunStarted)
+            self.assertIsInstance(events[-1], RunFinished)
+            self.assertEqual([1, 2, 3], [event.epoch_num for event in events if isinstance(event, EpochFinished)])
+            self.assertEqual(6, sum(1 for event in events
+                                    if isinstance(event, ChromosomeEvaluated) and event.epoch_num == 0))
+
+            # Leaving a stream early stops the run.
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=1000)
+            with optimiser.events() as stream:
+                for event in stream:
+                    if isinstance(event, EpochFinished):
+                        break
+            self.assertLess(optimiser.internal_dict["epoch_num"], 1000)
+
+            async def follow(stream):
+                return [event async for event in stream]
+
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=2)
+            events = asyncio.run(follow(optimiser.events()))
+            self.assertEqual(2, sum(1 for event in events if isinstance(event, EpochFinished)))
+            self.assertIsInstance(events[-1], RunFinished)
+
+    def test_engines(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            for engine in [DifferentialEvolution(), CMAES()]:
+                optimiser = self.make_function_optimiser(log_dir, population_size=12, engine=engine, target_score=14.9,
+                                                         num_epochs=200)
+                optimiser.run()
+                self.assertGreaterEqual(optimiser.best_score, 14.9)  # Every gene close to its upper bound of 5.
+                self.assertLess(optimiser.internal_dict["epoch_num"], 200)
+                self.assertEqual(12, len(optimiser.population))
+
+        with self.assertRaises(ValueError):
+            self.make_function_optimiser(".", engine=CMAES(), multi_objective=True)
+        with self.assertRaises(ValueError):
+            self.make_function_optimiser(".", population_size=3, engine=DifferentialEvolution())
+
+        # Genes which can't be set from a float fail before the first epoch is spent on the target.
+        def fixed_gene_chromosome_function(chromosome):
+            return [TestProgramXGene(chromosome), TestFixedGene(chromosome)]
+
+        for parameters in [{'engine': DifferentialEvolution()},
+                           {'feasibility': Feasibility(lambda values: values[:, 0] > 0, repair=lambda values: values,
+                                                       vectorised=True)}]:
+            with self.assertRaises(ValueError):
+                self.make_function_optimiser(".", chromosome_function=fixed_gene_chromosome_function, **parameters)
+
+    def test_replication_racing(self):
+        self.assertAlmostEqual(12.706, t_quantile(0.975, 1), places=3)
+        self.assertAlmostEqual(2.228, t_quantile(0.975, 10), places=3)
+
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(6)]
+        means = {chromosome.uuid: 2.0 * i for i, chromosome in enumerate(chromosomes)}
+        seeds = {chromosome.uuid: list() for chromosome in chromosomes}
+
+        def evaluate(replicate):
+            seeds[replicate.chromosome.uuid].append(replicate.seed)
+            noise = np.random.default_rng(replicate.seed * 100 + replicate.candidate).normal(0, 0.5)
+            replicate.objectives = [means[replicate.chromosome.uuid] + noise]
+            replicate.user_output_log = ["log"]
+
+        def run_tasks(tasks):
+            for task in tasks:
+                task.evaluate()
+            return list(reversed(tasks))  # As a pool may, in any order.
+
+        evaluated = list()
+        optimiser = types.SimpleNamespace(run_tasks=run_tasks, evaluated=evaluated.append)
+        replication = Replication('<seed>', min_replicates=2, max_replicates=8, base_seed=10)
+        with patch.object(Replicate, 'evaluate', evaluate):
+            replication.evaluate_population(optimiser, chromosomes)
+
+        counts = [len(chromosome.replicates) for chromosome in chromosomes]
+        self.assertEqual(6, len(evaluated))
+        self.assertEqual(chromosomes[5], max(chromosomes, key=Chromosome.get_fitness))
+        self.assertTrue(all(2 <= count <= 8 for count in counts))
+        self.assertLess(counts[0], 8)  # The clearly worst drop out of the race early.
+        self.assertLess(sum(counts), 6 * 8)
+        for chromosome, count in zip(chromosomes, counts):
+            self.assertEqual(list(range(10, 10 + count)), sorted(seeds[chromosome.uuid]))  # Common seeds.
+            self.assertEqual(["log", count], chromosome.user_output_log[:2])
+            self.assertAlmostEqual(np.mean(chromosome.replicates), chromosome.fitness)
+
+        # Chromosomes evaluated in an earlier epoch race again, and more replicates are given where needed.
+        chromosomes[0].reset_fitness()
+        self.assertIsNone(chromosomes[0].replicates)
+        with patch.object(Replicate, 'evaluate', evaluate):
+            replication.evaluate_population(optimiser, chromosomes)
+        self.assertEqual(7, len(evaluated))
+        self.assertTrue(all(count <= len(chromosome.replicates) for chromosome, count in zip(chromosomes, counts)))
+
+        with self.assertRaises(ValueError):
+            self.make_function_optimiser(".", replication=replication)
+        with self.assertRaises(ValueError):
+            Replication('<seed>', min_replicates=1)  # A single replicate's interval is unbounded, so never decided.
+
+    def test_feasibility(self):
+        chromosomes = [Chromosome(chromosome_function=TestGenetics.multi_gene_chromosome_function) for _ in range(40)]
+        chromosomes[0].set_result(fitness=1.0, user_output_log=[])
+        sums = np.asarray([sum(float(gene) for gene in chromosome) for chromosome in chromosomes[1:]])
+
+        feasibility = Feasibility(check=lambda values: values.sum(axis=1) <= 0,
+                                  repair=lambda values: values - values.sum(axis=1, keepdims=True) / 3 - 0.1,
+                                  penalty=-100.0, vectorised=True)
+        penalised = feasibility.screen(chromosomes)
+
+        self.assertEqual(39, feasibility.checked)
+        self.assertEqual(np.sum(sums > 0), feasibility.repaired + feasibility.penalised)
+        self.assertGreater(feasibility.repaired, 0)
+        self.assertEqual(1.0, chromosomes[0].fitness)  # Already evaluated, so not checked.
+        for chromosome in chromosomes[1:]:
+            feasible = sum(float(gene) for gene in chromosome) <= 0
+            self.assertEqual(not feasible, chromosome in penalised)
+            self.assertEqual(None if feasible else -100.0, chromosome.fitness)
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            events = list()
+            feasibility = Feasibility(check=lambda chromosome: float(chromosome[0]) < 0,
+                                      penalty=lambda chromosome: -100.0 - float(chromosome[0]))
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=3, feasibility=feasibility,
+                                                     callbacks=[lambda event: events.append(
+                                                         (float(event.chromosome[0]), event.chromosome.fitness))
+                                                         if isinstance(event, ChromosomeEvaluated) else None])
+            optimiser.run()
+
+        self.assertEqual(feasibility.checked, len(events))
+        self.assertGreater(feasibility.penalised, 0)
+        for value, fitness in events:
+            self.assertEqual(value >= 0, fitness <= -100.0)
+
+        def evaluate_objectives(chromosomes):
+            for chromosome in chromosomes:
+                if chromosome.fitness is None:
+                    chromosome.set_result(fitness=float(chromosome[1]) + float(chromosome[2]), user_output_log=[],
+                                          objectives=[float(chromosome[1]), float(chromosome[2])])
+            return chromosomes
+
+        evaluator = types.SimpleNamespace(evaluate_population=evaluate_objectives)
+        with self.assertRaises(ValueError):
+            self.make_function_optimiser(".", feasibility=Feasibility(check=lambda chromosome: True),
+                                         multi_objective=True, evaluator=evaluator)
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            feasibility = Feasibility(check=lambda chromosome: float(chromosome[0]) < 0,
+                                      penalty_objectives=lambda chromosome: [-10.0, -10.0 - float(chromosome[0])])
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=3, feasibility=feasibility,
+                                                     multi_objective=True, evaluator=evaluator,
+                                                     archive=RunArchive(os.path.join(log_dir, "archive")))
+            optimiser.run()
+            self.assertGreater(feasibility.penalised, 0)
+            self.assertEqual((18, 2), ArchiveReader(os.path.join(log_dir, "archive"))['objectives'].shape)
+
+    def test_run_archive(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            archive_dir = os.path.join(log_dir, "archive")
+            optimiser = self.make_function_optimiser(log_dir, num_epochs=3, archive=RunArchive(archive_dir,
+                                                                                               segment_size=5))
+            optimiser.run()
+            with open(os.path.join(log_dir, "log.csv")) as in_fs:
+                rows = [line.split(",") for line in in_fs.read().splitlines()[1:]]
+
+            reader = ArchiveReader(archive_dir)
+            self.assertEqual(18, len(reader))
+            self.assertEqual(4, len(reader.segments))
+            self.assertIsInstance(reader.segments[0]['fitness'], np.memmap)
+            self.assertEqual([int(row[0]) for row in rows], reader['epoch'].tolist())
+            self.assertEqual([row[2] for row in rows], [uuid.decode() for uuid in reader['uuid']])
+            np.testing.assert_allclose([float(row[3]) for row in rows], reader['fitness'])
+            self.assertEqual((18, 3), reader['genes'].shape)
+
+            cache = FitnessCache()
+            self.assertEqual(len(set(row[2] for row in rows)), reader.warm_start(cache))
+            self.assertEqual(float(rows[0][3]), cache.get(rows[0][2])[0])
+
+            chromosomes = [Chromosome(TestGenetics.multi_gene_chromosome_function),
+                           Chromosome(TestGenetics.for_test_program_chromosome_function)]
+            for chromosome in chromosomes:
+                chromosome.set_result(fitness=1.0, user_output_log=[])
+
+            with RunArchive(archive_dir) as archive:  # Appended to, as by a resumed run.
+                archive.append(3, chromosomes[0])
+            reader = ArchiveReader(archive_dir, mmap=False)
+            self.assertEqual(19, len(reader))
+            self.assertEqual([float(gene) for gene in chromosomes[0]], reader['genes'][-1].tolist())
+
+            with self.assertRaises(ValueError):  # A different number of genes.
+                with RunArchive(archive_dir) as archive:
+                    archive.append(4, chromosomes[1])
+
     def setUp(self):
         self.genotype_dict = {  # Create mock genotype dictionary
             'files': [
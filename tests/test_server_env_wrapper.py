@@ -0,0 +1,63 @@
+"""
+Test functionality of the server environment wrapper.
+
+The 'setUp' function starts a pool of the sample server program to be used in the unit tests.
+"""
+import unittest
+import os
+import sys
+from ripsaw.server_env_wrapper import ServerPool
+from ripsaw.genetics.genotype import Chromosome
+from tests import test_genetics
+
+
+class TestServerEnvWrapper(unittest.TestCase):
+    def test_evaluate_population(self):
+        chromosomes = [Chromosome(chromosome_function=test_genetics.TestGenetics.for_test_program_chromosome_function)
+                       for _ in range(6)]
+        chromosomes[0].fitness = 100
+
+        self.pool.evaluate_population(chromosomes)
+
+        self.assertEqual(100, chromosomes[0].fitness)
+        for chromosome in chromosomes[1:]:
+            self.assertIsInstance(chromosome.fitness, float)
+            self.assertEqual(str(float(chromosome[0])), chromosome.user_output_log[0])
+
+    def test_health_check(self):
+        for server in self.pool.servers:
+            self.assertTrue(server.healthy())
+
+    def test_restart_on_crash(self):
+        self.pool.servers[0].process.kill()
+        self.pool.servers[0].process.wait()
+
+        chromosome = Chromosome(chromosome_function=test_genetics.TestGenetics.for_test_program_chromosome_function)
+        self.pool.evaluate_chromosome(self.pool.servers[0], chromosome)
+
+        self.assertIsInstance(chromosome.fitness, float)
+        self.assertEqual(1, self.pool.servers[0].restarts)
+
+    def test_restart_on_invalid_response(self):
+        garbage = ("import sys\n"
+                   "for line in sys.stdin:\n"
+                   "    print('PONG' if line.strip() == 'PING' else 'garbage', flush=True)")
+        chromosomes = [Chromosome(chromosome_function=test_genetics.TestGenetics.for_test_program_chromosome_function)
+                       for _ in range(2)]
+
+        with ServerPool(args=[sys.executable, '-c', garbage], num_servers=1, timeout=10, max_retries=1) as pool:
+            with self.assertRaises(RuntimeError):
+                pool.evaluate_population(chromosomes)
+            self.assertEqual(2, pool.servers[0].restarts)
+
+    def setUp(self):
+        program = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'sample_program_template', 'server_optimisation_program.py')
+        self.pool = ServerPool(args=[sys.executable, program], num_servers=2, timeout=10)
+
+    def tearDown(self):
+        self.pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Test functionality of the shared memory environment wrapper.
+
+The 'setUp' function starts an evaluator with a pool of two workers to be used in the unit tests.
+"""
+import unittest
+import numpy as np
+from ripsaw.shared_env_wrapper import SharedMemoryEvaluator
+from ripsaw.genetics.genotype import Chromosome
+from ripsaw.util.shared import SharedArray
+from tests import test_genetics
+
+
+def sum_of_squares(genes):
+    return float(np.sum(genes ** 2))
+
+
+def sums_of_squares(genes):
+    return np.sum(genes ** 2, axis=1)
+
+
+class TestSharedEnvWrapper(unittest.TestCase):
+    @staticmethod
+    def make_chromosomes(number):
+        return [Chromosome(chromosome_function=test_genetics.TestGenetics.multi_gene_chromosome_function)
+                for _ in range(number)]
+
+    def test_evaluate_population(self):
+        chromosomes = self.make_chromosomes(20)
+        chromosomes[0].fitness = 100
+
+        self.evaluator.evaluate_population(chromosomes)
+
+        self.assertEqual(100, chromosomes[0].fitness)
+        for chromosome in chromosomes[1:]:
+            self.assertAlmostEqual(sum(float(gene) ** 2 for gene in chromosome.full_genotype), chromosome.fitness)
+
+    def test_arrays_grow_with_population(self):
+        self.evaluator.evaluate_population(self.make_chromosomes(4))
+        name = self.evaluator.genes.spec[0]
+        self.evaluator.evaluate_population(self.make_chromosomes(3))
+        self.assertEqual(name, self.evaluator.genes.spec[0])
+
+        chromosomes = self.make_chromosomes(30)
+        self.evaluator.evaluate_population(chromosomes)
+        self.assertNotEqual(name, self.evaluator.genes.spec[0])
+        self.assertAlmostEqual(sum(float(gene) ** 2 for gene in chromosomes[-1].full_genotype),
+                               chromosomes[-1].fitness)
+
+    def test_vectorised_in_process(self):
+        with SharedMemoryEvaluator(sums_of_squares, num_workers=0, vectorised=True) as evaluator:
+            chromosomes = self.make_chromosomes(5)
+            evaluator.evaluate_population(chromosomes)
+        self.assertAlmostEqual(sum(float(gene) ** 2 for gene in chromosomes[2].full_genotype), chromosomes[2].fitness)
+        self.assertIsNone(evaluator.genes)
+
+    def test_shared_array_attach(self):
+        shared = SharedArray((2, 3))
+        other = SharedArray.attach(shared.spec)
+        other.array[1, 2] = 7.5
+        self.assertEqual(7.5, shared.array[1, 2])
+        other.close()
+        shared.close()
+
+    def test_ragged_genotypes(self):
+        chromosomes = self.make_chromosomes(2)
+        chromosomes.append(Chromosome(chromosome_function=lambda chromosome: test_genetics.TestGenetics.
+                                      multi_gene_chromosome_function(chromosome, num_chromo=2)))
+        with self.assertRaises(ValueError):
+            self.evaluator.evaluate_population(chromosomes)
+
+    def setUp(self):
+        self.evaluator = SharedMemoryEvaluator(sum_of_squares, num_workers=2)
+
+    def tearDown(self):
+        self.evaluator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Test functionality of the spool environment wrapper.
+
+The 'setUp' function creates a spool and set up chromosomes to be used in the unit tests.
+"""
+import unittest
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
+from ripsaw.spool_env_wrapper import SpoolEvaluator, SpoolWorker, write_atomic, CLAIMED, PENDING, RESULTS
+from ripsaw.genetics.genotype import Chromosome
+from tests import test_genetics
+from tests import test_env_wrapper
+
+
+@unittest.skipIf(os.name == "nt", "The sample program used is only supplied as a shell script.")
+class TestSpoolEnvWrapper(unittest.TestCase):
+    def test_local_worker_processes(self):
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=package_dir)
+        workers = [subprocess.Popen([sys.executable, '-m', 'ripsaw.spool_env_wrapper', self.spool_dir,
+                                     '--poll-interval', '0.05', '--idle-timeout', '2'], env=env)
+                   for _ in range(2)]
+        try:
+            SpoolEvaluator(self.spool_dir, poll_interval=0.05, timeout=60).evaluate_population(self.chromosomes)
+        finally:
+            for worker in workers:
+                worker.wait(timeout=30)
+
+        for chromosome in self.chromosomes:
+            self.assertIsInstance(chromosome.fitness, float)
+            self.assertEqual(chromosome.fitness, chromosome.get_log_row()[2])
+
+    def test_expired_lease_requeued(self):
+        evaluator = SpoolEvaluator(self.spool_dir, lease_time=5)
+        task_id = evaluator.submit(self.chromosomes[0])
+        worker = SpoolWorker(self.spool_dir)
+        self.assertEqual(task_id, worker.claim())
+
+        claimed_path = worker.claimed_path(task_id)
+        evaluator.requeue_expired()
+        self.assertTrue(os.path.exists(claimed_path))
+
+        stale_time = time.time() - 10
+        os.utime(claimed_path, (stale_time, stale_time))
+        evaluator.requeue_expired()
+        self.assertTrue(os.path.exists(os.path.join(self.spool_dir, PENDING, task_id + '.task')))
+
+        self.assertEqual(1, worker.run(max_tasks=1))
+        outstanding = {task_id: self.chromosomes[0]}
+        evaluator.collect(outstanding)
+        self.assertEqual({}, outstanding)
+        self.assertIsInstance(self.chromosomes[0].fitness, float)
+
+    def test_expired_worker_keeps_others_claim(self):
+        evaluator = SpoolEvaluator(self.spool_dir, lease_time=5)
+        task_id = evaluator.submit(self.chromosomes[0])
+        expired_worker, worker = SpoolWorker(self.spool_dir), SpoolWorker(self.spool_dir)
+        self.assertEqual(task_id, expired_worker.claim())
+
+        stale_time = time.time() - 10
+        os.utime(expired_worker.claimed_path(task_id), (stale_time, stale_time))
+        evaluator.requeue_expired()
+        self.assertEqual(task_id, worker.claim())
+
+        # The expired worker finishing late must not remove the claim of the worker now running the task.
+        expired_worker.release(task_id)
+        self.assertEqual([os.path.basename(worker.claimed_path(task_id))],
+                         os.listdir(os.path.join(self.spool_dir, CLAIMED)))
+
+    def test_collect_removes_stale_results(self):
+        evaluator = SpoolEvaluator(self.spool_dir)
+        other_evaluator = SpoolEvaluator(self.spool_dir)
+        results = os.path.join(self.spool_dir, RESULTS)
+        own_id, other_id = evaluator.submit(self.chromosomes[0]), other_evaluator.submit(self.chromosomes[1])
+        for task_id in (own_id, other_id):
+            write_atomic(os.path.join(results, task_id + '.result'), {'worker': 'test', 'fitness': 1.0})
+
+        # Neither is outstanding: the first is a duplicate of a task already collected, the second another's.
+        evaluator.collect(dict())
+        self.assertEqual([other_id + '.result'], os.listdir(results))
+
+    def test_collect_error_cancels_outstanding(self):
+        evaluator = SpoolEvaluator(self.spool_dir)
+        outstanding = {evaluator.submit(chromosome): chromosome for chromosome in self.chromosomes}
+        failed_id = next(iter(outstanding))
+        write_atomic(os.path.join(self.spool_dir, RESULTS, failed_id + '.result'), {'worker': 'test', 'error': 'x'})
+
+        with self.assertRaises(RuntimeError):
+            evaluator.collect(outstanding)
+        self.assertEqual({}, outstanding)
+        for folder in (PENDING, CLAIMED, RESULTS):
+            self.assertEqual([], os.listdir(os.path.join(self.spool_dir, folder)))
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        target_dir_path = os.path.dirname(os.path.abspath(__file__))
+        self.chromosomes = list()
+        for _ in range(6):
+            chromosome = Chromosome(chromosome_function=test_genetics.TestGenetics.for_test_program_chromosome_function)
+            # The batch program scores a batch of one the same way as the sample program.
+            chromosome.setup("sample_program_template",
+                             os.path.join('sample_program_template', 'run_batch_program.sh'), target_dir_path,
+                             os.path.join('sample_program_template', 'input.txt'), '<region1>\n',
+                             test_env_wrapper.TestEnvWrapper.get_output_score_func,
+                             os.path.join('sample_program_template', 'output.txt'),
+                             test_genetics.TestGenetics.get_output_log,
+                             os.path.join('sample_program_template', 'output.txt'),
+                             optimiser_dict={"epoch_num": 0})
+            self.chromosomes.append(chromosome)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
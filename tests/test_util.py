@@ -0,0 +1,387 @@
+"""
+Test functionality of the utilities such as the launcher, scheduler and workspace cleaner.
+
+The 'setUp' function creates a working folder to be used in the unit tests.
+"""
+import unittest
+import os
+import pickle
+import sys
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+from ripsaw.util.launcher import Launcher, CancellableLauncher
+from ripsaw.util.scheduler import ResourceScheduler
+from ripsaw.util.cleanup import WorkspaceCleaner
+from ripsaw.util.file import WORKSPACE_MARKER, clone_directory_uuid
+from ripsaw.util.usage import ProcessUsage, summarise_usage
+from ripsaw.util.extract import FieldExtractor, MmapSearch, TailSearch, tail_lines
+from ripsaw.util.affinity import CorePlacement, core_sets, parse_cpu_list
+from ripsaw.util.stages import StageCache, stage
+from ripsaw.local_env_wrapper import LocalEnvWrapper
+
+
+class CountingTask:
+    """ A stand in for a chromosome, which records how many tasks are evaluating alongside it."""
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.fitness = None
+
+    def evaluate(self):
+        with CountingTask.lock:
+            CountingTask.active += 1
+            CountingTask.peak = max(CountingTask.peak, CountingTask.active)
+        time.sleep(0.01)
+        with CountingTask.lock:
+            CountingTask.active -= 1
+        if self.fail:
+            raise RuntimeError("Task failed")
+        self.fitness = 1
+
+
+class TestUtil(unittest.TestCase):
+    def launch_writer(self, launcher):
+        """ Launch a program which writes its working directory and an environment variable into a file."""
+        script = "import os; open('launched.txt', 'w').write(os.getcwd() + ',' + os.environ['RIPSAW_TEST'])"
+        return launcher.run([sys.executable, '-c', script], cwd=self.folder, suppress_output=True)
+
+    def check_launched(self):
+        with open(os.path.join(self.folder, 'launched.txt'), 'r') as in_fs:
+            self.assertEqual(os.path.realpath(self.folder) + ',launched', in_fs.read())
+
+    @unittest.skipIf(not hasattr(os, 'posix_spawnp'), "posix_spawn is not available on this platform.")
+    def test_launcher_posix_spawn(self):
+        launcher = Launcher(env=dict(os.environ, RIPSAW_TEST='launched'), use_posix_spawn=True)
+
+        self.assertEqual(0, self.launch_writer(launcher))
+        self.check_launched()
+        self.assertEqual(3, launcher.run([sys.executable, '-c', 'exit(3)'], cwd=self.folder))
+
+    def test_launcher_popen(self):
+        launcher = Launcher(env=dict(os.environ, RIPSAW_TEST='launched'), use_posix_spawn=False)
+
+        self.assertEqual(0, self.launch_writer(launcher))
+        self.check_launched()
+
+    @unittest.skipUnless(hasattr(os, 'wait4'), "Resource usage is only measured where os.wait4 is available.")
+    def test_launcher_usage(self):
+        script = "import sys; data = bytearray(64 * 1024 * 1024); sum(range(10 ** 6)); sys.exit(2)"
+        for use_posix_spawn in [False, hasattr(os, 'posix_spawnp')]:
+            usage = Launcher(use_posix_spawn=use_posix_spawn).run_measured([sys.executable, '-c', script],
+                                                                           cwd=self.folder)
+            self.assertEqual(2, usage.exit_code)
+            self.assertGreater(usage.max_rss, 64 * 1024 * 1024)
+            self.assertGreater(usage.cpu_time(), 0)
+            self.assertGreaterEqual(usage.wall_time, usage.user_time)
+
+    def test_usage_summary(self):
+        usages = [ProcessUsage(1.0, 0.5, 0.1, 100, 1, 2, 0), ProcessUsage(3.0, 1.5, 0.1, 300, 0, 0, 1),
+                  ProcessUsage(2.0, exit_code=0)]
+        combined = ProcessUsage.combine(usages)
+        self.assertEqual([6.0, 2.0, 0.2, 300, 1, 2, 1], combined.as_row())
+        self.assertEqual([2.0, "", "", "", "", "", 0], usages[2].as_row())
+
+        summary = summarise_usage(usages + [None])
+        self.assertEqual(3, summary['evaluations'])
+        self.assertAlmostEqual(2.0, summary['mean_wall_time'])
+        self.assertAlmostEqual(1.1, summary['mean_cpu_time'])
+        self.assertEqual(300, summary['max_max_rss'])
+        self.assertEqual((3, 1), (summary['block_operations'], summary['failures']))
+        self.assertIsNone(summarise_usage([None]))
+
+        scheduler = ResourceScheduler(total_cores=1, learn_memory=True)
+        scheduler.record_usage(summary)
+        self.assertEqual(300, scheduler.memory_per_evaluation)
+
+    def test_launcher_missing_program(self):
+        for use_posix_spawn in [False, hasattr(os, 'posix_spawnp')]:
+            launcher = Launcher(use_posix_spawn=use_posix_spawn)
+            with self.assertRaises(FileNotFoundError):
+                launcher.run(os.path.join(self.folder, 'missing_program'), cwd=self.folder)
+
+    def test_scheduler_core_capacity(self):
+        CountingTask.peak = 0
+        scheduler = ResourceScheduler(cores_per_evaluation=2, total_cores=8)
+        tasks = scheduler.run([CountingTask() for _ in range(20)])
+
+        self.assertEqual(4, scheduler.max_concurrency)
+        self.assertTrue(all(task.fitness == 1 for task in tasks))
+        self.assertTrue(1 < CountingTask.peak <= 4)
+
+    @patch('ripsaw.util.scheduler.available_memory', return_value=3 * 1024 ** 3)
+    def test_scheduler_memory_capacity(self, _):
+        CountingTask.peak = 0
+        scheduler = ResourceScheduler(memory_per_evaluation=1024 ** 3, total_cores=8)
+        scheduler.run([CountingTask() for _ in range(20)])
+
+        self.assertTrue(CountingTask.peak <= 3)
+
+    @patch('ripsaw.util.scheduler.load_average', return_value=100.0)
+    def test_scheduler_backs_off_under_load(self, _):
+        scheduler = ResourceScheduler(total_cores=8, adjust_interval=0)
+        scheduler.run([CountingTask() for _ in range(5)])
+
+        self.assertEqual(1, scheduler.concurrency)
+
+    def test_scheduler_raises_task_errors(self):
+        scheduler = ResourceScheduler(total_cores=2)
+        with self.assertRaises(RuntimeError):
+            scheduler.run([CountingTask(), CountingTask(fail=True), CountingTask()])
+        self.assertEqual(0, scheduler.running)
+
+    def test_scheduler_fair_share(self):
+        scheduler = ResourceScheduler(total_cores=1)
+        scheduler.running_by_client.update({'a': 2, 'b': 0})
+        scheduler.waiting = [(0, 'a'), (1, 'a'), (2, 'b'), (3, 'b')]
+        self.assertEqual(2, scheduler.next_ticket_due())
+
+        scheduler.running_by_client['b'] = 2
+        self.assertEqual(0, scheduler.next_ticket_due())
+
+        order = list()
+        scheduler = ResourceScheduler(total_cores=1)
+        tasks = {client: [CountingTask() for _ in range(4)] for client in ('a', 'b')}
+        for client, client_tasks in tasks.items():
+            for task in client_tasks:
+                task.evaluate = lambda client=client: (order.append(client), time.sleep(0.02))
+        threads = [threading.Thread(target=scheduler.run, args=(client_tasks,), kwargs={'client': client})
+                   for client, client_tasks in tasks.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8, len(order))
+        self.assertIn('b', order[:3])  # Not queued behind every one of the first client's tasks.
+        self.assertEqual(0, scheduler.running)
+        self.assertEqual({}, dict(scheduler.running_by_client))
+
+    def test_launcher_cancel(self):
+        launcher = CancellableLauncher()
+        usages = list()
+        thread = threading.Thread(target=lambda: usages.append(launcher.run_measured(['sleep', '10'], cwd=self.folder)))
+        start = time.time()
+        thread.start()
+        while not launcher.children:
+            time.sleep(0.01)
+        launcher.cancel()
+        thread.join()
+        self.assertLess(time.time() - start, 5)
+        self.assertLess(usages[0].exit_code, 0)
+        self.assertEqual(set(), launcher.children)
+
+    def test_scheduler_speculative_preemption(self):
+        scheduler = ResourceScheduler(total_cores=1)
+        self.assertTrue(scheduler.try_admit_speculative())
+        self.assertFalse(scheduler.try_admit_speculative(timeout=0.02))
+
+        # Real work waiting for the speculative evaluation's capacity preempts it.
+        preempted = list()
+
+        def preempt():
+            if not preempted:
+                preempted.append(True)
+                threading.Timer(0.02, scheduler.release_speculative).start()
+
+        scheduler.preemptors.append(preempt)
+        task = CountingTask()
+        scheduler.run([task])
+        self.assertEqual(1, task.fitness)
+        self.assertEqual((0, 0), (scheduler.running, scheduler.speculative))
+
+    def test_core_sets(self):
+        self.assertEqual([0, 1, 2, 3, 8, 10, 11], parse_cpu_list("0-3,8,10-11\n"))
+        nodes = [[0, 1, 2, 3, 4], [5, 6, 7, 8]]
+        self.assertEqual([[0, 1], [5, 6], [2, 3], [7, 8]], core_sets(2, nodes))
+        self.assertEqual([[0, 1, 2, 3, 4, 5], [6, 7, 8]], core_sets(6, nodes))
+
+    def test_core_placement(self):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else [0]
+        placement = CorePlacement(cores_per_slot=1, nodes=[cpus[-1:]])
+        script = "import os, sys; sys.exit(int(os.environ['OMP_NUM_THREADS']) * 10 + " + \
+                 ("len(os.sched_getaffinity(0)))" if hasattr(os, 'sched_getaffinity') else "1)")
+        self.assertEqual(11, placement.run_measured([sys.executable, '-c', script], cwd=self.folder).exit_code)
+        self.assertEqual([0], placement.in_use)
+        if hasattr(os, 'sched_getaffinity'):
+            self.assertEqual(set(cpus), os.sched_getaffinity(0))  # The launching thread is restored.
+
+        slot, env, pin = placement.reserve()
+        self.assertEqual(([1], '1'), (placement.in_use, env['OMP_NUM_THREADS']))
+        placement.unreserve(slot)
+        self.assertEqual([0], placement.in_use)
+
+        copy = pickle.loads(pickle.dumps(placement))
+        self.assertEqual(placement.slots, copy.slots)
+        self.assertEqual(0, copy.acquire())
+
+    def make_workspace(self, name, size=10):
+        workspace = os.path.join(self.folder, name)
+        os.makedirs(workspace)
+        with open(os.path.join(workspace, 'output.txt'), 'w') as out_fs:
+            out_fs.write("x" * size)
+        return workspace
+
+    def test_cleaner_retention(self):
+        cleaner = WorkspaceCleaner(retain_recent=2, retain_failed=1)
+        workspaces = [self.make_workspace("ok" + str(i)) for i in range(4)]
+        failures = [self.make_workspace("failed" + str(i)) for i in range(2)]
+
+        for workspace in workspaces:
+            cleaner.submit(workspace)
+        for workspace in failures:
+            cleaner.submit(workspace, failed=True)
+        cleaner.close()
+
+        self.assertEqual([False, False, True, True], [os.path.exists(workspace) for workspace in workspaces])
+        self.assertEqual([False, True], [os.path.exists(workspace) for workspace in failures])
+
+    def test_cleaner_pending_limit(self):
+        cleaner = WorkspaceCleaner(max_pending_bytes=25, batch_size=1)
+        workspaces = [self.make_workspace("ws" + str(i)) for i in range(10)]
+
+        for workspace in workspaces:
+            cleaner.submit(workspace)
+            self.assertTrue(cleaner.pending_bytes <= 25)
+        cleaner.flush()
+
+        self.assertFalse(any(os.path.exists(workspace) for workspace in workspaces))
+        self.assertEqual(0, cleaner.pending_bytes)
+        cleaner.close()
+
+    def mark_workspace(self, workspace, pid, age):
+        marker = os.path.join(workspace, WORKSPACE_MARKER)
+        with open(marker, 'w') as out_fs:
+            out_fs.write(socket.gethostname() + " " + str(pid))
+        os.utime(marker, (time.time() - age, time.time() - age))
+
+    def test_cleaner_sweep_orphans(self):
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        orphan = self.make_workspace("3f2b5d1c-9e4a-4c1b-8d2e-6a7b8c9d0e1f")
+        self.mark_workspace(orphan, finished.pid, age=7200)
+        recent = self.make_workspace("4f2b5d1c-9e4a-4c1b-8d2e-6a7b8c9d0e1f")
+        self.mark_workspace(recent, finished.pid, age=0)
+        running = self.make_workspace("5f2b5d1c-9e4a-4c1b-8d2e-6a7b8c9d0e1f")
+        self.mark_workspace(running, os.getpid(), age=7200)
+        other = self.make_workspace("template")
+        stale_time = time.time() - 7200
+        os.utime(other, (stale_time, stale_time))
+        clone = clone_directory_uuid(other)  # Just cloned, though copytree gives it the template's old times.
+
+        cleaner = WorkspaceCleaner()
+        self.assertEqual(1, cleaner.sweep_orphans(self.folder, min_age=3600))
+        cleaner.close()
+
+        self.assertEqual([False, True, True, True, True],
+                         [os.path.exists(workspace) for workspace in (orphan, recent, running, other, clone)])
+
+    def write_trace(self, name, num_lines=5000):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as out_fs:
+            out_fs.write("Result 1.5\nSpeed 20\n")
+            for i in range(num_lines):
+                out_fs.write("step " + str(i) + " state " + "x" * 50 + "\n")
+            out_fs.write("Speed 30\nResult 2.25\nEnd\n")
+        return path
+
+    def test_tail_search(self):
+        path = self.write_trace('trace.txt')
+        self.assertEqual(2.25, TailSearch(r'^Result (\S+)')(path))
+        self.assertEqual(["Result 2.25", "End"], tail_lines(path, num_lines=2, block_size=7))
+        self.assertEqual(2.25, TailSearch(r'^Result (\S+)', block_size=5)(path))
+        self.assertEqual(-1, TailSearch(r'^Missing (\S+)', max_bytes=1000, default=-1)(path))
+        with self.assertRaises(ValueError):
+            TailSearch(r'^Missing (\S+)')(path)
+
+    def test_mmap_search(self):
+        path = self.write_trace('trace.txt')
+        self.assertEqual(1.5, MmapSearch(r'^Result (\S+)')(path))
+        self.assertEqual(2.25, MmapSearch(r'^Result (\S+)', last=True)(path))
+        self.assertEqual('30', MmapSearch(r'^Speed (\S+)', convert=str, tail_bytes=100)(path))
+
+        empty_path = os.path.join(self.folder, 'empty.txt')
+        open(empty_path, 'w').close()
+        self.assertEqual(0, MmapSearch(r'^Result (\S+)', default=0)(empty_path))
+
+    def test_field_extractor(self):
+        path = self.write_trace('trace.txt')
+        self.assertEqual([1.5, 20.0], FieldExtractor([r'^Result (\S+)', r'^Speed (\d+)'])(path))
+        self.assertEqual([2.25, '30'], FieldExtractor([r'^Result (\S+)', r'^Speed (\d+)'], convert=[float, str],
+                                                      last=True)(path))
+        self.assertEqual([2.25, -1], FieldExtractor([r'^Result (\S+)', r'^Missing (\S+)'], tail_bytes=200,
+                                                    default=-1)(path))
+        with self.assertRaises(ValueError):
+            FieldExtractor([r'^Result (\S+)', r'^Missing (\S+)'])(path)
+
+        # Fields matching at the same position, and fields with lookaround, get the values they would alone.
+        overlap_path = os.path.join(self.folder, 'overlap.txt')
+        with open(overlap_path, 'w') as out_fs:
+            out_fs.write("Header\nScore: 1.5 time 3\nScore: 2.5 time 4\n")
+        patterns = [r'^Score: (\S+)', r'^Score: \S+ time (\S+)']
+        self.assertEqual([1.5, 3.0], FieldExtractor(patterns)(overlap_path))
+        self.assertEqual([2.5, 4.0], FieldExtractor(patterns, last=True)(overlap_path))
+        self.assertEqual(3.0, MmapSearch(patterns[1])(overlap_path))
+        self.assertEqual([1.5, 3.0], FieldExtractor([r'Score: (\S+)(?= time)', r'time (\S+)$'])(overlap_path))
+
+    def write_script(self, path, text):
+        with open(path, 'w') as out_fs:
+            out_fs.write("#!/bin/sh\n" + text + "\n")
+        os.chmod(path, 0o755)
+
+    def run_pipeline(self, template, cache, terrain, params):
+        """ Run a preprocessor then a simulation stage in a workspace, returning its result and exit codes."""
+        wrapper = LocalEnvWrapper(folder=template)
+        try:
+            for filename, text in (('terrain.inp', terrain), ('params.inp', params)):
+                with open(os.path.join(wrapper.folder, filename), 'w') as out_fs:
+                    out_fs.write(text + "\n")
+            exit_codes = wrapper.execute({'files': [
+                stage('pre.sh', '.', inputs=['terrain.inp'], outputs=['terrain.out'], cache=cache),
+                stage('sim.sh', '.', inputs=['terrain.out', 'params.inp'], outputs=['result.txt'])]})
+            with open(os.path.join(wrapper.folder, 'result.txt'), 'r') as in_fs:
+                return in_fs.read(), exit_codes, len(wrapper.usages)
+        finally:
+            wrapper.close()
+
+    def test_stage_cache(self):
+        template = os.path.join(self.folder, 'template')
+        os.makedirs(template)
+        runs = os.path.join(self.folder, 'pre_runs.txt')
+        self.write_script(os.path.join(template, 'pre.sh'), "echo run >> " + runs + "; cat terrain.inp > terrain.out")
+        self.write_script(os.path.join(template, 'sim.sh'), "cat terrain.out params.inp > result.txt")
+        cache = StageCache(os.path.join(self.folder, 'cache'))
+
+        self.assertEqual(("a\n1\n", [0, 0], 2), self.run_pipeline(template, cache, "a", "1"))
+        self.assertEqual(("a\n2\n", [0, 0], 1), self.run_pipeline(template, cache, "a", "2"))  # Preprocessing reused.
+        self.assertEqual(("b\n2\n", [0, 0], 2), self.run_pipeline(template, cache, "b", "2"))
+        with open(runs, 'r') as in_fs:
+            self.assertEqual(2, len(in_fs.readlines()))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.assertEqual(2, len(os.listdir(cache.directory)))
+
+        # A changed program has a new key, and a failed stage isn't cached.
+        self.write_script(os.path.join(template, 'pre.sh'), "exit 3")
+        wrapper = LocalEnvWrapper(folder=template)
+        try:
+            self.assertEqual([3], wrapper.execute({'files': [stage('pre.sh', '.', inputs=['terrain.inp'],
+                                                                   outputs=['terrain.out'], cache=cache)]}))
+        finally:
+            wrapper.close()
+        self.assertEqual(2, len(os.listdir(cache.directory)))
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+if __name__ == '__main__':
+    unittest.main()